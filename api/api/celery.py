@@ -2,10 +2,14 @@ import logging
 import pprint
 
 import django.utils.log
+import prometheus_client
 from celery import Celery
-from celery.signals import task_failure
+from celery.signals import task_failure, worker_init
+from django.conf import settings
 
-app = Celery("api", include="desecapi.mail_backends")
+app = Celery(
+    "api", include=["desecapi.mail_backends", "desecapi.axfr", "desecapi.outbox"]
+)
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
 
@@ -49,6 +53,13 @@ def task_failure(task_id, exception, args, kwargs, traceback, einfo, **other_kwa
     )
 
 
+@worker_init.connect()
+def worker_init(**kwargs):
+    # Only meaningful for the thread pool; forked pool processes would not share their metrics with this process
+    if settings.TASK_METRICS_PORT:
+        prometheus_client.start_http_server(int(settings.TASK_METRICS_PORT))
+
+
 django.setup()
 logger = logging.getLogger(__name__)
 handler = django.utils.log.AdminEmailHandler()
@@ -174,6 +174,13 @@ DEFAULT_NS_TTL = int(os.environ["DESECSTACK_NSLORD_DEFAULT_TTL"])
 # Public Suffix settings
 PSL_RESOLVER = os.environ.get("DESECSTACK_API_PSL_RESOLVER")
 LOCAL_PUBLIC_SUFFIXES = {"dedyn.%s" % os.environ["DESECSTACK_DOMAIN"]}
+# Snapshot of the list, compiled into an in-process lookup structure (see desecapi.psl). Updated by `manage.py
+# update-psl`; workers check it for changes every PSL_REFRESH_INTERVAL seconds. Without snapshot, the PSL is queried
+# via DNS (PSL_RESOLVER). With PSL_VERIFY, DNS results are queried in addition to verify local results.
+PSL_URL = "https://publicsuffix.org/list/public_suffix_list.dat"
+PSL_SNAPSHOT = "/var/local/psl/public_suffix_list.dat"
+PSL_REFRESH_INTERVAL = 300
+PSL_VERIFY = False
 
 # PowerDNS-related
 NSLORD_PDNS_API = "http://nslord:8081/api/v1/servers/localhost"
@@ -182,6 +189,18 @@ NSMASTER_PDNS_API = "http://nsmaster:8081/api/v1/servers/localhost"
 NSMASTER_PDNS_API_TOKEN = os.environ["DESECSTACK_NSMASTER_APIKEY"]
 CATALOG_ZONE = "catalog.internal"
 
+# Number of independent backend API requests (e.g., nslord and nsmaster zone creation) that run concurrently
+BACKEND_API_CONCURRENCY = 8
+# Backend API connections (pools are per process, i.e. per uwsgi worker). Pools should hold a connection for each
+# concurrent request, so that connections are kept alive.
+NSLORD_PDNS_API_POOL_SIZE = BACKEND_API_CONCURRENCY
+NSMASTER_PDNS_API_POOL_SIZE = BACKEND_API_CONCURRENCY
+PCH_API_POOL_SIZE = BACKEND_API_CONCURRENCY
+BACKEND_API_TIMEOUT = (
+    3.05,
+    300,
+)  # (connect, read) in seconds; large zones take a while
+
 # Celery
 # see https://docs.celeryproject.org/en/stable/history/whatsnew-4.0.html#latentcall-django-admonition
 CELERY_BROKER_URL = "amqp://rabbitmq"
@@ -195,11 +214,48 @@ TASK_CONFIG = {  # The first entry is the default queue
     "email_slow_lane": {"rate_limit": "3/m"},
     "email_fast_lane": {"rate_limit": "1/s"},
     "email_immediate_lane": {"rate_limit": None},
+    "axfr_lane": {"rate_limit": None},
+    "pdns_lane": {"rate_limit": None},
 }
 
+# If enabled, RRset changes are committed to an outbox table and sent to nslord in the background, unless the client
+# asks to wait for completion (Prefer: wait). Otherwise, they are sent to nslord before the database commit.
+PDNS_PROPAGATION_ASYNC = False
+PDNS_OUTBOX_STALE_PERIOD = timedelta(minutes=10)
+
+# Zone transfers to nsmaster are deferred by this many seconds, and requests for the same zone arriving in the
+# meantime are coalesced into one transfer (None: transfer synchronously)
+AXFR_COALESCE_WINDOW = 2
+# Secondaries poll the serial index for zones changed since a given time; to make up for transactions that commit out
+# of order, changes from a little earlier are included. Deleted zones are reported for the given retention period.
+SERIAL_INDEX_DELTA_OVERLAP = timedelta(seconds=30)
+SERIAL_INDEX_TOMBSTONE_RETENTION = timedelta(days=7)
+# The Celery worker process serves its metrics on this port (if set)
+TASK_METRICS_PORT = os.environ.get("DESECSTACK_API_TASK_METRICS_PORT")
+
 # pdns accepts request payloads of this size.
 # This will hopefully soon be configurable: https://github.com/PowerDNS/pdns/pull/7550
 PDNS_MAX_BODY_SIZE = 16 * 1024 * 1024
+# Catalog zone entries per PATCH request (about 250 bytes each)
+PDNS_CATALOG_CHUNK_SIZE = 10000
+
+# DNSSEC key information of domains is cached for this many seconds (invalidated when the DNSKEY RRset changes)
+DOMAIN_KEYS_CACHE_TIMEOUT = 3600
+# Zones without keys are not ready yet, so that the (empty) result is only cached briefly
+DOMAIN_KEYS_EMPTY_CACHE_TIMEOUT = 10
+
+# Canonical formats of record contents (and validation errors) are memoized in a per-process LRU cache of this many
+# entries, for contents up to the given length. If the timeout is positive, the shared cache is consulted on local
+# misses, and outcomes are kept there for that many seconds.
+RR_CANONICAL_CACHE_SIZE = 10000
+RR_CANONICAL_CACHE_MAX_LENGTH = 2048
+RR_CANONICAL_CACHE_TIMEOUT = 0
+
+# Zonefile exports are relayed to the client in chunks of this many bytes. Exports up to the given size are cached
+# for the given number of seconds (0: no caching), keyed by the zone's serial. (memcached stores up to 1 MB per item.)
+ZONEFILE_EXPORT_CHUNK_SIZE = 64 * 1024
+ZONEFILE_EXPORT_CACHE_TIMEOUT = 3600
+ZONEFILE_EXPORT_CACHE_MAX_SIZE = 1000 * 1000
 
 # SEPA direct debit settings
 SEPA = {
@@ -232,6 +288,7 @@ WATCHDOG_SECONDARIES = os.environ.get("DESECSTACK_WATCHDOG_SECONDARIES", "").spl
 # PCH
 PCH_API = os.environ.get("DESECSTACK_API_PCH_API", "")
 PCH_API_TOKEN = os.environ.get("DESECSTACK_API_PCH_API_TOKEN", "")
+PCH_API_CHUNK_SIZE = 1000  # zones per request
 
 # Prometheus (see https://github.com/korfuri/django-prometheus/blob/master/documentation/exports.md)
 #  TODO Switch to PROMETHEUS_METRICS_EXPORT_PORT_RANGE instead of this workaround, which currently necessary to due
@@ -256,3 +313,4 @@ if os.environ.get("DESECSTACK_E2E_TEST", "").upper() == "TRUE":
     USER_ACTIVATION_REQUIRED = False
     EMAIL_BACKEND = "django.core.mail.backends.dummy.EmailBackend"
     REST_FRAMEWORK["DEFAULT_THROTTLE_CLASSES"] = []
+    AXFR_COALESCE_WINDOW = None  # tests expect changes to arrive at nsmaster right away
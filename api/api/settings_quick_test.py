@@ -33,7 +33,14 @@ REST_FRAMEWORK["DEFAULT_THROTTLE_CLASSES"] = [
 ]
 REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"] = {"user": "1000/s"}
 
+# Run zone transfer tasks right away (email is not affected, as the test runner replaces the email backend)
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_TASK_EAGER_PROPAGATES = True
+
 # Carry email backend connection over to test mail outbox
 CELERY_EMAIL_MESSAGE_EXTRA_ATTRIBUTES = ["connection"]
 
 PCH_API = "http://api.invalid"
+
+# Keep backend API requests in a deterministic order (as checked by most tests)
+BACKEND_API_CONCURRENCY = 1
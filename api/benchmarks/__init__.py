@@ -0,0 +1,8 @@
+"""
+Benchmarks that measure wall-clock time, and therefore are not part of the test suite. Module names do not match the
+test discovery pattern, so they only run when given explicitly, e.g.:
+
+    python manage.py test benchmarks.change_tracker
+
+Results are printed; there are no assertions on timing.
+"""
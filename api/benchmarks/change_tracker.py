@@ -0,0 +1,46 @@
+import time
+from unittest import mock
+
+from django.test import override_settings
+
+from desecapi.models import Domain
+from desecapi.pdns_change_tracker import PDNSChangeTracker
+from desecapi.tests.base import DesecTestCase
+
+
+class DomainCreationLatencyBenchmark(DesecTestCase):
+    """
+    Compares end-to-end domain creation latency with sequential and with concurrent pdns requests, against pdns and
+    PCH stubs that take DELAY seconds per request.
+    """
+
+    DELAY = 0.05
+    DOMAINS = 3
+
+    def setUp(self):
+        super().setUp()
+
+        def request(*args, **kwargs):
+            time.sleep(self.DELAY)
+            return mock.Mock(**{"json.return_value": {"edited_serial": 1}})
+
+        for patcher in [
+            mock.patch("desecapi.pdns._pdns_request", request),
+            mock.patch("desecapi.pch._pch_request", request),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_create_latency(self):
+        for concurrency in [1, 8]:
+            names = [self.random_domain_name() for _ in range(self.DOMAINS)]
+            with override_settings(BACKEND_API_CONCURRENCY=concurrency):
+                start = time.monotonic()
+                with PDNSChangeTracker():
+                    for name in names:
+                        Domain.objects.create(name=name, owner=self.user)
+                latency = time.monotonic() - start
+            print(
+                f"\n{self.DOMAINS} domains, concurrency {concurrency}: {latency:.3f}s "
+                f"({latency / self.DELAY:.1f} request delays)"
+            )
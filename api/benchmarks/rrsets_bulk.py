@@ -0,0 +1,40 @@
+import time
+from unittest import mock
+
+from desecapi.serializers import RRsetSerializer
+from desecapi.tests.base import AuthenticatedRRSetBaseTestCase
+
+
+class BulkValidationBenchmark(AuthenticatedRRSetBaseTestCase):
+    """
+    Measures conflict detection in the list serializer for payloads of 10k, 50k, and 100k RRsets (with the validation
+    of individual RRsets stubbed out). The time per RRset should not grow with payload size.
+    """
+
+    TYPES = ["A", "AAAA", "CNAME", "MX", "NS", "TXT", "CAA", "SRV"]
+
+    def test_bulk_validation_scaling(self):
+        for n in [10_000, 50_000, 100_000]:
+            data = [
+                {
+                    "subname": str(i // len(self.TYPES)),
+                    "type": self.TYPES[i % len(self.TYPES)],
+                    "ttl": 3600,
+                    "records": ["x"],
+                }
+                for i in range(n)
+            ]
+            serializer = RRsetSerializer(
+                instance=self.my_rr_set_domain.rrset_set.all(),
+                data=data,
+                many=True,
+                partial=True,
+                context={"domain": self.my_rr_set_domain},
+            )
+            with mock.patch.object(
+                RRsetSerializer, "run_validation", side_effect=lambda data: data
+            ):
+                start = time.perf_counter()
+                serializer.is_valid()
+                seconds = time.perf_counter() - start
+            print(f"\n{n} RRsets: {seconds:.3f}s ({seconds / n * 1e6:.1f}µs per RRset)")
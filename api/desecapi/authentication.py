@@ -12,7 +12,7 @@ from rest_framework.authentication import (
     BasicAuthentication,
 )
 
-from desecapi.models import Domain, Token
+from desecapi.models import Token
 from desecapi.serializers import (
     AuthenticatedBasicUserActionSerializer,
     EmailPasswordSerializer,
@@ -26,7 +26,7 @@ class DynAuthenticationMixin:
         try:
             if (
                 username in ["", user.email]
-                or Domain.objects.filter_qname(username.lower(), owner=user).exists()
+                or user.get_domain_by_qname(username.lower()) is not None
             ):
                 return user, token
         except ValueError:
@@ -0,0 +1,75 @@
+import logging
+import time
+
+from celery import shared_task
+from celery.signals import task_postrun, task_received
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from desecapi import metrics, pdns, serials
+from desecapi.exceptions import PDNSException
+from desecapi.models import Domain
+
+logger = logging.getLogger(__name__)
+
+LANE = "axfr_lane"
+
+
+def _pending_key(name):
+    return f"desecapi.axfr.pending:{name}"
+
+
+def schedule(names):
+    """
+    Requests that nsmaster retrieves the given zones from nslord.
+
+    Transfers are not triggered right away, but after `settings.AXFR_COALESCE_WINDOW` seconds, by a Celery worker.
+    Further requests for a zone that arrive while a transfer is pending are dropped, as the pending transfer will
+    pick up their changes, too. (The changes have already been applied to nslord when we get here.) If the window is
+    None, transfers are triggered synchronously.
+    """
+    window = settings.AXFR_COALESCE_WINDOW
+    for name in names:
+        requested = time.time()
+        if window is None:
+            _run_task(name, requested)
+        elif cache.add(_pending_key(name), requested, timeout=window + 60):
+            task.apply_async((name, requested), countdown=window)
+        else:
+            metrics.get("desecapi_axfr_coalesced").inc()
+
+
+def _run_task(name, requested):
+    # Requests arriving from now on need a new transfer, as this one may not include their changes
+    cache.delete(_pending_key(name))
+    published = timezone.now()
+    serial = pdns.get_edited_serial(name)  # nsmaster will serve (at least) this serial
+    pdns.axfr_to_master(name)
+    metrics.get("desecapi_axfr_lag").observe(time.time() - requested)
+    Domain.objects.filter(name=name).update(published=published)
+    serials.update({name: serial})
+
+
+task = shared_task(
+    name=LANE,
+    queue=LANE,
+    ignore_result=True,
+    autoretry_for=(PDNSException,),
+    retry_backoff=True,
+    max_retries=5,
+    **settings.TASK_CONFIG[LANE],
+)(_run_task)
+
+
+@task_received.connect
+def _count_queued(request, **kwargs):
+    # Fires as soon as the worker has fetched the task, i.e. before its countdown has elapsed
+    if request.name == task.name:
+        metrics.get("desecapi_axfr_queue_depth").inc()
+
+
+@task_postrun.connect(sender=task)
+def _count_done(sender, **kwargs):
+    if not sender.request.is_eager:
+        metrics.get("desecapi_axfr_queue_depth").dec()
@@ -0,0 +1,106 @@
+import threading
+import uuid
+from bisect import bisect_right
+from ipaddress import IPv4Address, IPv4Network
+
+from django.core.cache import cache
+from django.db import transaction
+
+from desecapi.models import BlockedSubnet
+
+VERSION_CACHE_KEY = "desecapi.blocked_subnets.version"
+
+
+class BlockedSubnetIndex:
+    """
+    In-memory index of blocked IPv4 subnets. As subnets are either nested or disjoint, they are flattened into sorted,
+    disjoint integer ranges, each labeled with the most specific subnet covering it. Lookups are binary searches.
+    """
+
+    def __init__(self, subnets):
+        self.starts, self.ends, self.subnets = [], [], []
+        stack = []  # open subnets as (end, subnet), innermost last
+        position = 0
+
+        def emit(until):
+            nonlocal position
+            if stack and position < until:
+                self.starts.append(position)
+                self.ends.append(until)
+                self.subnets.append(stack[-1][1])
+            position = until
+
+        subnets = [subnet for subnet in subnets if isinstance(subnet, IPv4Network)]
+        for subnet in sorted(subnets, key=lambda s: (s.network_address, s.prefixlen)):
+            start = int(subnet.network_address)
+            while stack and stack[-1][0] <= start:
+                emit(stack[-1][0])
+                stack.pop()
+            emit(start)
+            stack.append((start + subnet.num_addresses, subnet))
+        while stack:
+            emit(stack[-1][0])
+            stack.pop()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, address):
+        """
+        Returns the most specific blocked subnet containing the given IPv4 address, or None.
+        """
+        address = int(IPv4Address(address))
+        i = bisect_right(self.starts, address) - 1
+        if i >= 0 and address < self.ends[i]:
+            return self.subnets[i]
+        return None
+
+    def lookup_all(self, addresses):
+        """
+        Returns a list with the result of `lookup` for each of the given IPv4 addresses.
+        """
+        return [self.lookup(address) for address in addresses]
+
+
+_lock = threading.Lock()
+_index = (None, BlockedSubnetIndex([]))  # (version, index)
+
+
+def version():
+    """
+    Returns the version stamp of the set of blocked subnets, which is kept in the cache so that all processes agree.
+    """
+    value = cache.get(VERSION_CACHE_KEY)
+    if value is None:
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+        value = cache.get(VERSION_CACHE_KEY)
+    return value
+
+
+def invalidate():
+    """
+    Assigns a new version stamp, so that indexes loaded before are reloaded on next use. To prevent an index from being
+    loaded before the change is visible to other processes, the version stamp is updated again after commit.
+    """
+
+    def bump():
+        cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def get_index():
+    """
+    Returns the index of blocked subnets, loading all subnets with one query if the version stamp changed.
+    """
+    global _index
+    current = version()
+    with _lock:
+        loaded, index = _index
+        if loaded != current:
+            index = BlockedSubnetIndex(
+                BlockedSubnet.objects.values_list("subnet", flat=True)
+            )
+            _index = (current, index)
+    return index
@@ -142,3 +142,87 @@ class NS(_NameMixin("target", allow_root=False), dns.rdtypes.ANY.NS.NS):
 @dns.immutable.immutable
 class SRV(_NameMixin("target", allow_root=True), dns.rdtypes.IN.SRV.SRV):
     pass
+
+
+# Fast paths for canonicalizing the most common record types without the tokenizer/wire/parser round trip. They only
+# accept contents of a common, unambiguous shape, and return None otherwise, so that the caller falls back to the
+# generic path (which also produces the error message for invalid contents).
+_ipv4_octet = r"(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])"
+_ipv4_pattern = re.compile(rf"^(?:{_ipv4_octet}\.){{3}}{_ipv4_octet}$")
+_ipv6_pattern = re.compile(r"^[0-9A-Fa-f:]{2,39}$")
+# Like the patterns in _NameMixin, with label length limit (names must additionally not exceed 254 characters)
+_hostname_pattern = re.compile(
+    r"^(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+$"
+)
+_cname_target_pattern = re.compile(r"^(?:[A-Za-z0-9_*-]{1,63}\.)+$")
+_mx_pattern = re.compile(r"^([0-9]{1,5}) (\.|[^ ]+)$")
+# Quoted strings of printable ASCII characters that need no escaping, separated by spaces
+_txt_pattern = re.compile(r'^"[ !#-\[\]-~]*"(?: +"[ !#-\[\]-~]*")*$')
+_txt_string_pattern = re.compile(r'"([^"]*)"')
+
+
+def _canonical_name(name, pattern):
+    if len(name) > 254 or pattern.match(name) is None:
+        return None
+    return (
+        name.lower()
+    )  # rdata names are lowercased when converted to canonical wire format
+
+
+def _canonical_a(content):
+    return content if _ipv4_pattern.match(content) else None
+
+
+def _canonical_aaaa(content):
+    if _ipv6_pattern.match(content) is None:
+        return None
+    try:
+        return IPv6Address(content).compressed
+    except ValueError:
+        return None
+
+
+def _canonical_cname(content):
+    return _canonical_name(content, _cname_target_pattern)
+
+
+def _canonical_mx(content):
+    match = _mx_pattern.match(content)
+    if match is None:
+        return None
+    preference, exchange = int(match.group(1)), match.group(2)
+    if preference > 65535:
+        return None
+    if exchange != ".":
+        exchange = _canonical_name(exchange, _hostname_pattern)
+        if exchange is None:
+            return None
+    return f"{preference} {exchange}"
+
+
+def _canonical_ns(content):
+    return _canonical_name(content, _hostname_pattern)
+
+
+def _canonical_txt(content):
+    if _txt_pattern.match(content) is None:
+        return None
+    # Like LongQuotedTXT, strings longer than 255 bytes are split
+    chunks = [
+        string[i : i + 255]
+        for string in _txt_string_pattern.findall(content)
+        for i in range(0, max(len(string), 1), 255)
+    ]
+    if sum(len(chunk) + 1 for chunk in chunks) > 64000:
+        return None
+    return " ".join(f'"{chunk}"' for chunk in chunks)
+
+
+FAST_CANONICALIZERS = {
+    "A": _canonical_a,
+    "AAAA": _canonical_aaaa,
+    "CNAME": _canonical_cname,
+    "MX": _canonical_mx,
+    "NS": _canonical_ns,
+    "TXT": _canonical_txt,
+}
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from desecapi import metrics
+
+_sessions = {}
+# Settings that give the connection pool size of each backend
+_pool_size_settings = {
+    "nslord": "NSLORD_PDNS_API_POOL_SIZE",
+    "nsmaster": "NSMASTER_PDNS_API_POOL_SIZE",
+    "pch": "PCH_API_POOL_SIZE",
+}
+_executor = None
+_lock = threading.Lock()
+_pid = None
+
+
+def _metered_connection_class(connection_cls, backend):
+    class MeteredConnection(connection_cls):
+        def connect(self):
+            start = time.monotonic()
+            super().connect()
+            metrics.get("desecapi_backend_connect_duration").labels(backend).observe(
+                time.monotonic() - start
+            )
+
+    return MeteredConnection
+
+
+def _metered_pool_class(pool_cls, backend):
+    class MeteredConnectionPool(pool_cls):
+        ConnectionCls = _metered_connection_class(pool_cls.ConnectionCls, backend)
+
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout=timeout)
+            # Connections are established lazily, so a socket is only present if the connection was used before
+            reused = conn.sock is not None
+            metrics.get("desecapi_backend_connection_checkout").labels(
+                backend, reused
+            ).inc()
+            return conn
+
+    return MeteredConnectionPool
+
+
+class MeteredHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that keeps a pool of keep-alive connections to one backend and reports connection reuse and
+    connect time to prometheus.
+    """
+
+    __attrs__ = HTTPAdapter.__attrs__ + ["backend"]
+
+    def __init__(self, backend, **kwargs):
+        self.backend = backend
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: _metered_pool_class(pool_cls, self.backend)
+            for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+
+def _check_pid():
+    # uwsgi forks its workers without going through os.fork(), so that os.register_at_fork() hooks do not fire. We
+    # therefore discard sessions and threads inherited from the parent when we notice that the process ID has changed.
+    global _executor, _pid
+
+    pid = os.getpid()
+    if _pid != pid:
+        _sessions.clear()  # don't close; the sockets belong to the parent
+        _executor = None  # threads are not inherited
+        _pid = pid
+
+
+def get_session(backend):
+    """
+    Returns the process-wide requests session for the given backend (e.g., "nslord"), creating it if necessary. The size
+    of its connection pool is taken from the backend's setting (e.g., `settings.NSLORD_PDNS_API_POOL_SIZE`).
+
+    Sessions are never shared across processes, as sockets inherited from the parent must not be used concurrently.
+    """
+    with _lock:
+        _check_pid()
+        try:
+            return _sessions[backend]
+        except KeyError:
+            pass
+
+        session = requests.Session()
+        adapter = MeteredHTTPAdapter(
+            backend,
+            pool_connections=1,
+            pool_maxsize=getattr(settings, _pool_size_settings[backend]),
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _sessions[backend] = session
+        return session
+
+
+def _outcome(call):
+    try:
+        return call()
+    except Exception as e:
+        return e
+
+
+def map_concurrently(calls):
+    """
+    Runs the given callables concurrently, using up to `settings.BACKEND_API_CONCURRENCY` threads per process, and
+    returns their outcomes in order. The outcome of a callable is its return value, or the exception it raised.
+    """
+    global _executor
+
+    calls = list(calls)
+    if settings.BACKEND_API_CONCURRENCY <= 1 or len(calls) <= 1:
+        return [_outcome(call) for call in calls]
+
+    with _lock:
+        _check_pid()
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKEND_API_CONCURRENCY,
+                thread_name_prefix="backend-api",
+            )
+        executor = _executor
+    futures = [executor.submit(_outcome, call) for call in calls]
+    return [future.result() for future in futures]
@@ -7,7 +7,7 @@ from django.core.management import BaseCommand
 from django.utils import timezone
 import dns.message, dns.rdatatype, dns.query
 
-from desecapi import models
+from desecapi import models, outbox, serials
 from desecapi.pdns_change_tracker import PDNSChangeTracker
 
 
@@ -29,6 +29,24 @@ class Command(BaseCommand):
             - settings.VALIDITY_PERIOD_VERIFICATION_SIGNATURE,
         ).delete()
 
+    @staticmethod
+    def replay_stale_outbox_entries():
+        # Pick up zones whose replay tasks have given up or got lost
+        names = (
+            models.PDNSOutboxEntry.objects.filter(
+                created__lt=timezone.now() - settings.PDNS_OUTBOX_STALE_PERIOD
+            )
+            .values_list("domain__name", flat=True)
+            .order_by()  # default ordering would make (name, created) distinct
+            .distinct()
+        )
+        outbox.dispatch(names)
+
+    @staticmethod
+    def reconcile_serial_index():
+        # Picks up serial changes that were not made through the API, and forgets zones deleted long ago
+        serials.reconcile()
+
     @staticmethod
     def update_healthcheck_timestamp():
         name = "internal-timestamp.desec.test"
@@ -99,6 +117,8 @@ class Command(BaseCommand):
             self.update_healthcheck_timestamp()
             self.delete_expired_captchas()
             self.delete_never_activated_users()
+            self.replay_stale_outbox_entries()
+            self.reconcile_serial_index()
         except Exception as e:
             subject = "chores Exception!"
             message = f"{type(e)}\n\n{str(e)}"
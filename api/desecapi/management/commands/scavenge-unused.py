@@ -3,8 +3,7 @@ import datetime
 from django.core.mail import get_connection, mail_admins
 from django.core.management import BaseCommand
 from django.db import transaction
-from django.db.models import F, Max, OuterRef, Subquery
-from django.db.models.functions import Greatest
+from django.db.models import F
 from django.utils import timezone
 
 from desecapi import models, serializers, views
@@ -16,25 +15,21 @@ notice_days_notify = 28
 notice_days_warn = 7
 
 
+def start_of_day(days_ago):
+    # Comparing with a point in time (instead of the date of a timestamp) allows using the index on last_active
+    date = timezone.localdate() - datetime.timedelta(days=days_ago)
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time()))
+
+
 class Command(BaseCommand):
     base_queryset = models.Domain.objects.exclude(
         renewal_state=models.Domain.RenewalState.IMMORTAL
     ).filter(owner__is_active=True)
-    _rrsets_outer_queryset = models.RRset.objects.filter(domain=OuterRef("pk")).values(
-        "domain"
-    )  # values() is GROUP BY
-    _max_touched = Subquery(
-        _rrsets_outer_queryset.annotate(max_touched=Max("touched")).values(
-            "max_touched"
-        )
-    )
 
     @classmethod
     def renew_touched_domains(cls):
-        recently_active_domains = cls.base_queryset.annotate(
-            last_active=Greatest(cls._max_touched, "published")
-        ).filter(
-            last_active__date__gte=timezone.localdate() - datetime.timedelta(days=183),
+        recently_active_domains = cls.base_queryset.filter(
+            last_active__gte=start_of_day(183),
             renewal_changed__lt=F("last_active"),
         )
 
@@ -87,22 +82,23 @@ class Command(BaseCommand):
 
     @classmethod
     def delete_domains(cls, inactive_days):
-        expired_domains = (
-            cls.base_queryset.filter(renewal_state=models.Domain.RenewalState.WARNED)
-            .annotate(last_active=Greatest(cls._max_touched, "published"))
-            .filter(
+        expired_domains = list(
+            cls.base_queryset.filter(
+                renewal_state=models.Domain.RenewalState.WARNED,
                 renewal_changed__date__lte=timezone.localdate()
                 - datetime.timedelta(days=notice_days_warn),
-                last_active__date__lte=timezone.localdate()
-                - datetime.timedelta(days=inactive_days),
-            )
+                last_active__lt=start_of_day(inactive_days - 1),
+            ).select_related("owner")
         )
 
-        for domain in expired_domains:
-            with PDNSChangeTracker():
+        # Delete all domains at once, so that the catalog zone and PCH are updated in batches
+        with PDNSChangeTracker():
+            for domain in expired_domains:
                 domain.delete()
-            if not domain.owner.domains.exists():
-                domain.owner.delete()
+        owners = {domain.owner_id: domain.owner for domain in expired_domains}
+        for owner in owners.values():
+            if not owner.domains.exists():
+                owner.delete()
         # Do one large delegation update
         with PDNSChangeTracker():
             for domain in expired_domains:
@@ -1,14 +1,21 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from django.core.management import BaseCommand, CommandError, call_command
 from django.db import transaction
 
-from desecapi import pdns
+from desecapi import axfr, outbox, pdns
 from desecapi.exceptions import PDNSException
-from desecapi.models import Domain
-from desecapi.pdns_change_tracker import PDNSChangeTracker
+from desecapi.models import Domain, RRset
+
+# Number of domains whose local RRsets are loaded at once
+CHUNK_SIZE = 100
 
 
 class Command(BaseCommand):
-    help = "Sync RRsets from local API database to pdns."
+    help = (
+        "Sync RRsets from local API database to pdns. Only RRsets that differ are sent, and zones are only "
+        "transferred to nsmaster if they changed."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -16,6 +23,17 @@ class Command(BaseCommand):
             nargs="*",
             help="Domain name to sync. If omitted, will import all API domains.",
         )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report RRsets that differ between the local API database and pdns, without changing anything.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Number of domains to process concurrently (default: 8).",
+        )
 
     def handle(self, *args, **options):
         domains = Domain.objects.all()
@@ -28,55 +46,161 @@ class Command(BaseCommand):
                 if domain_name not in domain_names:
                     raise CommandError("{} is not a known domain".format(domain_name))
 
+        dry_run = options["dry_run"]
+        domains = list(domains.only("name").order_by("name"))
         catalog_alignment = False
-        for domain in domains:
-            self.stdout.write("%s ..." % domain.name, ending="")
-            try:
-                created = self._sync_domain(domain)
-                if created:
-                    self.stdout.write(f" created (was missing) ...", ending="")
-                    catalog_alignment = True
-                self.stdout.write(" synced")
-            except Exception as e:
-                self.stdout.write(" failed")
-                msg = "Error while processing {}: {}".format(domain.name, e)
-                raise CommandError(msg)
-
-        if catalog_alignment:
+        failed = []
+
+        # Workers only talk to pdns; database access happens in this thread
+        with ThreadPoolExecutor(max_workers=max(options["workers"], 1)) as executor:
+            for i in range(0, len(domains), CHUNK_SIZE):
+                chunk = domains[i : i + CHUNK_SIZE]
+                changed = set()
+                with transaction.atomic():
+                    if not dry_run:
+                        # don't race with API writes and outbox replays of the same zones
+                        for domain in chunk:
+                            outbox.lock_zone(domain.name)
+                    local = self._get_local_rrsets(chunk)
+                    futures = [
+                        executor.submit(
+                            self._sync_domain, domain, local[domain.name], dry_run
+                        )
+                        for domain in chunk
+                    ]
+                    for domain, future in zip(chunk, futures):
+                        self.stdout.write("%s ..." % domain.name, ending="")
+                        try:
+                            created, diff = future.result()
+                        except Exception as e:
+                            self.stdout.write(" failed: {}".format(e))
+                            failed.append(domain.name)
+                            continue
+                        catalog_alignment |= created
+                        if created or any(diff):
+                            changed.add(domain.name)
+                        self._report(created, diff, dry_run)
+                if not dry_run:
+                    # Propagates the changes to nsmaster, and records the new serials in the index
+                    axfr.schedule(changed)
+
+        if catalog_alignment and not dry_run:
             call_command("align-catalog-zone")
 
+        if failed:
+            raise CommandError(
+                "Error while processing {} domain(s): {}".format(
+                    len(failed), ", ".join(failed)
+                )
+            )
+
+    def _report(self, created, diff, dry_run):
+        additions, modifications, deletions = diff
+        if created:
+            self.stdout.write(
+                " missing on pdns ..." if dry_run else " created (was missing) ...",
+                ending="",
+            )
+        if not any(diff):
+            self.stdout.write(" in sync")
+            return
+        self.stdout.write(
+            " {} {} added, {} modified, {} deleted RRset(s)".format(
+                "would have" if dry_run else "synced:",
+                len(additions),
+                len(modifications),
+                len(deletions),
+            )
+        )
+        if dry_run:
+            for sign, keys in (
+                ("+", additions),
+                ("~", modifications),
+                ("-", deletions),
+            ):
+                for type_, subname in sorted(keys):
+                    self.stdout.write("  {} {} {}".format(sign, subname or "@", type_))
+
     @staticmethod
-    @transaction.atomic
-    def _sync_domain(domain):
-        created = False
+    def _get_local_rrsets(domains):
+        """
+        Returns a dict mapping each domain name to a dict, which maps (type, subname) to (ttl, set of record contents)
+        for all RRsets of the domain. RRsets without records are skipped, as they do not exist on pdns. All RRsets are
+        fetched with one query.
+        """
+        rrsets = {domain.name: {} for domain in domains}
+        rows = RRset.objects.filter(
+            domain__in=domains, records__isnull=False
+        ).values_list("domain__name", "type", "subname", "ttl", "records__content")
+        for name, type_, subname, ttl, content in rows:
+            rrsets[name].setdefault((type_, subname), (ttl, set()))[1].add(content)
+        return rrsets
 
-        # Create domain on pdns if it does not exist
+    @staticmethod
+    def _get_pdns_rrsets(domain):
+        rrsets = {
+            (rrset["type"], rrset["subname"]): (rrset["ttl"], set(rrset["records"]))
+            for rrset in pdns.get_rrset_datas(domain)
+        }
+        rrsets.pop(("SOA", ""), None)  # do not touch SOA record
+        return rrsets
+
+    @classmethod
+    def _sync_domain(cls, domain, local, dry_run):
+        """
+        Aligns the zone on pdns with the given local RRsets (see `_get_local_rrsets`), creating the zone if it does
+        not exist. Returns whether the zone was created, and the RRsets that were added, modified, and deleted.
+        """
+        created = False
         try:
-            PDNSChangeTracker.CreateDomain(domain_name=domain.name).pdns_do()
+            remote = cls._get_pdns_rrsets(domain)
         except PDNSException as e:
-            # Domain already exists
-            if e.response.status_code == 409:
-                pass
-            else:
+            if e.response.status_code != 404:
                 raise e
-        else:
             created = True
+            remote = {}
+            if not dry_run:
+                pdns.create_zone_lord(domain.name)
+                try:
+                    pdns.create_zone_master(domain.name)
+                except PDNSException as e:
+                    # Zone already exists
+                    if e.response.status_code != 409:
+                        raise e
 
-        # modifications actually merged with additions in CreateUpdateDeleteRRSets
+        additions = local.keys() - remote.keys()
         modifications = {
-            (rrset.type, rrset.subname) for rrset in domain.rrset_set.all()
+            key for key in local.keys() & remote.keys() if local[key] != remote[key]
         }
-        deletions = {
-            (rrset["type"], rrset["subname"]) for rrset in pdns.get_rrset_datas(domain)
-        } - modifications
-        deletions.discard(("SOA", ""))  # do not remove SOA record
-
-        # Update zone on nslord, propagate to nsmaster
-        PDNSChangeTracker.CreateUpdateDeleteRRSets(
-            domain.name, set(), modifications, deletions
-        ).pdns_do()
-        pdns._pdns_put(
-            pdns.NSMASTER, "/zones/{}/axfr-retrieve".format(pdns.pdns_id(domain.name))
-        )
+        deletions = remote.keys() - local.keys()
+
+        if not dry_run and (additions or modifications or deletions):
+            data = {
+                "rrsets": [
+                    {
+                        "name": RRset.construct_name(subname, domain.name),
+                        "type": type_,
+                        "ttl": 1,  # some meaningless integer required by pdns's syntax
+                        "changetype": "REPLACE",  # don't use "DELETE" due to desec-stack#220, PowerDNS/pdns#7501
+                        "records": [],
+                    }
+                    for type_, subname in deletions
+                ]
+                + [
+                    {
+                        "name": RRset.construct_name(subname, domain.name),
+                        "type": type_,
+                        "ttl": local[(type_, subname)][0],
+                        "changetype": "REPLACE",
+                        "records": [
+                            {"content": content, "disabled": False}
+                            for content in sorted(local[(type_, subname)][1])
+                        ],
+                    }
+                    for type_, subname in additions | modifications
+                ]
+            }
+            # Update zone on nslord; propagation to nsmaster is scheduled by the caller
+            pdns.update_zone(domain.name, data)
 
-        return created
+        return created, (additions, modifications, deletions)
@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+import requests
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from desecapi import psl
+
+
+class Command(BaseCommand):
+    help = (
+        "Download the Public Suffix List and atomically replace the local snapshot, which API workers pick up within "
+        "settings.PSL_REFRESH_INTERVAL seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            default=settings.PSL_URL,
+            help="URL or local file to read the list from (default: settings.PSL_URL).",
+        )
+
+    def handle(self, *args, **options):
+        source = options["source"]
+        try:
+            if "://" in source:
+                response = requests.get(source, timeout=30)
+                response.raise_for_status()
+                text = response.content.decode("utf-8")
+            else:
+                with open(source, encoding="utf-8") as f:
+                    text = f.read()
+        except (OSError, UnicodeError, requests.RequestException) as e:
+            raise CommandError(f"Could not retrieve Public Suffix List: {e}")
+
+        # Refuse to replace a working snapshot with a truncated or garbled one
+        trie = psl.PublicSuffixTrie(psl.parse(text))
+        if not all(
+            trie.is_public_suffix(name) for name in ["com", "co.uk", "s3.amazonaws.com"]
+        ):
+            raise CommandError("Retrieved Public Suffix List is incomplete")
+
+        directory = os.path.dirname(settings.PSL_SNAPSHOT)
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=directory, delete=False
+        ) as f:
+            f.write(text)
+        os.chmod(f.name, 0o644)
+        os.replace(f.name, settings.PSL_SNAPSHOT)
+        self.stdout.write(f"Updated {settings.PSL_SNAPSHOT}")
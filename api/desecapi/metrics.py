@@ -1,4 +1,4 @@
-from prometheus_client import Counter, Histogram
+from prometheus_client import Counter, Gauge, Histogram
 
 metrics = {}
 
@@ -15,6 +15,10 @@ def set_histogram(name, *args, **kwargs):
     metrics[name] = Histogram(name, *args, **kwargs)
 
 
+def set_gauge(name, *args, **kwargs):
+    metrics[name] = Gauge(name, *args, **kwargs)
+
+
 # models metrics
 set_counter(
     "desecapi_captcha_content_created",
@@ -91,6 +95,71 @@ set_counter(
     ["method", "path", "status"],
 )
 
+# axfr.py metrics
+set_counter(
+    "desecapi_axfr_coalesced",
+    "number of AXFR requests dropped because a transfer of the zone was already pending",
+)
+set_gauge(
+    "desecapi_axfr_queue_depth",
+    "number of AXFR tasks waiting in the worker",
+    multiprocess_mode="livesum",
+)
+set_histogram(
+    "desecapi_axfr_lag",
+    "time from the first request of a zone transfer until it was triggered",
+    buckets=[0.5, 1, 2, 5, 10, 30, 60, 300, float("inf")],
+)
+
+# outbox.py metrics
+set_histogram(
+    "desecapi_pdns_outbox_entries_replayed",
+    "number of outbox entries coalesced into one pdns zone update",
+    buckets=[1, 2, 5, 10, 50, 100, float("inf")],
+)
+
+# http_client.py metrics
+set_counter(
+    "desecapi_backend_connection_checkout",
+    "number of connections taken from a backend API connection pool",
+    ["backend", "reused"],
+)
+set_histogram(
+    "desecapi_backend_connect_duration",
+    "time needed to establish a connection to a backend API",
+    ["backend"],
+)
+
+# models/domains.py metrics
+set_counter(
+    "desecapi_zonefile_cache_hit",
+    "number of zonefile exports served from the cache",
+)
+set_counter(
+    "desecapi_zonefile_cache_miss",
+    "number of zonefile exports retrieved from nslord",
+)
+
+# models/records.py metrics
+set_counter(
+    "desecapi_rr_canonical_cache_hit",
+    "number of record contents whose canonical format was taken from the cache",
+    ["layer"],
+)
+set_counter(
+    "desecapi_rr_canonical_cache_miss",
+    "number of record contents whose canonical format had to be computed",
+)
+
+# psl.py metrics
+set_counter(
+    "desecapi_psl_compiled",
+    "number of times the Public Suffix List trie was compiled from the snapshot",
+)
+set_counter(
+    "desecapi_psl_mismatch",
+    "number of public suffix lookups where the local result differed from DNS",
+)
 
 # pdns_change_tracker.py metrics
 set_counter(
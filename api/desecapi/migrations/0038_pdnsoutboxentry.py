@@ -0,0 +1,46 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("desecapi", "0037_remove_tokendomainpolicy_perm_dyndns"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PDNSOutboxEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("rrsets", models.JSONField()),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                (
+                    "domain",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="outbox_entries",
+                        to="desecapi.domain",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("created",),
+                "indexes": [
+                    models.Index(
+                        fields=["created"], name="desecapi_pd_created_32f37f_idx"
+                    )
+                ],
+            },
+        ),
+    ]
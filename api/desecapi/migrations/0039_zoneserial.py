@@ -0,0 +1,32 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("desecapi", "0038_pdnsoutboxentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ZoneSerial",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=192, unique=True)),
+                ("serial", models.PositiveBigIntegerField(null=True)),
+                ("changed", models.DateTimeField(db_index=True)),
+            ],
+            options={
+                "ordering": ("name",),
+            },
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:04
+
+import pgtrigger.compiler
+import pgtrigger.migrations
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("desecapi", "0039_zoneserial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="domain",
+            name="last_active",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name="domain",
+            trigger=pgtrigger.compiler.Trigger(
+                name="last_active",
+                sql=pgtrigger.compiler.UpsertTriggerSql(
+                    func="NEW.last_active = GREATEST((SELECT MAX(touched) FROM desecapi_rrset WHERE domain_id = NEW.id), NEW.published); RETURN NEW;",
+                    hash="7a170cb3080499ecaecc44802c6adb93100461a3",
+                    operation='INSERT OR UPDATE OF "published"',
+                    pgid="pgtrigger_last_active_2166a",
+                    table="desecapi_domain",
+                    when="BEFORE",
+                ),
+            ),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name="rrset",
+            trigger=pgtrigger.compiler.Trigger(
+                name="domain_last_active_insert",
+                sql=pgtrigger.compiler.UpsertTriggerSql(
+                    func="\n                    UPDATE desecapi_domain SET last_active = GREATEST(\n                        (SELECT MAX(touched) FROM desecapi_rrset WHERE domain_id = desecapi_domain.id), published\n                    ) WHERE id IN (SELECT domain_id FROM transition);\n                    RETURN NULL;\n                ",
+                    hash="47f3a1b11171537367df72c4cd94c65b94a75202",
+                    level="STATEMENT",
+                    operation="INSERT",
+                    pgid="pgtrigger_domain_last_active_insert_9bfa0",
+                    referencing="REFERENCING NEW TABLE AS transition ",
+                    table="desecapi_rrset",
+                    when="AFTER",
+                ),
+            ),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name="rrset",
+            trigger=pgtrigger.compiler.Trigger(
+                name="domain_last_active_update",
+                sql=pgtrigger.compiler.UpsertTriggerSql(
+                    func="\n                    UPDATE desecapi_domain SET last_active = GREATEST(\n                        (SELECT MAX(touched) FROM desecapi_rrset WHERE domain_id = desecapi_domain.id), published\n                    ) WHERE id IN (SELECT domain_id FROM transition);\n                    RETURN NULL;\n                ",
+                    hash="6d2a066532d6590d249817e39be654a86b959ecf",
+                    level="STATEMENT",
+                    operation="UPDATE",
+                    pgid="pgtrigger_domain_last_active_update_8bc46",
+                    referencing="REFERENCING NEW TABLE AS transition ",
+                    table="desecapi_rrset",
+                    when="AFTER",
+                ),
+            ),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name="rrset",
+            trigger=pgtrigger.compiler.Trigger(
+                name="domain_last_active_delete",
+                sql=pgtrigger.compiler.UpsertTriggerSql(
+                    func="\n                    UPDATE desecapi_domain SET last_active = GREATEST(\n                        (SELECT MAX(touched) FROM desecapi_rrset WHERE domain_id = desecapi_domain.id), published\n                    ) WHERE id IN (SELECT domain_id FROM transition);\n                    RETURN NULL;\n                ",
+                    hash="b6b57744fff1807294f36acbd5361859d11d94bf",
+                    level="STATEMENT",
+                    operation="DELETE",
+                    pgid="pgtrigger_domain_last_active_delete_92da6",
+                    referencing="REFERENCING OLD TABLE AS transition ",
+                    table="desecapi_rrset",
+                    when="AFTER",
+                ),
+            ),
+        ),
+        migrations.RunSQL(
+            "UPDATE desecapi_domain SET last_active = GREATEST("
+            "(SELECT MAX(touched) FROM desecapi_rrset WHERE domain_id = desecapi_domain.id), published);",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:19
+
+import pgtrigger.compiler
+import pgtrigger.migrations
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("desecapi", "0040_domain_last_active"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="domain",
+            name="reversed_name",
+            field=models.CharField(
+                db_index=True, default="", editable=False, max_length=191
+            ),
+            preserve_default=False,
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name="domain",
+            trigger=pgtrigger.compiler.Trigger(
+                name="reversed_name",
+                sql=pgtrigger.compiler.UpsertTriggerSql(
+                    func="NEW.reversed_name = array_to_string(ARRAY(SELECT label FROM unnest(string_to_array(NEW.name, '.')) WITH ORDINALITY AS t(label, i) ORDER BY i DESC), '.'); RETURN NEW;",
+                    hash="b0f05fd22e771e830aa19c555dd9700a4c95ca21",
+                    operation='INSERT OR UPDATE OF "name"',
+                    pgid="pgtrigger_reversed_name_a1f60",
+                    table="desecapi_domain",
+                    when="BEFORE",
+                ),
+            ),
+        ),
+        migrations.RunSQL(
+            "UPDATE desecapi_domain SET reversed_name = array_to_string(ARRAY(SELECT label FROM"
+            " unnest(string_to_array(name, '.')) WITH ORDINALITY AS t(label, i) ORDER BY i DESC), '.');",
+            migrations.RunSQL.noop,
+        ),
+    ]
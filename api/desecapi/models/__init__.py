@@ -5,6 +5,7 @@ from .captcha import Captcha
 from .domains import Domain
 from .donation import Donation
 from .mfa import BaseFactor, TOTPFactor
+from .outbox import PDNSOutboxEntry
 from .records import (
     RR,
     RRset,
@@ -13,5 +14,6 @@ from .records import (
     RR_SET_TYPES_UNSUPPORTED,
     RR_SET_TYPES_UNSUPPORTED,
 )
+from .serials import ZoneSerial
 from .tokens import Token, TokenDomainPolicy
 from .users import User
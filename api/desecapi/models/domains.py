@@ -1,44 +1,75 @@
 from __future__ import annotations
 
-from functools import cached_property
+from functools import cached_property, partial
 
 import dns
-import psl_dns
+import pgtrigger
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import CharField, F, Manager, Q, Value
-from django.db.models.functions import Concat, Length
+from django.db.models import Manager, Q
+from django.db.models.functions import Length
 from django_prometheus.models import ExportModelOperationsMixin
-from dns.exception import Timeout
-from dns.resolver import NoNameservers
 from rest_framework.exceptions import APIException
 
-from desecapi import logger, metrics, pdns
+from desecapi import http_client, logger, metrics, pdns
+from desecapi.psl import PublicSuffixList
 
 from .base import validate_domain_name
-from .records import RRset
+from .records import RR, RRset
 
 
-psl = psl_dns.PSL(resolver=settings.PSL_RESOLVER, timeout=0.5)
+psl = PublicSuffixList(resolver=settings.PSL_RESOLVER, timeout=0.5)
+
+
+def reverse_name(name: str) -> str:
+    """
+    Returns the domain name with its labels in reverse order, e.g. io.dedyn.foo for foo.dedyn.io. This is the format
+    of Domain.reversed_name, in which all descendants of a domain share its key as a prefix.
+    """
+    return ".".join(reversed(name.split(".")))
 
 
 class DomainManager(Manager):
-    def filter_qname(self, qname: str, **kwargs) -> models.query.QuerySet:
-        qs = self.annotate(
-            name_length=Length("name")
-        )  # callers expect this to be present after returning
+    @staticmethod
+    def _qname_suffixes(qname: str) -> list[str] | None:
+        """
+        Returns the names of all domains that could cover qname, i.e. qname and its ancestors, or None if qname is not
+        a valid hostname (optionally starting with a wildcard label).
+        """
         try:
             Domain._meta.get_field("name").run_validators(
                 qname.removeprefix("*.").lower()
             )
         except ValidationError:
+            return None
+        labels = qname.split(".")
+        return [".".join(labels[i:]) for i in range(len(labels))]
+
+    def filter_qname(self, qname: str, **kwargs) -> models.query.QuerySet:
+        qs = self.annotate(
+            name_length=Length("name")
+        )  # callers expect this to be present after returning
+        suffixes = self._qname_suffixes(qname)
+        if suffixes is None:
             return qs.none()
-        return qs.annotate(
-            dotted_name=Concat(Value("."), "name", output_field=CharField()),
-            dotted_qname=Value(f".{qname}", output_field=CharField()),
-        ).filter(dotted_qname__endswith=F("dotted_name"), **kwargs)
+        # Domains covering qname have reversed names that are label-wise prefixes of qname's reversed name, so all
+        # candidates can be looked up in the reversed_name index.
+        return qs.filter(
+            reversed_name__in=[reverse_name(suffix) for suffix in suffixes], **kwargs
+        )
+
+    def get_by_qname(self, qname: str, **kwargs) -> Domain | None:
+        """
+        Returns the domain with the longest name covering qname, or None. Candidates are looked up by name at once.
+        """
+        suffixes = self._qname_suffixes(qname)
+        if suffixes is None:
+            return None
+        domains = self.filter(name__in=suffixes, **kwargs)
+        return max(domains, key=lambda domain: len(domain.name), default=None)
 
 
 class Domain(ExportModelOperationsMixin("Domain"), models.Model):
@@ -63,6 +94,10 @@ class Domain(ExportModelOperationsMixin("Domain"), models.Model):
         choices=RenewalState.choices, default=RenewalState.IMMORTAL
     )
     renewal_changed = models.DateTimeField(auto_now_add=True)
+    # Latest RRset `touched` timestamp or `published`, maintained by triggers (see also RRset.Meta.triggers)
+    last_active = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Labels of name in reverse order (see reverse_name), maintained by trigger for prefix queries on descendants
+    reversed_name = models.CharField(max_length=191, editable=False, db_index=True)
 
     _keys = None
     objects = DomainManager()
@@ -72,6 +107,23 @@ class Domain(ExportModelOperationsMixin("Domain"), models.Model):
             models.UniqueConstraint(fields=["id", "owner"], name="unique_id_owner")
         ]
         ordering = ("created",)
+        triggers = [
+            pgtrigger.Trigger(
+                name="last_active",
+                operation=pgtrigger.Insert | pgtrigger.UpdateOf("published"),
+                when=pgtrigger.Before,
+                func="NEW.last_active = GREATEST((SELECT MAX(touched) FROM desecapi_rrset WHERE domain_id = NEW.id),"
+                " NEW.published); RETURN NEW;",
+            ),
+            pgtrigger.Trigger(
+                name="reversed_name",
+                operation=pgtrigger.Insert | pgtrigger.UpdateOf("name"),
+                when=pgtrigger.Before,
+                func="NEW.reversed_name = array_to_string(ARRAY(SELECT label FROM"
+                " unnest(string_to_array(NEW.name, '.')) WITH ORDINALITY AS t(label, i) ORDER BY i DESC), '.');"
+                " RETURN NEW;",
+            ),
+        ]
 
     def __init__(self, *args, **kwargs):
         if isinstance(kwargs.get("owner"), AnonymousUser):
@@ -88,28 +140,8 @@ class Domain(ExportModelOperationsMixin("Domain"), models.Model):
 
     @cached_property
     def public_suffix(self):
-        try:
-            public_suffix = psl.get_public_suffix(self.name)
-            is_public_suffix = psl.is_public_suffix(self.name)
-        except (Timeout, NoNameservers):
-            public_suffix = self.name.rpartition(".")[2]
-            is_public_suffix = "." not in self.name  # TLDs are public suffixes
-
-        if is_public_suffix:
-            return public_suffix
-
-        # Take into account that any of the parent domains could be a local public suffix. To that
-        # end, identify the longest local public suffix that is actually a suffix of domain_name.
-        for local_public_suffix in settings.LOCAL_PUBLIC_SUFFIXES:
-            has_local_public_suffix_parent = ("." + self.name).endswith(
-                "." + local_public_suffix
-            )
-            if has_local_public_suffix_parent and len(local_public_suffix) > len(
-                public_suffix
-            ):
-                public_suffix = local_public_suffix
-
-        return public_suffix
+        # Local public suffixes are taken into account by the PSL lookup
+        return psl.get_public_suffix(self.name)
 
     def is_covered_by_foreign_zone(self):
         # Generate a list of all domains connecting this one and its public suffix.
@@ -135,8 +167,10 @@ class Domain(ExportModelOperationsMixin("Domain"), models.Model):
         # Note: This is not completely accurate: Ideally, we should only consider zones with identical public suffix.
         # (If a public suffix lies in between, it's ok.) However, as there could be many descendant zones, the accurate
         # check is expensive, so currently not implemented (PSL lookups for each of them).
+        # Descendants share the reversed name as a prefix, which allows for an index range scan.
         return Domain.objects.filter(
-            Q(name__endswith=f".{self.name}") & ~Q(owner=self._owner_or_none)
+            Q(reversed_name__startswith=f"{reverse_name(self.name)}.")
+            & ~Q(owner=self._owner_or_none)
         ).exists()
 
     def is_registrable(self):
@@ -179,39 +213,90 @@ class Domain(ExportModelOperationsMixin("Domain"), models.Model):
 
     @property
     def keys(self):
-        if not self._keys:
-            self._keys = [{**key, "managed": True} for key in pdns.get_keys(self)]
-            try:
-                unmanaged_keys = self.rrset_set.get(
-                    subname="", type="DNSKEY"
-                ).records.all()
-            except RRset.DoesNotExist:
-                pass
-            else:
-                name = dns.name.from_text(self.name)
-                for rr in unmanaged_keys:
-                    key = dns.rdata.from_text(
-                        dns.rdataclass.IN, dns.rdatatype.DNSKEY, rr.content
-                    )
-                    key_is_sep = key.flags & dns.rdtypes.ANY.DNSKEY.SEP
-                    self._keys.append(
-                        {
-                            "dnskey": rr.content,
-                            "ds": [
-                                dns.dnssec.make_ds(name, key, algo).to_text()
-                                for algo in (2, 4)
-                            ]
-                            if key_is_sep
-                            else [],
-                            "flags": key.flags,  # deprecated
-                            "keytype": None,  # deprecated
-                            "managed": False,
-                        }
-                    )
+        if self._keys is None:
+            Domain.prefetch_keys([self])
         return self._keys
 
+    @staticmethod
+    def _keys_cache_key(name):
+        return f"desecapi.keys:{name}"
+
+    @classmethod
+    def invalidate_keys(cls, names):
+        cache.delete_many([cls._keys_cache_key(name) for name in names])
+
+    @classmethod
+    def prefetch_keys(cls, domains):
+        """
+        Populates the `keys` property of the given domains: the DNSSEC keys managed by nslord, and unmanaged ones from
+        the apex DNSKEY RRset (if any). Keys are taken from the cache with one lookup where possible. Keys of the
+        remaining domains are retrieved from nslord concurrently, and their unmanaged DNSKEYs with one query.
+
+        Results are cached for `settings.DOMAIN_KEYS_CACHE_TIMEOUT` seconds under the domain name, without a stamp of
+        the key state. Instead, the change tracker invalidates the entry when the zone is created or deleted, or when
+        its DNSKEY RRset changes. Key rollovers done directly on nslord take effect when the cached entry expires.
+        Zones without keys are not ready yet, so an empty result is only cached for
+        `settings.DOMAIN_KEYS_EMPTY_CACHE_TIMEOUT` seconds.
+        """
+        domains = [domain for domain in domains if domain._keys is None]
+        cached = cache.get_many(
+            [cls._keys_cache_key(domain.name) for domain in domains]
+        )
+        missing = []
+        for domain in domains:
+            domain._keys = cached.get(cls._keys_cache_key(domain.name))
+            if domain._keys is None:
+                missing.append(domain)
+        if not missing:
+            return
+
+        outcomes = http_client.map_concurrently(
+            partial(pdns.get_keys, domain) for domain in missing
+        )
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                raise outcome
+
+        unmanaged_keys = {}
+        for domain_id, content in RR.objects.filter(
+            rrset__domain__in=missing, rrset__subname="", rrset__type="DNSKEY"
+        ).values_list("rrset__domain_id", "content"):
+            unmanaged_keys.setdefault(domain_id, []).append(content)
+
+        to_cache, to_cache_briefly = {}, {}
+        for domain, managed_keys in zip(missing, outcomes):
+            domain._keys = [{**key, "managed": True} for key in managed_keys] + [
+                cls._unmanaged_key(domain.name, content)
+                for content in unmanaged_keys.get(domain.pk, [])
+            ]
+            (to_cache if domain._keys else to_cache_briefly)[
+                cls._keys_cache_key(domain.name)
+            ] = domain._keys
+        cache.set_many(to_cache, timeout=settings.DOMAIN_KEYS_CACHE_TIMEOUT)
+        cache.set_many(
+            to_cache_briefly, timeout=settings.DOMAIN_KEYS_EMPTY_CACHE_TIMEOUT
+        )
+
+    @staticmethod
+    def _unmanaged_key(name, content):
+        key = dns.rdata.from_text(dns.rdataclass.IN, dns.rdatatype.DNSKEY, content)
+        key_is_sep = key.flags & dns.rdtypes.ANY.DNSKEY.SEP
+        return {
+            "dnskey": content,
+            "ds": [
+                dns.dnssec.make_ds(dns.name.from_text(name), key, algo).to_text()
+                for algo in (2, 4)
+            ]
+            if key_is_sep
+            else [],
+            "flags": key.flags,  # deprecated
+            "keytype": None,  # deprecated
+            "managed": False,
+        }
+
     @property
     def touched(self):
+        # For serialization, the last_active field (maintained by the database) is used instead
         try:
             rrset_touched = max(
                 updated for updated in self.rrset_set.values_list("touched", flat=True)
@@ -240,9 +325,36 @@ class Domain(ExportModelOperationsMixin("Domain"), models.Model):
         subname, _, parent_name = self.name.partition(".")
         return subname, parent_name or None
 
-    @property
-    def zonefile(self):
-        return pdns.get_zonefile(self)
+    def iter_zonefile(self):
+        """
+        Returns the zonefile (presentation format) as an iterable of byte strings, relayed from nslord as it arrives.
+        Exports are cached for `settings.ZONEFILE_EXPORT_CACHE_TIMEOUT` seconds if they are not too large. The cache is
+        keyed by the zone's serial, so that a repeated export of an unchanged zone is served without exporting it again.
+        """
+        timeout = settings.ZONEFILE_EXPORT_CACHE_TIMEOUT
+        if not timeout:
+            return pdns.stream_zonefile(self)
+
+        # Include the pk, as serials start over when a domain is deleted and created again
+        key = f"desecapi.zonefile:{self.pk}:{pdns.get_edited_serial(self.name)}"
+        zonefile = cache.get(key)
+        if zonefile is not None:
+            metrics.get("desecapi_zonefile_cache_hit").inc()
+            return [zonefile]
+        metrics.get("desecapi_zonefile_cache_miss").inc()
+        return self._cache_zonefile(pdns.stream_zonefile(self), key, timeout)
+
+    @staticmethod
+    def _cache_zonefile(chunks, key, timeout):
+        # Only cache complete exports, i.e. not when the client disconnects (and the generator is closed) early
+        buffer, size = [], 0
+        for chunk in chunks:
+            size += len(chunk)
+            if size <= settings.ZONEFILE_EXPORT_CACHE_MAX_SIZE:
+                buffer.append(chunk)
+            yield chunk
+        if size <= settings.ZONEFILE_EXPORT_CACHE_MAX_SIZE:
+            cache.set(key, b"".join(buffer), timeout)
 
     def save(self, *args, **kwargs):
         self.full_clean(validate_unique=False)
@@ -0,0 +1,21 @@
+from django.db import models
+
+
+class PDNSOutboxEntry(models.Model):
+    """
+    RRsets of a zone that were changed in the database, but not yet propagated to nslord. Entries are written in the
+    same transaction as the change itself, and are removed once the RRsets' current state has been sent to nslord.
+    """
+
+    created = models.DateTimeField(auto_now_add=True)
+    domain = models.ForeignKey(
+        "Domain", on_delete=models.CASCADE, related_name="outbox_entries"
+    )
+    rrsets = models.JSONField()  # list of [type, subname]
+    attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ("created",)
+        indexes = [
+            models.Index(fields=["created"]),
+        ]
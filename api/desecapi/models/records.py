@@ -1,22 +1,39 @@
 from __future__ import annotations
 
 import binascii
+import threading
 import uuid
+from collections import OrderedDict
+from hashlib import sha256
 
 import dns
+import pgtrigger
+from django.conf import settings
 from django.contrib.postgres.constraints import ExclusionConstraint
 from django.contrib.postgres.fields import RangeOperators
 from django.core import validators
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import Manager
+from django.db.models import Manager, Q
 from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_save
+from django.utils import timezone
 from django_prometheus.models import ExportModelOperationsMixin
 from dns import rdataclass, rdatatype
 from dns.rdtypes import ANY, IN
 
-from desecapi import pdns
-from desecapi.dns import AAAA, CERT, CNAME, LongQuotedTXT, MX, NS, SRV
+from desecapi import metrics, pdns
+from desecapi.dns import (
+    AAAA,
+    CERT,
+    CNAME,
+    FAST_CANONICALIZERS,
+    LongQuotedTXT,
+    MX,
+    NS,
+    SRV,
+)
 
 from .base import validate_lower, validate_upper
 
@@ -58,10 +75,118 @@ RR_SET_TYPES_MANAGEABLE = (
 class RRsetManager(Manager):
     def create(self, contents=None, **kwargs):
         rrset = super().create(**kwargs)
-        for content in contents or []:
-            RR.objects.create(rrset=rrset, content=content)
+        RR.objects.bulk_create(
+            [RR(rrset=rrset, content=content) for content in contents or []],
+            touch=False,
+        )
         return rrset
 
+    def touch(self, rrsets):
+        """
+        Sets the `touched` timestamp of the given RRsets with one query, and sends the post_save signal for each of
+        them (e.g., for PDNSChangeTracker).
+        """
+        now = timezone.now()
+        self.filter(pk__in=[rrset.pk for rrset in rrsets]).update(touched=now)
+        for rrset in rrsets:
+            rrset.touched = now
+            self._send_post_save(rrset, created=False)
+
+    def _send_post_save(self, rrset, created):
+        post_save.send(
+            sender=self.model,
+            instance=rrset,
+            created=created,
+            update_fields=None,
+            raw=False,
+            using=self.db,
+        )
+
+    def bulk_write(self, created=(), updated=(), deleted=()):
+        """
+        Applies the given RRset changes with a constant number of queries, regardless of how many RRsets are involved:
+
+        - `created`: list of (RRset, records) pairs, with unsaved RRset instances,
+        - `updated`: list of (RRset, ttl, records) triples, where ttl and records may be None to keep them unchanged,
+        - `deleted`: list of RRset instances.
+
+        Records are given in presentation format and validated with `RRset.clean_records`, which raises before anything
+        is written. Afterwards, the following queries are issued (each only if needed): one SELECT for current records,
+        a constant number of queries each to delete records and RRsets, one INSERT for RRsets, one UPDATE for updated
+        RRsets, and one INSERT for records.
+
+        Django's deletion collector sends the post_delete signal for deleted records and RRsets. The post_save signal is
+        sent for created RRsets and for updated RRsets with changed TTL or records, so that PDNSChangeTracker learns
+        about all changes. Created records do not send signals. All updated RRsets are touched, even if nothing
+        changed.
+        """
+        created = [(rrset, rrset.clean_records(records)) for rrset, records in created]
+        updated = [
+            (rrset, ttl, None if records is None else rrset.clean_records(records))
+            for rrset, ttl, records in updated
+        ]
+
+        now = timezone.now()
+        existing = {}  # maps RRset pk to dict mapping contents to RR pk
+        for pk, rrset_id, content in RR.objects.filter(
+            rrset__in=[rrset for rrset, _, records in updated if records is not None]
+        ).values_list("pk", "rrset_id", "content"):
+            existing.setdefault(rrset_id, {})[content] = pk
+
+        new_rrs = [
+            RR(rrset=rrset, content=content)
+            for rrset, records in created
+            for content in records
+        ]
+        stale_rr_pks = []
+        changed = []
+        for rrset, ttl, records in updated:
+            modified = False
+            if records is not None:
+                current = existing.get(rrset.pk, {})
+                stale_rr_pks += [
+                    current[content] for content in current.keys() - records
+                ]
+                new_rrs += [
+                    RR(rrset=rrset, content=content)
+                    for content in records - current.keys()
+                ]
+                modified = current.keys() != records
+            if ttl and rrset.ttl != ttl:
+                rrset.ttl = ttl
+                modified = True
+            rrset.touched = now
+            if modified:
+                changed.append(rrset)
+
+        # Deletions go first to get any possible CNAME exclusivity collisions out of the way. Django's deletion
+        # collector fetches the objects for the post_delete signal, so RRsets and domains are prefetched to keep
+        # receivers from querying them one by one. Records of deleted RRsets are deleted along with stale records, so
+        # that nothing is left to cascade.
+        if deleted or stale_rr_pks:
+            RR.objects.filter(
+                Q(rrset__in=deleted) | Q(pk__in=stale_rr_pks)
+            ).prefetch_related("rrset__domain").delete()
+        if deleted:
+            self.filter(pk__in=[rrset.pk for rrset in deleted]).prefetch_related(
+                "domain"
+            ).delete()
+
+        # Constraints are enforced by the database, and the domain is known to exist
+        for rrset, _ in created:
+            rrset.full_clean(
+                exclude=["domain"], validate_unique=False, validate_constraints=False
+            )
+        self.bulk_create([rrset for rrset, _ in created])
+        if updated:
+            self.bulk_update([rrset for rrset, _, _ in updated], ["ttl", "touched"])
+        RR.objects.bulk_create(new_rrs, touch=False)
+
+        for rrset, _ in created:
+            self._send_post_save(rrset, created=True)
+        for rrset in changed:
+            self._send_post_save(rrset, created=False)
+
 
 class RRset(ExportModelOperationsMixin("RRset"), models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -108,6 +233,30 @@ class RRset(ExportModelOperationsMixin("RRset"), models.Model):
             ),
         ]
         unique_together = (("domain", "subname", "type"),)
+        # Keep Domain.last_active in sync with the latest `touched` timestamp of the domain's RRsets (once per statement)
+        triggers = [
+            pgtrigger.Trigger(
+                name=f"domain_last_active_{operation}".lower(),
+                level=pgtrigger.Statement,
+                operation=getattr(pgtrigger, operation),
+                when=pgtrigger.After,
+                referencing=pgtrigger.Referencing(**{transition: "transition"}),
+                func=pgtrigger.Func(
+                    """
+                    UPDATE desecapi_domain SET last_active = GREATEST(
+                        (SELECT MAX(touched) FROM {meta.db_table} WHERE domain_id = desecapi_domain.id), published
+                    ) WHERE id IN (SELECT domain_id FROM transition);
+                    RETURN NULL;
+                """
+                ),
+            )
+            # Transition tables are only available for triggers on a single operation
+            for operation, transition in [
+                ("Insert", "new"),
+                ("Update", "new"),
+                ("Delete", "old"),
+            ]
+        ]
 
     @staticmethod
     def construct_name(subname, domain_name):
@@ -221,17 +370,81 @@ class RRset(ExportModelOperationsMixin("RRset"), models.Model):
 
 
 class RRManager(Manager):
-    def bulk_create(self, rrs, **kwargs):
+    def bulk_create(self, rrs, touch=True, **kwargs):
         ret = super().bulk_create(rrs, **kwargs)
 
-        # For each rrset, save once to set RRset.updated timestamp and trigger signal for post-save processing
-        rrsets = {rr.rrset for rr in rrs}
-        for rrset in rrsets:
-            rrset.save()
+        # Touch each rrset to set RRset.touched timestamp and trigger signal for post-save processing (one UPDATE)
+        if touch and rrs:
+            RRset.objects.touch({rr.rrset for rr in rrs})
 
         return ret
 
 
+class _CanonicalFormatCache:
+    """
+    Per-process LRU cache for the outcomes of `RR.canonical_presentation_format`, holding up to
+    `settings.RR_CANONICAL_CACHE_SIZE` entries. If `settings.RR_CANONICAL_CACHE_TIMEOUT` is positive, local misses
+    are looked up in the shared cache, too. Contents longer than `settings.RR_CANONICAL_CACHE_MAX_LENGTH` are not
+    cached.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _shared_key(key):
+        type_, content = key
+        digest = sha256(f"{type_} {content}".encode()).hexdigest()
+        return f"desecapi.rr.canonical:{digest}"
+
+    def get(self, key):
+        if len(key[1]) > settings.RR_CANONICAL_CACHE_MAX_LENGTH:
+            return None
+        with self._lock:
+            outcome = self._entries.get(key)
+            if outcome is not None:
+                self._entries.move_to_end(key)
+        if outcome is not None:
+            metrics.get("desecapi_rr_canonical_cache_hit").labels("local").inc()
+            return outcome
+
+        if settings.RR_CANONICAL_CACHE_TIMEOUT > 0:
+            outcome = cache.get(self._shared_key(key))
+            if outcome is not None:
+                metrics.get("desecapi_rr_canonical_cache_hit").labels("shared").inc()
+                self._put(key, outcome)
+                return outcome
+
+        metrics.get("desecapi_rr_canonical_cache_miss").inc()
+        return None
+
+    def set(self, key, outcome):
+        if len(key[1]) > settings.RR_CANONICAL_CACHE_MAX_LENGTH:
+            return
+        self._put(key, outcome)
+        if settings.RR_CANONICAL_CACHE_TIMEOUT > 0:
+            cache.set(
+                self._shared_key(key),
+                outcome,
+                timeout=settings.RR_CANONICAL_CACHE_TIMEOUT,
+            )
+
+    def _put(self, key, outcome):
+        with self._lock:
+            self._entries[key] = outcome
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.RR_CANONICAL_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_canonical_format_cache = _CanonicalFormatCache()
+
+
 class RR(ExportModelOperationsMixin("RR"), models.Model):
     created = models.DateTimeField(auto_now_add=True)
     rrset = models.ForeignKey(RRset, on_delete=models.CASCADE, related_name="records")
@@ -255,7 +468,39 @@ class RR(ExportModelOperationsMixin("RR"), models.Model):
         """
         Converts any valid presentation format for a RR into it's canonical presentation format.
         Raises if provided presentation format is invalid.
+
+        Outcomes (canonical format or validation error) are memoized by (type, content), see `_CanonicalFormatCache`.
         """
+        key = (type_, any_presentation_format)
+        outcome = _canonical_format_cache.get(key)
+        if outcome is None:
+            try:
+                outcome = (
+                    True,
+                    RR._canonical_presentation_format(any_presentation_format, type_),
+                )
+            except (ValueError, ValidationError) as e:
+                outcome = (False, (type(e), e.args))
+            _canonical_format_cache.set(key, outcome)
+
+        success, result = outcome
+        if success:
+            return result
+        exc_type, args = result
+        raise exc_type(*args)  # fresh instance, so that tracebacks do not pile up
+
+    @staticmethod
+    def _canonical_presentation_format(any_presentation_format, type_):
+        # Common types are handled without dnspython where possible
+        fast_canonicalizer = FAST_CANONICALIZERS.get(type_)
+        if fast_canonicalizer is not None:
+            canonical = fast_canonicalizer(any_presentation_format)
+            if canonical is not None:
+                return canonical
+        return RR._canonical_presentation_format_generic(any_presentation_format, type_)
+
+    @staticmethod
+    def _canonical_presentation_format_generic(any_presentation_format, type_):
         rdtype = rdatatype.from_text(type_)
 
         try:
@@ -0,0 +1,16 @@
+from django.db import models
+
+
+class ZoneSerial(models.Model):
+    """
+    Serial of a zone as served by nsmaster, with the zone name in pdns notation (i.e., with trailing dot). Entries are
+    updated when a zone is published, and reconciled with nsmaster periodically. Entries of deleted zones are kept for
+    a while (with serial NULL), so that clients asking for changes learn about the deletion.
+    """
+
+    name = models.CharField(max_length=192, unique=True)
+    serial = models.PositiveBigIntegerField(null=True)
+    changed = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ("name",)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import ipaddress
+import itertools
 import secrets
 import uuid
 from datetime import timedelta
@@ -14,6 +15,7 @@ from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import F, Q
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django_prometheus.models import ExportModelOperationsMixin
 from netfields import CidrAddressField, NetManager
 
@@ -89,6 +91,14 @@ class Token(ExportModelOperationsMixin("Token"), rest_framework.authtoken.models
     def make_hash(plain):
         return make_password(plain, salt="static", hasher="pbkdf2_sha256_iter1")
 
+    @cached_property
+    def policy_matcher(self):
+        """
+        Token policies, loaded once per token instance (i.e. once per request for the authenticated token), see
+        `get_policy`.
+        """
+        return TokenPolicyMatcher(self.tokendomainpolicy_set.all())
+
     def get_policy(self, rrset=None):
         order_by = [
             F(field).asc(
@@ -107,6 +117,34 @@ class Token(ExportModelOperationsMixin("Token"), rest_framework.authtoken.models
         )
 
 
+class TokenPolicyMatcher:
+    """
+    In-memory form of a token's policies. `get_policy` returns the same policy as `Token.get_policy`, i.e. the most
+    specific one, where domain takes precedence over subname, and subname over type.
+    """
+
+    def __init__(self, policies):
+        self.policies = {
+            (policy.domain_id, policy.subname, policy.type): policy
+            for policy in policies
+        }
+
+    def __len__(self):
+        return len(self.policies)
+
+    def get_policy(self, rrset=None):
+        if rrset is None:
+            return self.policies.get((None, None, None))
+        # Candidates in order of precedence, from (domain, subname, type) to (None, None, None)
+        for key in itertools.product(
+            (rrset.domain_id, None), (rrset.subname, None), (rrset.type, None)
+        ):
+            policy = self.policies.get(key)
+            if policy is not None:
+                return policy
+        return None
+
+
 class TokenDomainPolicy(ExportModelOperationsMixin("TokenDomainPolicy"), models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     token = models.ForeignKey(Token, on_delete=models.CASCADE)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import uuid
+from functools import cached_property
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
@@ -82,6 +83,23 @@ class User(ExportModelOperationsMixin("User"), AbstractBaseUser):
         # Simplest possible answer: All admins are staff
         return self.is_admin
 
+    @cached_property
+    def _domains_by_qname(self):
+        return {}
+
+    def get_domain_by_qname(self, qname):
+        """
+        Returns the user's domain with the longest name covering qname, or None (see DomainManager.get_by_qname).
+        Results are memoized per user instance, i.e. per request for the authenticated user, so that authentication
+        and view do not look up the same qname twice.
+        """
+        try:
+            return self._domains_by_qname[qname]
+        except KeyError:
+            domain = self.domains.get_by_qname(qname)
+            self._domains_by_qname[qname] = domain
+            return domain
+
     @property
     def mfa_enabled(self):
         return self.basefactor_set.exclude(last_used__isnull=True).exists()
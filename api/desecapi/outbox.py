@@ -0,0 +1,71 @@
+from celery import shared_task
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from desecapi import axfr, metrics, pdns_change_tracker
+from desecapi.exceptions import PDNSException
+from desecapi.models import PDNSOutboxEntry, RRset
+
+LANE = "pdns_lane"
+
+
+def lock_zone(name):
+    """
+    Serializes pdns updates of the given zone until the end of the current transaction. Without this, an update
+    computed from an older database state could overtake a newer one.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [f"pdns:{name}"])
+
+
+def dispatch(names):
+    for name in names:
+        task.delay(name)
+
+
+def replay(name):
+    """
+    Sends all RRsets of zone `name` that have pending outbox entries to nslord, using one PATCH request no matter how
+    many entries there are. As the RRsets' current state is sent, entries that touch the same RRset are coalesced.
+    Entries created while the replay is in progress are left for the next replay.
+    """
+    pks = []
+    try:
+        with transaction.atomic():
+            lock_zone(name)
+            entries = PDNSOutboxEntry.objects.filter(domain__name=name)
+            keys = set()
+            for pk, rrsets in entries.values_list("pk", "rrsets"):
+                pks.append(pk)
+                keys |= {(type_, subname) for type_, subname in rrsets}
+            if not pks:
+                return
+            existing = set(
+                RRset.objects.filter(
+                    domain__name=name,
+                    type__in={type_ for type_, _ in keys},
+                    subname__in={subname for _, subname in keys},
+                ).values_list("type", "subname")
+            )
+            pdns_change_tracker.PDNSChangeTracker.CreateUpdateDeleteRRSets(
+                name, set(), keys & existing, keys - existing
+            ).pdns_do()
+            PDNSOutboxEntry.objects.filter(pk__in=pks).delete()
+    except PDNSException:
+        PDNSOutboxEntry.objects.filter(pk__in=pks).update(attempts=F("attempts") + 1)
+        raise
+    metrics.get("desecapi_pdns_outbox_entries_replayed").observe(len(pks))
+    axfr.schedule({name})
+
+
+task = shared_task(
+    name=LANE,
+    queue=LANE,
+    ignore_result=True,
+    autoretry_for=(PDNSException,),
+    retry_backoff=True,
+    retry_backoff_max=600,
+    max_retries=8,  # afterwards, the chores command picks up what is left
+    **settings.TASK_CONFIG[LANE],
+)(replay)
@@ -1,9 +1,8 @@
 import json
 
-import requests
 from django.conf import settings
 
-from desecapi import metrics
+from desecapi import http_client, metrics
 from desecapi.exceptions import PCHException
 
 _config = {
@@ -28,7 +27,14 @@ def _pch_request(
         "User-Agent": "desecapi",
         "Authorization": _config["token"],
     }
-    r = requests.request(method, _config["base_url"] + path, data=data, headers=headers)
+    session = http_client.get_session("pch")
+    r = session.request(
+        method,
+        _config["base_url"] + path,
+        data=data,
+        headers=headers,
+        timeout=settings.BACKEND_API_TIMEOUT,
+    )
     if r.status_code not in expect_status:
         metrics.get("desecapi_pch_request_failure").labels(
             method, path, r.status_code
@@ -46,9 +52,16 @@ def _delete(path, data, **kwargs):
     return _pch_request("delete", path=path, data=data, **kwargs)
 
 
+def _chunks(domains):
+    for i in range(0, len(domains), settings.PCH_API_CHUNK_SIZE):
+        yield domains[i : i + settings.PCH_API_CHUNK_SIZE]
+
+
 def create_domains(domains):
-    _post("/zones", {"zones": domains}, expect_status=[201])
+    for chunk in _chunks(domains):
+        _post("/zones", {"zones": chunk}, expect_status=[201])
 
 
 def delete_domains(domains):
-    _delete("/zones", {"zones": domains}, expect_status=[200])
+    for chunk in _chunks(domains):
+        _delete("/zones", {"zones": chunk}, expect_status=[200])
@@ -4,11 +4,10 @@ import socket
 from functools import cache
 from hashlib import sha1
 
-import requests
 from django.conf import settings
 from django.core.exceptions import SuspiciousOperation
 
-from desecapi import metrics
+from desecapi import http_client, metrics
 from desecapi.exceptions import PDNSException, RequestEntityTooLarge
 
 SUPPORTED_RRSET_TYPES = {
@@ -74,10 +73,12 @@ NSMASTER = object()
 
 _config = {
     NSLORD: {
+        "name": "nslord",
         "base_url": settings.NSLORD_PDNS_API,
         "apikey": settings.NSLORD_PDNS_API_TOKEN,
     },
     NSMASTER: {
+        "name": "nsmaster",
         "base_url": settings.NSMASTER_PDNS_API,
         "apikey": settings.NSMASTER_PDNS_API_TOKEN,
     },
@@ -90,7 +91,14 @@ def gethostbyname_cached(host):
 
 
 def _pdns_request(
-    method, *, server, path, data=None, accept="application/json", **kwargs
+    method,
+    *,
+    server,
+    path,
+    data=None,
+    accept="application/json",
+    stream=False,
+    **kwargs,
 ):
     if data is not None:
         data = json.dumps(data)
@@ -102,8 +110,14 @@ def _pdns_request(
         "User-Agent": "desecapi",
         "X-API-Key": _config[server]["apikey"],
     }
-    r = requests.request(
-        method, _config[server]["base_url"] + path, data=data, headers=headers
+    session = http_client.get_session(_config[server]["name"])
+    r = session.request(
+        method,
+        _config[server]["base_url"] + path,
+        data=data,
+        headers=headers,
+        timeout=settings.BACKEND_API_TIMEOUT,
+        stream=stream,
     )
     if r.status_code not in range(200, 300):
         metrics.get("desecapi_pdns_request_failure").labels(
@@ -171,15 +185,32 @@ def get_zone(domain):
     return r.json()
 
 
-def get_zonefile(domain) -> bin:
+def stream_zonefile(domain):
     """
-    Retrieves the zonefile (presentation format) of a given zone as binary string
+    Retrieves the zonefile (presentation format) of a given zone, and returns an iterator that relays it in chunks of
+    `settings.ZONEFILE_EXPORT_CHUNK_SIZE` bytes as they arrive. Errors are raised before the iterator is returned.
     """
     r = _pdns_get(
-        NSLORD, "/zones/" + pdns_id(domain.name) + "/export", accept="text/dns"
+        NSLORD,
+        "/zones/" + pdns_id(domain.name) + "/export",
+        accept="text/dns",
+        stream=True,
     )
 
-    return r.content
+    def chunks():
+        with r:
+            yield from r.iter_content(settings.ZONEFILE_EXPORT_CHUNK_SIZE)
+
+    return chunks()
+
+
+def get_edited_serial(name, server=NSLORD):
+    """
+    Retrieves the serial of a given zone (as served in query responses), without the zone's RRsets
+    """
+    r = _pdns_get(server, "/zones/" + pdns_id(name) + "?rrsets=false")
+
+    return r.json()["edited_serial"]
 
 
 def get_rrset_datas(domain):
@@ -198,20 +229,28 @@ def get_rrset_datas(domain):
     ]
 
 
-def update_catalog(zone, delete=False):
+def update_catalog(additions=(), deletions=()):
     """
-    Updates the catalog zone information (`settings.CATALOG_ZONE`) for the given zone.
+    Updates the catalog zone information (`settings.CATALOG_ZONE`) for the given added and deleted zones. Each request
+    increases the catalog's serial, so all zones are sent at once, in chunks of `settings.PDNS_CATALOG_CHUNK_SIZE`.
     """
-    content = _pdns_patch(
-        NSMASTER,
-        "/zones/" + pdns_id(settings.CATALOG_ZONE),
-        {"rrsets": [construct_catalog_rrset(zone=zone, delete=delete)]},
-    )
-    metrics.get("desecapi_pdns_catalog_updated").inc()
-    return content
+    rrsets = [construct_catalog_rrset(zone=zone) for zone in additions] + [
+        construct_catalog_rrset(zone=zone, delete=True) for zone in deletions
+    ]
+    for i in range(0, len(rrsets), settings.PDNS_CATALOG_CHUNK_SIZE):
+        _pdns_patch(
+            NSMASTER,
+            "/zones/" + pdns_id(settings.CATALOG_ZONE),
+            {"rrsets": rrsets[i : i + settings.PDNS_CATALOG_CHUNK_SIZE]},
+        )
+        metrics.get("desecapi_pdns_catalog_updated").inc()
 
 
-def create_zone_lord(name):
+def create_zone_lord(name, rrsets=()):
+    """
+    Creates the zone on nslord with SOA and default NS records. Further RRsets (pdns format, without changetype) may
+    be given to include them in the zone right away.
+    """
     name = name.rstrip(".") + "."
     _pdns_post(
         NSLORD,
@@ -238,7 +277,8 @@ def create_zone_lord(name):
                             "disabled": False,
                         }
                     ],
-                }
+                },
+                *rrsets,
             ],
         },
     )
@@ -1,10 +1,13 @@
+import operator
+from functools import partial, reduce
+
 from django.conf import settings
+from django.db.models import Q
 from django.db.models.signals import post_save, post_delete
-from django.db.transaction import atomic
-from django.utils import timezone
+from django.db.transaction import atomic, on_commit
 
-from desecapi import pch, pdns
-from desecapi.models import RRset, RR, Domain
+from desecapi import axfr, http_client, logger, outbox, pch, pdns, serials
+from desecapi.models import PDNSOutboxEntry, RRset, RR, Domain
 
 
 class PDNSChangeTracker:
@@ -36,12 +39,21 @@ class PDNSChangeTracker:
     """
 
     _active_change_trackers = 0
+    # Maximum number of (domain, type, subname) keys per query when checking RRset additions for records
+    ADDITIONS_QUERY_CHUNK_SIZE = 500
 
     class PDNSChange:
         """
         A reversible, atomic operation against the powerdns API.
         """
 
+        # Whether the change can be written to the outbox instead of being sent to pdns right away
+        deferrable = False
+        # Whether the change's pdns operations are given as stages of independent operations (see `pdns_stages`)
+        concurrent = False
+        # Whether the change affects the zone's DNSSEC key information (see `Domain.keys`)
+        keys_changed = False
+
         def __init__(self, domain_name):
             self._domain_name = domain_name
 
@@ -56,21 +68,73 @@ class PDNSChangeTracker:
         def pdns_do(self):
             raise NotImplementedError()
 
-        def api_do(self):
+        def pdns_stages(self):
+            """
+            Returns the pdns operations of this change as a list of stages, which run one after the other. Each stage
+            is a list of (do, undo) pairs of callables whose operations do not depend on each other, so that they may
+            run concurrently. `undo` compensates for `do`, or is None if there is no way to do so.
+
+            The catalog zone and PCH are updated by the change tracker, for all changes at once.
+            """
             raise NotImplementedError()
 
-        def pch_do(self):
+        def api_do(self):
             raise NotImplementedError()
 
     class CreateDomain(PDNSChange):
+        concurrent = True
+        keys_changed = True
+
         @property
         def axfr_required(self):
             return True
 
-        def pdns_do(self):
-            pdns.create_zone_lord(self.domain_name)
-            pdns.create_zone_master(self.domain_name)
-            pdns.update_catalog(self.domain_name)
+        def _rrsets(self):
+            """
+            Returns the domain's RRsets (except apex NS, which nslord sets up itself) in pdns format, so that they are
+            part of the zone from the start. All RRsets are fetched with one query.
+            """
+            contents = {}
+            rows = (
+                RRset.objects.filter(
+                    domain__name=self.domain_name, records__isnull=False
+                )
+                .exclude(type="NS", subname="")
+                .values_list("type", "subname", "ttl", "records__content")
+            )
+            for type_, subname, ttl, content in rows:
+                contents.setdefault((type_, subname, ttl), []).append(content)
+            return [
+                {
+                    "name": RRset.construct_name(subname, self.domain_name),
+                    "type": type_,
+                    "ttl": ttl,
+                    "records": [
+                        {"content": content, "disabled": False} for content in records
+                    ],
+                }
+                for (type_, subname, ttl), records in contents.items()
+            ]
+
+        def pdns_stages(self):
+            name = self.domain_name
+            # Database access is not allowed in the concurrently running operations, so RRsets are loaded here
+            rrsets = self._rrsets()
+            # nslord rejects conflicting zones, so nothing must be touched on nsmaster before it has accepted the zone
+            return [
+                [
+                    (
+                        partial(pdns.create_zone_lord, name, rrsets),
+                        partial(pdns.delete_zone_lord, name),
+                    )
+                ],
+                [
+                    (
+                        partial(pdns.create_zone_master, name),
+                        partial(pdns.delete_zone_master, name),
+                    ),
+                ],
+            ]
 
         def api_do(self):
             rr_set = RRset(
@@ -84,32 +148,36 @@ class PDNSChangeTracker:
             rrs = [RR(rrset=rr_set, content=ns) for ns in settings.DEFAULT_NS]
             RR.objects.bulk_create(rrs)  # One INSERT
 
-        def pch_do(self):
-            pch.create_domains([self.domain_name])
-
         def __str__(self):
             return "Create Domain %s" % self.domain_name
 
     class DeleteDomain(PDNSChange):
+        concurrent = True
+        keys_changed = True
+
         @property
         def axfr_required(self):
             return False
 
-        def pdns_do(self):
-            pdns.delete_zone_lord(self.domain_name)
-            pdns.delete_zone_master(self.domain_name)
-            pdns.update_catalog(self.domain_name, delete=True)
+        def pdns_stages(self):
+            name = self.domain_name
+            # Deleted zones cannot be restored (their keys are gone), so there is no compensation
+            return [
+                [
+                    (partial(pdns.delete_zone_lord, name), None),
+                    (partial(pdns.delete_zone_master, name), None),
+                ],
+            ]
 
         def api_do(self):
             pass
 
-        def pch_do(self):
-            pch.delete_domains([self.domain_name])
-
         def __str__(self):
             return "Delete Domain %s" % self.domain_name
 
     class CreateUpdateDeleteRRSets(PDNSChange):
+        deferrable = True
+
         def __init__(self, domain_name, additions, modifications, deletions):
             super().__init__(domain_name)
             self._additions = additions
@@ -120,7 +188,42 @@ class PDNSChangeTracker:
         def axfr_required(self):
             return True
 
+        @property
+        def keys_changed(self):
+            return ("DNSKEY", "") in (
+                self._additions | self._modifications | self._deletions
+            )
+
+        def _rrset_contents(self, keys):
+            """
+            Returns a dict mapping (type, subname) to (ttl, list of record contents) for the given RRsets of this
+            domain. All RRsets are fetched with one query, regardless of how many are requested.
+            """
+            contents = {}
+            if not keys:
+                return contents
+            rows = RRset.objects.filter(
+                domain__name=self._domain_name,
+                type__in={type_ for type_, _ in keys},
+                subname__in={subname for _, subname in keys},
+            ).values_list("type", "subname", "ttl", "records__content")
+            for type_, subname, ttl, content in rows:
+                if (type_, subname) not in keys:
+                    continue  # cross product of requested types and subnames
+                _, records = contents.setdefault((type_, subname), (ttl, []))
+                if content is not None:  # no records (LEFT OUTER JOIN)
+                    records.append(content)
+            missing = keys - contents.keys()
+            if missing:
+                raise RRset.DoesNotExist(
+                    f"RRset(s) {sorted(missing)} of {self._domain_name} do(es) not exist."
+                )
+            return contents
+
         def pdns_do(self):
+            contents = self._rrset_contents(
+                (self._additions | self._modifications) - self._deletions
+            )
             data = {
                 "rrsets": [
                     {
@@ -136,31 +239,27 @@ class PDNSChangeTracker:
                     {
                         "name": RRset.construct_name(subname, self._domain_name),
                         "type": type_,
-                        "ttl": RRset.objects.values_list("ttl", flat=True).get(
-                            domain__name=self._domain_name, type=type_, subname=subname
-                        ),
+                        "ttl": ttl,
                         "changetype": "REPLACE",
                         "records": [
-                            {"content": rr.content, "disabled": False}
-                            for rr in RR.objects.filter(
-                                rrset__domain__name=self._domain_name,
-                                rrset__type=type_,
-                                rrset__subname=subname,
-                            )
+                            {"content": content, "disabled": False}
+                            for content in records
                         ],
                     }
-                    for type_, subname in (self._additions | self._modifications)
-                    - self._deletions
+                    for (type_, subname), (ttl, records) in contents.items()
                 ]
             }
 
             if data["rrsets"]:
                 pdns.update_zone(self.domain_name, data)
 
-        def api_do(self):
-            pass
+        def defer(self):
+            PDNSOutboxEntry.objects.create(
+                domain=Domain.objects.get(name=self.domain_name),
+                rrsets=sorted(self._additions | self._modifications | self._deletions),
+            )
 
-        def pch_do(self):
+        def api_do(self):
             pass
 
         def __str__(self):
@@ -174,7 +273,14 @@ class PDNSChangeTracker:
                 )
             )
 
-    def __init__(self):
+    def __init__(self, synchronous=None):
+        """
+        :param synchronous: If False, RRset changes are written to the outbox and sent to pdns in the background after
+        the transaction is committed. Defaults to `not settings.PDNS_PROPAGATION_ASYNC`.
+        """
+        if synchronous is None:
+            synchronous = not settings.PDNS_PROPAGATION_ASYNC
+        self.synchronous = synchronous
         self._domain_additions = set()
         self._domain_deletions = set()
         self._rr_set_additions = {}
@@ -228,6 +334,41 @@ class PDNSChangeTracker:
         self.transaction = atomic()
         self.transaction.__enter__()
 
+    @staticmethod
+    def _fan_out(stages_per_change):
+        """
+        Runs the pdns operations given by several changes' `pdns_stages`. The n-th stages of all changes run
+        concurrently, before any (n+1)-th stage. If an operation fails, the successful ones are undone, and the first
+        exception is raised. Otherwise, returns a function that undoes all of them.
+        """
+        undos = []
+
+        def compensate():
+            for undo, outcome in zip(undos, http_client.map_concurrently(undos)):
+                if isinstance(outcome, Exception):
+                    logger.error(
+                        f"Compensating pdns operation {undo} failed: {outcome}"
+                    )
+
+        for n in range(max(map(len, stages_per_change), default=0)):
+            legs = [
+                leg
+                for stages in stages_per_change
+                if n < len(stages)
+                for leg in stages[n]
+            ]
+            outcomes = http_client.map_concurrently(do for do, _ in legs)
+            undos += [
+                undo
+                for (_, undo), outcome in zip(legs, outcomes)
+                if undo is not None and not isinstance(outcome, Exception)
+            ]
+            errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+            if errors:
+                compensate()
+                raise errors[0]
+        return compensate
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         PDNSChangeTracker._active_change_trackers -= 1
         self._manage_signals("disconnect")
@@ -240,15 +381,53 @@ class PDNSChangeTracker:
         # TODO introduce two phase commit protocol
         changes = self._compute_changes()
         axfr_required = set()
+        deferred = set()
+        created = [c.domain_name for c in changes if isinstance(c, self.CreateDomain)]
+        deleted = [c.domain_name for c in changes if isinstance(c, self.DeleteDomain)]
+        # Zone creations and deletions are independent of each other, so their pdns operations run concurrently. The
+        # catalog zone and PCH are updated for all of them at once, after nslord has accepted the new zones.
+        batch_legs = [
+            (
+                partial(pdns.update_catalog, created, deleted),
+                partial(pdns.update_catalog, deletions=created),
+            )
+        ]
+        if settings.PCH_API and not settings.DEBUG:
+            batch_legs += [
+                (
+                    partial(pch.create_domains, created),
+                    partial(pch.delete_domains, created),
+                ),
+                (partial(pch.delete_domains, deleted), None),
+            ]
+        try:
+            compensate = self._fan_out(
+                [change.pdns_stages() for change in changes if change.concurrent]
+                + ([[[], batch_legs]] if created or deleted else [])
+            )
+        except Exception as e:
+            self.transaction.__exit__(type(e), e, e.__traceback__)
+            exc = ValueError(
+                f"For changes {list(map(str, changes))}, {type(e)} occurred during zone creation/deletion: {str(e)}"
+            )
+            raise exc from e
+
         for change in changes:
             try:
-                change.pdns_do()
+                if change.deferrable and not self.synchronous:
+                    change.defer()
+                    deferred.add(change.domain_name)
+                    continue
+                if change.deferrable and settings.PDNS_PROPAGATION_ASYNC:
+                    # don't race with outbox replays of the same zone
+                    outbox.lock_zone(change.domain_name)
+                if not change.concurrent:  # otherwise, pdns operations are done already
+                    change.pdns_do()
                 change.api_do()
-                if settings.PCH_API and not settings.DEBUG:
-                    change.pch_do()
                 if change.axfr_required:
                     axfr_required.add(change.domain_name)
             except Exception as e:
+                compensate()
                 self.transaction.__exit__(type(e), e, e.__traceback__)
                 exc = ValueError(
                     f"For changes {list(map(str, changes))}, {type(e)} occurred during {change}: {str(e)}"
@@ -257,9 +436,39 @@ class PDNSChangeTracker:
 
         self.transaction.__exit__(None, None, None)
 
-        for name in axfr_required:
-            pdns.axfr_to_master(name)
-        Domain.objects.filter(name__in=axfr_required).update(published=timezone.now())
+        Domain.invalidate_keys(c.domain_name for c in changes if c.keys_changed)
+        # We may be inside an outer transaction (e.g., when scavenging unused domains). Deletions must only show up in
+        # the serial index, and replays only see outbox entries, once that has committed as well.
+        on_commit(partial(serials.update, {name: None for name in deleted}))
+        on_commit(partial(outbox.dispatch, deferred))
+        axfr.schedule(axfr_required)
+
+    def _nonempty_rr_set_additions(self):
+        """
+        Returns the set of (domain name, type, subname) of added RR sets that have at least one RR. Looks up the exact
+        keys of all additions of all tracked domains, using one query per ADDITIONS_QUERY_CHUNK_SIZE additions.
+        """
+        additions = sorted(
+            (domain_name, type_, subname)
+            for domain_name, items in self._rr_set_additions.items()
+            for type_, subname in items
+        )
+        nonempty = set()
+        for i in range(0, len(additions), self.ADDITIONS_QUERY_CHUNK_SIZE):
+            keys = additions[i : i + self.ADDITIONS_QUERY_CHUNK_SIZE]
+            q = reduce(
+                operator.or_,
+                (
+                    Q(domain__name=domain_name, type=type_, subname=subname)
+                    for domain_name, type_, subname in keys
+                ),
+            )
+            nonempty.update(
+                RRset.objects.filter(q, records__isnull=False)
+                .values_list("domain__name", "type", "subname")
+                .distinct()
+            )
+        return nonempty
 
     def _compute_changes(self):
         changes = []
@@ -272,10 +481,16 @@ class PDNSChangeTracker:
 
             changes.append(PDNSChangeTracker.DeleteDomain(domain_name))
 
-        for domain_name in self._rr_set_additions.keys() | self._domain_additions:
-            if domain_name in self._domain_additions:
-                changes.append(PDNSChangeTracker.CreateDomain(domain_name))
+        for domain_name in self._domain_additions:
+            # RRsets of new domains are included in zone creation, so no separate RRset change is needed
+            self._rr_set_additions.pop(domain_name, None)
+            self._rr_set_modifications.pop(domain_name, None)
+            self._rr_set_deletions.pop(domain_name, None)
+
+            changes.append(PDNSChangeTracker.CreateDomain(domain_name))
 
+        nonempty_additions = self._nonempty_rr_set_additions()
+        for domain_name in self._rr_set_additions.keys():
             additions = self._rr_set_additions.get(domain_name, set())
             modifications = self._rr_set_modifications.get(domain_name, set())
             deletions = self._rr_set_deletions.get(domain_name, set())
@@ -296,14 +511,10 @@ class PDNSChangeTracker:
 
             # Conditions (b) and (c) are already covered in the modifications and deletions list,
             # we filter the additions list to remove newly-added, but empty RR sets
-            additions -= {
+            additions = {
                 (type_, subname)
                 for (type_, subname) in additions
-                if not RR.objects.filter(
-                    rrset__domain__name=domain_name,
-                    rrset__type=type_,
-                    rrset__subname=subname,
-                ).exists()
+                if (domain_name, type_, subname) in nonempty_additions
             }
 
             if additions | modifications | deletions:
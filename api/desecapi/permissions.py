@@ -94,7 +94,7 @@ class TokenHasRRsetPermission(permissions.BasePermission):
     message = "Insufficient token permissions."
 
     def has_object_permission(self, request, view, obj):
-        policy = request.auth.get_policy(obj)
+        policy = request.auth.policy_matcher.get_policy(obj)
 
         # Pass if there's no policy, otherwise return the permission
         return (policy is None) or policy.perm_write
@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+
+import psl_dns
+from django.conf import settings
+from dns.exception import Timeout
+from dns.resolver import NoNameservers
+
+from desecapi import logger, metrics
+
+# Trie node keys that cannot clash with labels (labels never contain dots)
+RULE, EXCEPTION = ".rule", ".exception"
+
+
+def parse(text):
+    """
+    Returns the set of rules contained in the given Public Suffix List text. Comments and blank lines are skipped,
+    and rules are lowercased and IDNA-encoded, so that they can be matched against domain names as stored.
+    """
+    rules = set()
+    for line in text.splitlines():
+        rule = next(iter(line.split()), "")
+        if not rule or rule.startswith("//"):
+            continue
+        prefix = "!" if rule.startswith("!") else ""
+        try:
+            rules.add(prefix + rule.lstrip("!").lower().encode("idna").decode())
+        except UnicodeError:
+            logger.warning(f"Skipping invalid Public Suffix List rule {rule}")
+    return rules
+
+
+class PublicSuffixTrie:
+    """
+    Compiled Public Suffix List. Rules are stored in a trie of nested dicts keyed by labels from right to left, so that
+    a lookup walks the labels of a domain name once. Wildcard and exception rules follow the PSL algorithm, and the
+    implicit "*" rule makes the TLD the public suffix if no rule matches.
+    """
+
+    def __init__(self, rules):
+        self.root = {}
+        for rule in rules:
+            kind = EXCEPTION if rule.startswith("!") else RULE
+            node = self.root
+            for label in reversed(rule.lstrip("!").split(".")):
+                node = node.setdefault(label, {})
+            node[kind] = True
+
+    def get_public_suffix(self, name):
+        labels = name.lower().rstrip(".").split(".")
+        length, exception = 1, None
+        nodes = [self.root]
+        for depth, label in enumerate(reversed(labels), start=1):
+            nodes = [
+                child
+                for node in nodes
+                for child in (node.get(label), node.get("*"))
+                if child is not None
+            ]
+            if not nodes:
+                break
+            if any(RULE in node for node in nodes):
+                length = depth
+            if exception is None and any(EXCEPTION in node for node in nodes):
+                exception = depth - 1
+        if exception is not None:
+            length = exception
+        return ".".join(labels[-length:])
+
+    def is_public_suffix(self, name):
+        return name.lower().rstrip(".") == self.get_public_suffix(name)
+
+
+class PublicSuffixList:
+    """
+    Public Suffix List lookups against a trie compiled from the snapshot at settings.PSL_SNAPSHOT, merged with
+    settings.LOCAL_PUBLIC_SUFFIXES. The snapshot's modification time is checked every settings.PSL_REFRESH_INTERVAL
+    seconds; if it changed, a new trie is compiled in a background thread and swapped in once complete, while lookups
+    continue to use the previous one.
+
+    If no snapshot is available, lookups fall back to querying the PSL via DNS. With settings.PSL_VERIFY, DNS lookups
+    are performed in addition to verify the local result, and mismatches are logged.
+    """
+
+    def __init__(self, resolver=None, timeout=0.5):
+        self.dns = psl_dns.PSL(resolver=resolver, timeout=timeout)
+        self._lock = threading.Lock()
+        # (snapshot modification time or None, local public suffixes, trie or None), replaced as a whole
+        self._state = None
+        self._checked = 0
+
+    def _compile(self):
+        local_public_suffixes = frozenset(settings.LOCAL_PUBLIC_SUFFIXES)
+        try:
+            mtime = os.stat(settings.PSL_SNAPSHOT).st_mtime
+            with open(settings.PSL_SNAPSHOT, encoding="utf-8") as f:
+                rules = parse(f.read())
+        except OSError as e:
+            logger.warning(f"Public Suffix List snapshot not available: {e}")
+            return None, local_public_suffixes, None
+        metrics.get("desecapi_psl_compiled").inc()
+        trie = PublicSuffixTrie(rules | local_public_suffixes)
+        return mtime, local_public_suffixes, trie
+
+    def _refresh(self):
+        try:
+            self._state = self._compile()
+        finally:
+            self._lock.release()
+
+    def get_trie(self):
+        """
+        Returns the current trie (None if no snapshot is available), compiling it on first use and triggering a
+        background refresh if the snapshot changed.
+        """
+        state = self._state
+        if state is None or state[1] != frozenset(settings.LOCAL_PUBLIC_SUFFIXES):
+            with self._lock:
+                self._state = state = self._compile()
+                self._checked = time.monotonic()
+        elif time.monotonic() - self._checked > settings.PSL_REFRESH_INTERVAL:
+            self._checked = time.monotonic()
+            try:
+                stale = os.stat(settings.PSL_SNAPSHOT).st_mtime != state[0]
+            except OSError:
+                stale = False  # keep the last snapshot we were able to read
+            if stale and self._lock.acquire(blocking=False):
+                threading.Thread(target=self._refresh, daemon=True).start()
+        return state[2]
+
+    def _get_public_suffix_dns(self, name):
+        try:
+            public_suffix = self.dns.get_public_suffix(name)
+            is_public_suffix = self.dns.is_public_suffix(name)
+        except (Timeout, NoNameservers):
+            public_suffix = name.rpartition(".")[2]
+            is_public_suffix = "." not in name  # TLDs are public suffixes
+
+        if is_public_suffix:
+            return public_suffix
+
+        # Take into account that any of the parent domains could be a local public suffix. To that
+        # end, identify the longest local public suffix that is actually a suffix of domain_name.
+        for local_public_suffix in settings.LOCAL_PUBLIC_SUFFIXES:
+            has_local_public_suffix_parent = ("." + name).endswith(
+                "." + local_public_suffix
+            )
+            if has_local_public_suffix_parent and len(local_public_suffix) > len(
+                public_suffix
+            ):
+                public_suffix = local_public_suffix
+
+        return public_suffix
+
+    def _verify(self, name, public_suffix):
+        try:
+            expected = self.dns.get_public_suffix(name)
+        except (Timeout, NoNameservers):
+            return
+        # Local public suffixes are not known to the DNS-backed PSL
+        if (
+            expected != public_suffix
+            and public_suffix not in settings.LOCAL_PUBLIC_SUFFIXES
+        ):
+            metrics.get("desecapi_psl_mismatch").inc()
+            logger.warning(
+                f"Public suffix of {name} is {public_suffix} locally, but {expected} via DNS"
+            )
+
+    def get_public_suffix(self, name):
+        trie = self.get_trie()
+        if trie is None:
+            return self._get_public_suffix_dns(name)
+        public_suffix = trie.get_public_suffix(name)
+        if settings.PSL_VERIFY:
+            self._verify(name, public_suffix)
+        return public_suffix
+
+    def is_public_suffix(self, name):
+        return name == self.get_public_suffix(name)
@@ -24,3 +24,24 @@ class PlainTextRenderer(renderers.BaseRenderer):
                 return yaml.safe_dump(data, default_flow_style=False)
 
         return data
+
+
+class SerialListTextRenderer(renderers.BaseRenderer):
+    """
+    Compact encoding of zone serials: one line per zone, containing the zone name and the serial ("-" for deleted zones)
+    """
+
+    media_type = "text/plain"
+    format = "txt"
+
+    def render(self, data, media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        response = renderer_context.get("response")
+
+        if response and response.exception:
+            return json.dumps(data)
+
+        return "".join(
+            f"{name} {'-' if serial is None else serial}\n"
+            for name, serial in data.items()
+        )
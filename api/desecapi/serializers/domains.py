@@ -10,11 +10,15 @@ from .records import RRsetSerializer
 
 
 class DomainSerializer(serializers.ModelSerializer):
+    # Number of RRsets validated and written at once during zonefile import
+    IMPORT_CHUNK_SIZE = 1000
+
     default_error_messages = {
         **serializers.Serializer.default_error_messages,
         "name_unavailable": "This domain name conflicts with an existing zone, or is disallowed by policy.",
     }
     zonefile = serializers.CharField(write_only=True, required=False, allow_blank=True)
+    touched = serializers.DateTimeField(source="last_active", read_only=True)
 
     class Meta:
         model = Domain
@@ -107,66 +111,81 @@ class DomainSerializer(serializers.ModelSerializer):
         domain: Domain = super().create(validated_data)
 
         # save RRsets if zonefile was given
-        nodes = getattr(self.import_zone, "nodes", None)
-        if nodes:
-            zone_name = dns.name.from_text(validated_data["name"])
-            min_ttl, max_ttl = domain.minimum_ttl, settings.MAXIMUM_TTL
-            data = [
-                {
-                    "type": dns.rdatatype.to_text(rrset.rdtype),
-                    "ttl": max(min_ttl, min(max_ttl, rrset.ttl)),
-                    "subname": (owner_name - zone_name).to_text()
-                    if owner_name - zone_name != dns.name.empty
-                    else "",
-                    "records": [rr.to_text() for rr in rrset],
-                }
-                for owner_name, node in nodes.items()
-                for rrset in node.rdatasets
-                if (
-                    dns.rdatatype.to_text(rrset.rdtype)
-                    not in (
-                        RR_SET_TYPES_AUTOMATIC
-                        | {  # do not import automatically managed record types
-                            "CDS",
-                            "CDNSKEY",
-                            "DNSKEY",
-                        }  # do not import these, as this would likely be unexpected
-                    )
-                    and not (
-                        owner_name - zone_name == dns.name.empty
-                        and rrset.rdtype == dns.rdatatype.NS
-                    )  # ignore apex NS
-                )
-            ]
+        if self.import_zone is not None:
+            self.import_rrsets(domain)
 
+        return domain
+
+    def iter_import_chunks(self, domain: Domain):
+        """
+        Yields the RRsets of the parsed zonefile in RRsetSerializer data format, in lists of about IMPORT_CHUNK_SIZE
+        RRsets. All RRsets of a node end up in the same chunk, so that validation across RRsets of the same subname
+        (such as CNAME exclusivity) is complete within each chunk.
+        """
+        zone_name = dns.name.from_text(domain.name)
+        min_ttl, max_ttl = domain.minimum_ttl, settings.MAXIMUM_TTL
+        # do not import automatically managed record types, and do not import CDS, CDNSKEY, DNSKEY, as this would
+        # likely be unexpected
+        excluded_types = RR_SET_TYPES_AUTOMATIC | {"CDS", "CDNSKEY", "DNSKEY"}
+        chunk = []
+        for owner_name, node in self.import_zone.nodes.items():
+            relative_name = owner_name - zone_name
+            subname = relative_name.to_text() if relative_name != dns.name.empty else ""
+            for rrset in node.rdatasets:
+                type_ = dns.rdatatype.to_text(rrset.rdtype)
+                if type_ in excluded_types or (subname == "" and type_ == "NS"):
+                    continue  # also ignore apex NS
+                chunk.append(
+                    {
+                        "type": type_,
+                        "ttl": max(min_ttl, min(max_ttl, rrset.ttl)),
+                        "subname": subname,
+                        "records": [rr.to_text() for rr in rrset],
+                    }
+                )
+            if len(chunk) >= self.IMPORT_CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def import_rrsets(self, domain: Domain):
+        """
+        Validates and saves the RRsets of the parsed zonefile chunk by chunk, with a constant number of queries per
+        chunk. RRsets are written in bulk for each chunk, and are sent to nslord as part of zone creation (see
+        PDNSChangeTracker.CreateDomain). Validation continues after errors so that all of them can be reported, but
+        nothing is written any more.
+        """
+
+        def fqdn(item):
+            return (item["subname"] + "." + domain.name).lstrip(".")
+
+        errors = []
+        context = dict(self.context, domain=domain)
+        for data in self.iter_import_chunks(domain):
             rrset_list_serializer = RRsetSerializer(
-                data=data, context=dict(self.context, domain=domain), many=True
+                data=data, context=context, many=True
             )
-            # The following line raises if data passed validation by dnspython during zone file parsing,
-            # but is rejected by validation in RRsetSerializer. See also
-            # test_create_domain_zonefile_import_validation
-            try:
-                rrset_list_serializer.is_valid(raise_exception=True)
-            except serializers.ValidationError as e:
-                if isinstance(e.detail, serializers.ReturnList):
-                    # match the order of error messages with the RRsets provided to the
-                    # serializer to make sense to the client
-                    def fqdn(idx):
-                        return (data[idx]["subname"] + "." + domain.name).lstrip(".")
-
-                    raise serializers.ValidationError(
-                        {
-                            "zonefile": [
-                                f"{fqdn(idx)}/{data[idx]['type']}: {err}"
-                                for idx, d in enumerate(e.detail)
-                                for _, errs in d.items()
-                                for err in errs
-                            ]
-                        }
-                    )
-
-                raise e
-
-            rrset_list_serializer.save()
-
-        return domain
+            # Data may pass validation by dnspython during zone file parsing, but be rejected by validation in
+            # RRsetSerializer. See also test_create_domain_zonefile_import_validation
+            if not rrset_list_serializer.is_valid():
+                if not isinstance(rrset_list_serializer.errors, list):
+                    raise serializers.ValidationError(rrset_list_serializer.errors)
+                # match the order of error messages with the RRsets provided to the serializer to make sense to the
+                # client
+                errors += [
+                    f"{fqdn(item)}/{item['type']}: {err}"
+                    for item, item_errors in zip(data, rrset_list_serializer.errors)
+                    for errs in item_errors.values()
+                    for err in errs
+                ]
+            if errors:
+                continue
+            RRsetSerializer.bulk_write(
+                created=[
+                    dict(item, domain=domain)
+                    for item in rrset_list_serializer.validated_data
+                ]
+            )
+        if errors:
+            raise serializers.ValidationError({"zonefile": errors})
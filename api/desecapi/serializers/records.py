@@ -1,18 +1,14 @@
-import copy
-
 import django.core.exceptions
 import dns.name
 import dns.zone
 from django.core.validators import MinValueValidator
-from django.db.models import F, Q
-from django.utils import timezone
-from netfields.functions import Masklen
+from django.utils.functional import cached_property
+from django.db.models import Q
 from rest_framework import serializers
 from rest_framework.settings import api_settings
-from rest_framework.validators import UniqueTogetherValidator
 
 from api import settings
-from desecapi import metrics, models, validators
+from desecapi import blocked_subnets, metrics, models, validators
 
 
 class ConditionalExistenceModelSerializer(serializers.ModelSerializer):
@@ -121,25 +117,37 @@ class RRsetListSerializer(serializers.ListSerializer):
     def _key(data_item):
         return data_item.get("subname"), data_item.get("type")
 
+    @cached_property
+    def rrset_index(self):
+        """
+        Index of the domain's RRsets in the database, mapping each subname to the set of types present. It is loaded
+        with one query and used for validating all items, see also `validators.UniqueRRsetValidator`.
+        """
+        index = {}
+        for subname, type_ in self.child.domain.rrset_set.values_list(
+            "subname", "type"
+        ):
+            index.setdefault(subname, set()).add(type_)
+        return index
+
     @staticmethod
-    def _types_by_position_string(conflicting_indices_by_type):
-        types_by_position = {}
-        for type_, conflict_positions in conflicting_indices_by_type.items():
-            for position in conflict_positions:
-                types_by_position.setdefault(position, []).append(type_)
-        # Sort by position, None at the end
-        types_by_position = dict(
-            sorted(types_by_position.items(), key=lambda x: (x[0] is None, x))
+    def _types_by_position_string(types_by_position):
+        """
+        Formats a list of (position, type) pairs, ordered by position with position None ("database") last.
+        """
+        types_by_position = sorted(
+            types_by_position, key=lambda x: (x[0] is None, x[0] or 0, x[1])
+        )
+        groups = []
+        for position, type_ in types_by_position:
+            if groups and groups[-1][0] == position:
+                groups[-1][1].append(type_)
+            else:
+                groups.append((position, [type_]))
+        return ", ".join(
+            f"{'database' if position is None else position} ({', '.join(types)})"
+            for position, types in groups
         )
-        db_conflicts = types_by_position.pop(None, None)
-        if db_conflicts:
-            types_by_position["database"] = db_conflicts
-        for position, types in types_by_position.items():
-            types_by_position[position] = ", ".join(sorted(types))
-        types_by_position = [
-            f"{position} ({types})" for position, types in types_by_position.items()
-        ]
-        return ", ".join(types_by_position)
 
     def to_internal_value(self, data):
         if not isinstance(data, list):
@@ -165,7 +173,7 @@ class RRsetListSerializer(serializers.ListSerializer):
             known_instances = {}
 
         errors = [{} for _ in data]
-        indices = {}
+        positions = {}
         for idx, item in enumerate(data):
             # Validate data types before using anything from it
             if not isinstance(item, dict):
@@ -187,24 +195,31 @@ class RRsetListSerializer(serializers.ListSerializer):
             if errors[idx]:
                 continue
 
-            # Construct an index of the RRsets in `data` by `s` and `t`. As (subname, type) may be given multiple times
-            # (although invalid), we make indices[s][t] a set to properly keep track. We also check and record RRsets
-            # which are known in the database (once per subname), using index `None` (for checking CNAME exclusivity).
-            if s not in indices:
-                types = self.child.domain.rrset_set.filter(subname=s).values_list(
-                    "type", flat=True
-                )
-                indices[s] = {type_: {None} for type_ in types}
-            items = indices[s].setdefault(t, set())
-            items.add(idx)
-
-        collapsed_indices = copy.deepcopy(indices)
-        for idx, item in enumerate(data):
-            if errors[idx]:
-                continue
-            if item.get("records") == []:
-                s, t = self._key(item)
-                collapsed_indices[s][t] -= {idx, None}
+            # Record the positions of RRsets in `data` by `s` and `t`. As (subname, type) may be given multiple times
+            # (although invalid), we keep a list of positions.
+            positions.setdefault((s, t), []).append(idx)
+
+        # For checking CNAME exclusivity, collect the RRsets that will be present after the request for each subname,
+        # as (position, type) pairs in two groups: non-CNAME types first, CNAME second. RRsets known in the database
+        # are included with position None, unless they are deleted by the request.
+        present = {}
+        for (s, t), key_positions in positions.items():
+            db_types = self.rrset_index.get(s, ())
+            groups = present.get(s)
+            if groups is None:
+                groups = present[s] = ([], [])
+                for type_ in db_types:
+                    if (s, type_) not in positions:
+                        groups[type_ == "CNAME"].append((None, type_))
+            deleted = False
+            for idx in key_positions:
+                if data[idx].get("records") == []:
+                    deleted = True
+                else:
+                    groups[t == "CNAME"].append((idx, t))
+            if t in db_types and not deleted:
+                groups[t == "CNAME"].append((None, t))
+        conflicts = {}  # conflict descriptions, computed once per subname and group
 
         # Iterate over all rows in the data given
         ret = []
@@ -214,28 +229,26 @@ class RRsetListSerializer(serializers.ListSerializer):
             try:
                 # see if other rows have the same key
                 s, t = self._key(item)
-                data_indices = indices[s][t] - {None}
-                if len(data_indices) > 1:
+                key_positions = positions[s, t]
+                if len(key_positions) > 1:
                     raise serializers.ValidationError(
                         {
                             api_settings.NON_FIELD_ERRORS_KEY: [
                                 "Same subname and type as in position(s) %s, but must be unique."
-                                % ", ".join(map(str, data_indices - {idx}))
+                                % ", ".join(str(i) for i in key_positions if i != idx)
                             ]
                         }
                     )
 
                 # see if other rows violate CNAME exclusivity
                 if item.get("records") != []:
-                    conflicting_indices_by_type = {
-                        k: v
-                        for k, v in collapsed_indices[s].items()
-                        if (k == "CNAME") != (t == "CNAME")
-                    }
-                    if any(conflicting_indices_by_type.values()):
-                        types_by_position = self._types_by_position_string(
-                            conflicting_indices_by_type
-                        )
+                    group = t != "CNAME"  # the group of types conflicting with t
+                    if present[s][group]:
+                        if (s, group) not in conflicts:
+                            conflicts[s, group] = self._types_by_position_string(
+                                present[s][group]
+                            )
+                        types_by_position = conflicts[s, group]
                         raise serializers.ValidationError(
                             {
                                 api_settings.NON_FIELD_ERRORS_KEY: [
@@ -333,26 +346,14 @@ class RRsetListSerializer(serializers.ListSerializer):
         updated = known & nonempty
         deleted = known & empty
 
-        ret = []
-
         # The above algorithm makes sure that created, updated, and deleted are disjoint. Thus, no "override cases"
         # (such as: an RRset should be updated and delete, what should be applied last?) need to be considered.
-        # We apply deletion first to get any possible CNAME exclusivity collisions out of the way.
-        for subname, type_ in deleted:
-            instance_index[(subname, type_)].delete()
-
-        for subname, type_ in created:
-            ret.append(self.child.create(validated_data=data_index[(subname, type_)]))
-
-        for subname, type_ in updated:
-            ret.append(
-                self.child.update(
-                    instance=instance_index[(subname, type_)],
-                    validated_data=data_index[(subname, type_)],
-                )
-            )
-
-        return ret
+        # All changes are written at once (deletions first, see `RRsetManager.bulk_write`).
+        return self.child.bulk_write(
+            created=[data_index[key] for key in created],
+            updated=[(instance_index[key], data_index[key]) for key in updated],
+            deleted=[instance_index[key] for key in deleted],
+        )
 
     def save(self, **kwargs):
         kwargs.setdefault("domain", self.child.domain)
@@ -401,7 +402,7 @@ class RRsetSerializer(ConditionalExistenceModelSerializer):
     def get_validators(self):
         return [
             validators.PermissionValidator(),
-            UniqueTogetherValidator(
+            validators.UniqueRRsetValidator(
                 self.domain.rrset_set,
                 ("subname", "type"),
                 message="Another RRset with the same subdomain and type exists for this domain.",
@@ -491,20 +492,22 @@ class RRsetSerializer(ConditionalExistenceModelSerializer):
             )
         return attrs
 
+    @cached_property
+    def _blocked_subnet_index(self):
+        return blocked_subnets.get_index()
+
     def _validate_blocked_content(self, attrs, type_):
         # Reject IP addresses from blocked IP ranges
         if type_ == "A" and self.domain.is_locally_registrable:
-            qs = models.BlockedSubnet.objects.values_list("subnet", flat=True).order_by(
-                Masklen(F("subnet")).desc()
-            )
-            for record in attrs["records"]:
-                subnet = qs.filter(subnet__net_contains=record["content"]).first()
+            contents = [record["content"] for record in attrs["records"]]
+            subnets = self._blocked_subnet_index.lookup_all(contents)
+            for content, subnet in zip(contents, subnets):
                 if subnet:
                     metrics.get(
                         "desecapi_records_serializer_validate_blocked_subnet"
                     ).labels(str(subnet)).inc()
                     raise serializers.ValidationError(
-                        f"IP address {record['content']} not allowed."
+                        f"IP address {content} not allowed."
                     )
         return attrs
 
@@ -526,40 +529,45 @@ class RRsetSerializer(ConditionalExistenceModelSerializer):
             return bool(arg.get("records")) if "records" in arg.keys() else True
 
     def create(self, validated_data):
-        rrs_data = validated_data.pop("records")
-        rrset = models.RRset.objects.create(**validated_data)
-        self._set_all_record_contents(rrset, rrs_data)
-        return rrset
+        return self.bulk_write(created=[validated_data])[0]
 
     def update(self, instance: models.RRset, validated_data):
-        rrs_data = validated_data.pop("records", None)
-        if rrs_data is not None:
-            self._set_all_record_contents(instance, rrs_data)
-
-        ttl = validated_data.pop("ttl", None)
-        if ttl and instance.ttl != ttl:
-            instance.ttl = ttl
-            instance.save()  # also updates instance.touched
-        else:
-            # Update instance.touched without triggering post-save signal (no pdns action required)
-            models.RRset.objects.filter(pk=instance.pk).update(touched=timezone.now())
-
-        return instance
-
-    def save(self, **kwargs):
-        kwargs.setdefault("domain", self.domain)
-        return super().save(**kwargs)
+        return self.bulk_write(updated=[(instance, validated_data)])[0]
 
     @staticmethod
-    def _set_all_record_contents(rrset: models.RRset, rrs):
+    def bulk_write(created=(), updated=(), deleted=()):
         """
-        Updates this RR set's resource records, discarding any old values.
+        Creates, updates, and deletes RRsets with a constant number of queries, see `RRsetManager.bulk_write`.
 
-        :param rrset: the RRset at which we overwrite all RRs
-        :param rrs: list of RR representations
+        :param created: list of validated data of new RRsets
+        :param updated: list of (instance, validated data) pairs of existing RRsets
+        :param deleted: list of RRset instances
+        :return: list of created and updated RRsets
         """
-        record_contents = [rr["content"] for rr in rrs]
+
+        def contents(validated_data):
+            rrs_data = validated_data.pop("records", None)
+            return None if rrs_data is None else [rr["content"] for rr in rrs_data]
+
+        created = [
+            (contents(validated_data), validated_data) for validated_data in created
+        ]
+        created = [
+            (models.RRset(**validated_data), records)
+            for records, validated_data in created
+        ]
+        updated = [
+            (instance, validated_data.get("ttl"), contents(validated_data))
+            for instance, validated_data in updated
+        ]
         try:
-            rrset.save_records(record_contents)
+            models.RRset.objects.bulk_write(
+                created=created, updated=updated, deleted=deleted
+            )
         except django.core.exceptions.ValidationError as e:
             raise serializers.ValidationError(e.messages, code="record-content")
+        return [rrset for rrset, _ in created] + [rrset for rrset, _, _ in updated]
+
+    def save(self, **kwargs):
+        kwargs.setdefault("domain", self.domain)
+        return super().save(**kwargs)
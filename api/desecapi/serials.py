@@ -0,0 +1,131 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from desecapi import pdns
+from desecapi.models import ZoneSerial
+
+# Entries updated this recently may describe zone transfers that nsmaster has not completed yet
+RECONCILE_GRACE_PERIOD = timedelta(minutes=1)
+
+VERSION_CACHE_KEY = "desecapi.serials.version"
+
+
+def _pdns_name(name):
+    return name.rstrip(".") + "."
+
+
+def update(serials):
+    """
+    Records the given serials (dict mapping zone names to serials, or to None for deleted zones) in the index. Entries
+    whose serial did not change are left alone, so that they do not show up in delta queries.
+    """
+    serials = {_pdns_name(name): serial for name, serial in serials.items()}
+    current = dict(
+        ZoneSerial.objects.filter(name__in=serials).values_list("name", "serial")
+    )
+    now = timezone.now()
+    changed = [
+        ZoneSerial(name=name, serial=serial, changed=now)
+        for name, serial in serials.items()
+        if current.get(name, None) != serial
+    ]
+    if changed:
+        ZoneSerial.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=["name"],
+            update_fields=["serial", "changed"],
+        )
+        _invalidate()
+
+
+def _invalidate():
+    # The stamp is replaced again after commit, so that a stamp obtained along with the state before the commit does
+    # not stay valid.
+    def bump():
+        cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def _get_listing():
+    listing = pdns.get_serials()
+    listing.pop(_pdns_name(settings.CATALOG_ZONE), None)
+    return listing
+
+
+def get(since=None):
+    """
+    Returns a dict mapping zone names to serials. If `since` is given, only zones whose entry changed since then are
+    included (plus `settings.SERIAL_INDEX_DELTA_OVERLAP`, to catch up on transactions that committed out of order),
+    with serial None for deleted zones. Raises ValueError if deletions that old may have been forgotten already.
+
+    If the index is empty (e.g., right after it was introduced), it is seeded from nsmaster's zone listing first.
+    """
+    if not ZoneSerial.objects.exists():
+        update(_get_listing())
+    qs = ZoneSerial.objects.all()
+    if since is None:
+        qs = qs.filter(serial__isnull=False)
+    else:
+        if since < timezone.now() - settings.SERIAL_INDEX_TOMBSTONE_RETENTION:
+            raise ValueError("Deletions that old are not known anymore.")
+        qs = qs.filter(changed__gte=since - settings.SERIAL_INDEX_DELTA_OVERLAP)
+    return dict(qs.values_list("name", "serial"))
+
+
+def version():
+    """
+    Returns a version stamp of the index, which is kept in the cache and replaced whenever the index changes, and the
+    time of the latest change (or None if the index is empty). Both are cheap to retrieve, so that clients can poll.
+    """
+    stamp = cache.get(VERSION_CACHE_KEY)
+    if stamp is None:
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+        stamp = cache.get(VERSION_CACHE_KEY)
+    changed = ZoneSerial.objects.aggregate(changed=Max("changed"))["changed"]
+    return stamp, changed
+
+
+def get_catalog_serial():
+    """
+    Returns the serial of the catalog zone. The catalog zone is updated directly on nsmaster, so its serial is not part
+    of the index, but retrieved from nsmaster (and cached for a few seconds).
+    """
+    key = "desecapi.serials.catalog"
+    serial = cache.get(key)
+    if serial is None:
+        serial = pdns.get_edited_serial(settings.CATALOG_ZONE, server=pdns.NSMASTER)
+        cache.set(key, serial, timeout=15)
+    return serial
+
+
+def reconcile():
+    """
+    Aligns the index with nsmaster's zone listing, which covers serial changes that did not go through the API (e.g.,
+    due to SOA-EDIT), and forgets deleted zones after `settings.SERIAL_INDEX_TOMBSTONE_RETENTION`.
+    """
+    now = timezone.now()
+    listing = _get_listing()
+    recent = set(
+        ZoneSerial.objects.filter(
+            changed__gte=now - RECONCILE_GRACE_PERIOD
+        ).values_list("name", flat=True)
+    )
+    indexed = set(
+        ZoneSerial.objects.filter(serial__isnull=False).values_list("name", flat=True)
+    )
+    update({name: listing.get(name) for name in (listing.keys() | indexed) - recent})
+    deleted, _ = ZoneSerial.objects.filter(
+        serial__isnull=True,
+        changed__lt=now - settings.SERIAL_INDEX_TOMBSTONE_RETENTION,
+    ).delete()
+    if deleted:
+        _invalidate()
@@ -1,7 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from desecapi import models
+from desecapi import blocked_subnets, models
 
 
 @receiver(post_save, sender=models.Domain, dispatch_uid=__name__)
@@ -9,3 +9,9 @@ def domain_handler(
     sender, instance: models.Domain, created, raw, using, update_fields, **kwargs
 ):
     pass
+
+
+@receiver(post_save, sender=models.BlockedSubnet, dispatch_uid=f"{__name__}.blocked")
+@receiver(post_delete, sender=models.BlockedSubnet, dispatch_uid=f"{__name__}.blocked")
+def blocked_subnet_handler(sender, **kwargs):
+    blocked_subnets.invalidate()
@@ -12,6 +12,7 @@ from unittest import mock
 from django.conf import settings
 from django.contrib.auth.hashers import check_password
 from django.core import mail
+from django.core.cache import cache
 from django.db import connection
 from httpretty import httpretty, core as hr_core
 from rest_framework import status
@@ -575,6 +576,21 @@ class MockPDNSTestCase(APITestCase):
             "body": "Zone export dummy!",
         }
 
+    @classmethod
+    def request_pdns_zone_retrieve_edited_serial(cls, name=None, serial=1, ns="LORD"):
+        return {
+            "method": "GET",
+            "uri": cls.get_full_pdns_url(
+                cls.PDNS_ZONE + r"\?rrsets=false",
+                ns=ns,
+                id=cls._pdns_zone_id_heuristic(name),
+            ),
+            "status": 200,
+            "body": json.dumps({"edited_serial": serial}),
+            "match_querystring": True,
+            "priority": 1,  # avoid collision with PATCH zones/(?P<id>[^/]+)$ (httpretty does not match the method)
+        }
+
     @classmethod
     def request_pdns_zone_retrieve_crypto_keys(cls, name=None):
         return {
@@ -597,6 +613,13 @@ class MockPDNSTestCase(APITestCase):
             "body": "",
         }
 
+    @classmethod
+    def requests_pdns_zone_publish(cls, name=None, serial=1):
+        return [
+            cls.request_pdns_zone_retrieve_edited_serial(name=name, serial=serial),
+            cls.request_pdns_zone_axfr(name=name),
+        ]
+
     @classmethod
     def request_pdns_update_catalog(cls):
         return {
@@ -640,11 +663,13 @@ class MockPDNSTestCase(APITestCase):
         }
 
     def request_pch_zone_delete(self, name, **kwargs):
+        zones = name if isinstance(name, list) else [name]
+
         def request_callback(r, _, response_headers):
             try:
-                self.assertEqual(
-                    r.parsed_body,
-                    {"zones": [name]},
+                self.assertCountEqual(
+                    r.parsed_body["zones"],
+                    zones,
                     f"Expected PCH zone deletion request for {name}, but got '{r.parsed_body}'.",
                 )
             finally:
@@ -655,7 +680,7 @@ class MockPDNSTestCase(APITestCase):
                         {
                             "status": True,
                             "message": "Zone(s) deleted",
-                            "zones": [name],
+                            "zones": zones,
                         }
                     ),
                 ]
@@ -777,6 +802,7 @@ class MockPDNSTestCase(APITestCase):
             cls.request_pdns_zone_create(ns="LORD"),
             cls.request_pdns_zone_create(ns="MASTER"),
             cls.request_pdns_zone_axfr(),
+            cls.request_pdns_zone_retrieve_edited_serial(),
             cls.request_pdns_zone_update(),
             cls.request_pdns_zone_retrieve_crypto_keys(),
             cls.request_pdns_zone_retrieve(),
@@ -824,6 +850,7 @@ class MockPDNSTestCase(APITestCase):
             ]
 
         super().setUp()
+        cache.clear()
         httpretty.reset()
         hr_core.POTENTIAL_HTTP_PORTS.add(
             8081
@@ -1056,7 +1083,7 @@ class DesecTestCase(MockPDNSTestCase):
             self.request_pch_zone_create(name=name),
         ]
         if axfr:
-            requests.append(self.request_pdns_zone_axfr(name=name))
+            requests.append(self.requests_pdns_zone_publish(name=name))
         if keys:
             requests.append(self.request_pdns_zone_retrieve_crypto_keys(name=name))
         return requests
@@ -1073,7 +1100,7 @@ class DesecTestCase(MockPDNSTestCase):
             delegate_at = self._find_auto_delegation_zone(domain.name)
             requests += [
                 self.request_pdns_zone_update(name=delegate_at),
-                self.request_pdns_zone_axfr(name=delegate_at),
+                self.requests_pdns_zone_publish(name=delegate_at),
             ]
 
         return requests
@@ -1082,14 +1109,14 @@ class DesecTestCase(MockPDNSTestCase):
         delegate_at = self._find_auto_delegation_zone(name)
         return self.requests_desec_domain_creation(name=name) + [
             self.request_pdns_zone_update(name=delegate_at),
-            self.request_pdns_zone_axfr(name=delegate_at),
+            self.requests_pdns_zone_publish(name=delegate_at),
         ]
 
     @classmethod
     def requests_desec_rr_sets_update(cls, name=None):
         return [
             cls.request_pdns_zone_update(name=name),
-            cls.request_pdns_zone_axfr(name=name),
+            cls.requests_pdns_zone_publish(name=name),
         ]
 
     def assertRRSet(
@@ -1260,11 +1287,12 @@ class DesecTestCase(MockPDNSTestCase):
 class PublicSuffixMockMixin:
     def _mock_get_public_suffix(self, domain_name, public_suffixes=None):
         if public_suffixes is None:
-            public_suffixes = settings.LOCAL_PUBLIC_SUFFIXES | self.PUBLIC_SUFFIXES
-        # Poor man's PSL interpreter. First, find all known suffixes covering the domain.
+            public_suffixes = self.PUBLIC_SUFFIXES
+        # Poor man's PSL interpreter. First, find all known suffixes covering the domain. Like the actual PSL,
+        # local public suffixes are always taken into account.
         suffixes = [
             suffix
-            for suffix in public_suffixes
+            for suffix in set(settings.LOCAL_PUBLIC_SUFFIXES) | set(public_suffixes)
             if ".{}".format(domain_name).endswith(".{}".format(suffix))
         ]
         # Also, consider TLD.
@@ -1286,7 +1314,7 @@ class PublicSuffixMockMixin:
             side_effect = partial(
                 self._mock_get_public_suffix,
                 public_suffixes=[side_effect_parameter]
-                if not isinstance(side_effect_parameter, list)
+                if not isinstance(side_effect_parameter, (list, set))
                 else list(side_effect_parameter),
             )
 
@@ -1362,6 +1390,12 @@ class DynDomainOwnerTestCase(DomainOwnerTestCase):
     def request_pdns_zone_axfr(cls, name=None):
         return super().request_pdns_zone_axfr(name.lower() if name else None)
 
+    @classmethod
+    def request_pdns_zone_retrieve_edited_serial(cls, name=None, **kwargs):
+        return super().request_pdns_zone_retrieve_edited_serial(
+            name.lower() if name else None, **kwargs
+        )
+
     @classmethod
     def request_pdns_zone_update(cls, name=None):
         return super().request_pdns_zone_update(name.lower() if name else None)
@@ -1386,7 +1420,7 @@ class DynDomainOwnerTestCase(DomainOwnerTestCase):
             )
             requests = [
                 self.request_pdns_zone_update(name=pdns_name),
-                self.request_pdns_zone_axfr(name=pdns_name),
+                self.requests_pdns_zone_publish(name=pdns_name),
             ]
         else:
             requests = []
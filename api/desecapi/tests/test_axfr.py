@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+
+from desecapi import axfr, metrics
+from desecapi.models import Domain
+from desecapi.tests.base import DesecTestCase
+
+
+class AXFRDispatcherTestCase(DesecTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.domain = self.create_domain()
+
+    @override_settings(AXFR_COALESCE_WINDOW=5)
+    def test_coalesce(self):
+        coalesced = metrics.get("desecapi_axfr_coalesced")._value.get()
+        with mock.patch.object(axfr.task, "apply_async") as apply_async:
+            for _ in range(3):
+                axfr.schedule({self.domain.name, "other.example"})
+        self.assertEqual(apply_async.call_count, 2)
+        self.assertEqual(
+            {call.args[0][0] for call in apply_async.call_args_list},
+            {self.domain.name, "other.example"},
+        )
+        for call in apply_async.call_args_list:
+            self.assertEqual(call.kwargs, {"countdown": 5})
+        self.assertEqual(
+            metrics.get("desecapi_axfr_coalesced")._value.get(), coalesced + 4
+        )
+
+    @override_settings(AXFR_COALESCE_WINDOW=5)
+    def test_schedule_after_transfer_started(self):
+        with mock.patch.object(axfr.task, "apply_async") as apply_async:
+            axfr.schedule({self.domain.name})
+            name, requested = apply_async.call_args.args[0]
+            with self.assertRequests(self.requests_pdns_zone_publish(self.domain.name)):
+                axfr.task(name, requested)
+            axfr.schedule({self.domain.name})
+        self.assertEqual(apply_async.call_count, 2)
+
+    @override_settings(AXFR_COALESCE_WINDOW=None)
+    def test_synchronous(self):
+        with self.assertRequests(
+            self.requests_pdns_zone_publish(self.domain.name),
+            self.requests_pdns_zone_publish(self.domain.name),
+        ):
+            axfr.schedule({self.domain.name})
+            axfr.schedule({self.domain.name})
+
+    def test_published(self):
+        before = timezone.now()
+        with self.assertRequests(self.requests_pdns_zone_publish(self.domain.name)):
+            axfr.schedule({self.domain.name})
+        published = Domain.objects.get(pk=self.domain.pk).published
+        self.assertGreaterEqual(published, before)
+        self.assertLessEqual(published, timezone.now())
+
+    def test_queue_depth_eager(self):
+        depth = metrics.get("desecapi_axfr_queue_depth")._value.get()
+        with self.assertRequests(self.requests_pdns_zone_publish(self.domain.name)):
+            axfr.schedule({self.domain.name})
+        self.assertEqual(metrics.get("desecapi_axfr_queue_depth")._value.get(), depth)
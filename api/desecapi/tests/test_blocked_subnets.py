@@ -0,0 +1,112 @@
+import random
+from datetime import date
+from ipaddress import IPv4Address, IPv4Network
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from desecapi import blocked_subnets, metrics
+from desecapi.models import BlockedSubnet
+from desecapi.tests.base import AuthenticatedRRSetBaseTestCase, DesecTestCase
+
+
+def create_blocked_subnet(subnet):
+    return BlockedSubnet.objects.create(
+        asn=64496,
+        subnet=IPv4Network(subnet),
+        country="ZZ",
+        registry="test",
+        allocation_date=date(2000, 1, 1),
+    )
+
+
+class BlockedSubnetIndexTestCase(DesecTestCase):
+    def test_lookup(self):
+        index = blocked_subnets.BlockedSubnetIndex(
+            [
+                IPv4Network("10.0.0.0/8"),
+                IPv4Network("10.1.0.0/16"),
+                IPv4Network("10.1.2.0/24"),
+                IPv4Network("10.2.0.0/16"),
+                IPv4Network("192.0.2.7/32"),
+            ]
+        )
+        for address, subnet in {
+            "9.255.255.255": None,
+            "10.0.0.0": "10.0.0.0/8",
+            "10.1.0.0": "10.1.0.0/16",
+            "10.1.2.255": "10.1.2.0/24",
+            "10.1.3.0": "10.1.0.0/16",
+            "10.2.255.255": "10.2.0.0/16",
+            "10.3.0.0": "10.0.0.0/8",
+            "10.255.255.255": "10.0.0.0/8",
+            "11.0.0.0": None,
+            "192.0.2.6": None,
+            "192.0.2.7": "192.0.2.7/32",
+            "192.0.2.8": None,
+        }.items():
+            self.assertEqual(
+                index.lookup(address),
+                subnet and IPv4Network(subnet),
+                address,
+            )
+
+    def test_lookup_random(self):
+        rng = random.Random(5)
+        subnets = set()
+        for _ in range(200):
+            prefixlen = rng.randint(8, 32)
+            subnets.add(IPv4Network((rng.getrandbits(32), prefixlen), strict=False))
+        index = blocked_subnets.BlockedSubnetIndex(subnets)
+        addresses = [IPv4Address(rng.getrandbits(32)) for _ in range(1000)]
+        addresses += [subnet.network_address for subnet in subnets]
+        addresses += [subnet.broadcast_address + 1 for subnet in subnets]
+        for address, subnet in zip(addresses, index.lookup_all(addresses)):
+            containing = [s for s in subnets if address in s]
+            expected = max(containing, key=lambda s: s.prefixlen, default=None)
+            self.assertEqual(subnet, expected, address)
+
+    def test_invalidation(self):
+        self.assertIsNone(blocked_subnets.get_index().lookup("198.51.100.1"))
+        with CaptureQueriesContext(connection) as context:
+            blocked_subnets.get_index()
+        self.assertEqual(len(context.captured_queries), 0)
+
+        blocked_subnet = create_blocked_subnet("198.51.100.0/24")
+        self.assertEqual(
+            blocked_subnets.get_index().lookup("198.51.100.1"), blocked_subnet.subnet
+        )
+
+        blocked_subnet.delete()
+        self.assertIsNone(blocked_subnets.get_index().lookup("198.51.100.1"))
+
+
+class BlockedSubnetRRsetTestCase(AuthenticatedRRSetBaseTestCase):
+    DYN = True
+
+    def test_create_my_rr_sets_ip_block(self):
+        create_blocked_subnet("198.51.100.0/24")
+        create_blocked_subnet("198.51.100.128/25")
+        counter = metrics.get("desecapi_records_serializer_validate_blocked_subnet")
+        before = counter.labels("198.51.100.128/25")._value.get()
+
+        response = self.client.post_rr_set(
+            self.my_domain.name,
+            records=["198.51.100.1", "198.51.100.200"],
+            ttl=3660,
+            subname="blocktest",
+            type="A",
+        )
+        self.assertStatus(response, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("IP address 198.51.100.1 not allowed.", str(response.data))
+
+        data = [
+            {"subname": "one", "type": "A", "ttl": 3660, "records": ["192.0.2.1"]},
+            {"subname": "two", "type": "A", "ttl": 3660, "records": ["198.51.100.200"]},
+        ]
+        response = self.client.bulk_post_rr_sets(self.my_domain.name, payload=data)
+        self.assertStatus(response, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("IP address 198.51.100.200 not allowed.", str(response.data[1]))
+        self.assertEqual(counter.labels("198.51.100.128/25")._value.get(), before + 1)
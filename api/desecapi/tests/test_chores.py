@@ -9,6 +9,12 @@ from desecapi.models import Captcha, User
 
 
 class ChoresCommandTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("desecapi.serials.reconcile")  # needs nsmaster
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     @override_settings(CAPTCHA_VALIDITY_PERIOD=timezone.timedelta(hours=1))
     def test_captcha_cleanup(self):
         faketime = (
@@ -1,5 +1,7 @@
 import random
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 
 from desecapi.models import BlockedSubnet
@@ -56,6 +58,18 @@ class DynDNS12UpdateTest(DynDomainOwnerTestCase):
             self.assertEqual(response.data, "good")
             self.assertIP(ipv4="127.0.0.1", subname=subname)
 
+    def test_domain_lookup_once(self):
+        # Authentication and view resolve the same qname, which is looked up only once
+        with CaptureQueriesContext(connection) as context:
+            response = self.assertDynDNS12Update(self.my_domain.name)
+        self.assertStatus(response, status.HTTP_200_OK)
+        lookups = [
+            query
+            for query in context.captured_queries
+            if '"desecapi_domain"."name" IN' in query["sql"]
+        ]
+        self.assertEqual(len(lookups), 1)
+
     def test_deviant_ttl(self):
         """
         The dynamic update will try to set the TTL to 60. Here, we create
@@ -64,7 +78,7 @@ class DynDNS12UpdateTest(DynDomainOwnerTestCase):
         """
         with self.assertRequests(
             self.request_pdns_zone_update(self.my_domain.name),
-            self.request_pdns_zone_axfr(self.my_domain.name),
+            self.requests_pdns_zone_publish(self.my_domain.name),
         ):
             response = self.client_token_authorized.patch_rr_set(
                 self.my_domain.name.lower(), "", "A", {"ttl": 3600}
@@ -80,7 +94,7 @@ class DynDNS12UpdateTest(DynDomainOwnerTestCase):
         # /nic/dyndns?action=edit&started=1&hostname=YES&host_id=foobar.dedyn.io&myip=10.1.2.3
         with self.assertRequests(
             self.request_pdns_zone_update(self.my_domain.name),
-            self.request_pdns_zone_axfr(self.my_domain.name),
+            self.requests_pdns_zone_publish(self.my_domain.name),
         ):
             response = self.client.get(
                 self.reverse("v1:dyndns12update"),
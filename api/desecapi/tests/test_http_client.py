@@ -0,0 +1,43 @@
+from unittest import mock
+
+from django.test import override_settings
+
+from desecapi import http_client, metrics, pdns
+from desecapi.tests.base import DesecTestCase
+
+
+class HTTPClientTestCase(DesecTestCase):
+    def test_session_per_backend(self):
+        session = http_client.get_session("nslord")
+        self.assertIs(session, http_client.get_session("nslord"))
+        self.assertIsNot(session, http_client.get_session("nsmaster"))
+
+    def test_session_not_inherited_after_fork(self):
+        session = http_client.get_session("nslord")
+        with mock.patch("os.getpid", return_value=-1):
+            self.assertIsNot(session, http_client.get_session("nslord"))
+
+    @override_settings(NSLORD_PDNS_API_POOL_SIZE=8, PCH_API_POOL_SIZE=3)
+    def test_pool_size(self):
+        with mock.patch("os.getpid", return_value=-2):
+            for backend, pool_size in [("nslord", 8), ("pch", 3)]:
+                adapter = http_client.get_session(backend).get_adapter("http://x")
+                self.assertEqual(adapter._pool_maxsize, pool_size)
+
+    def test_connection_checkout_metric(self):
+        checkout = metrics.get("desecapi_backend_connection_checkout")
+
+        def count():
+            return sum(
+                checkout.labels("nsmaster", reused)._value.get()
+                for reused in (False, True)
+            )
+
+        before = count()
+        with self.assertRequests(
+            self.request_pdns_zone_axfr("example.com"),
+            self.request_pdns_zone_axfr("example.com"),
+        ):
+            pdns.axfr_to_master("example.com")
+            pdns.axfr_to_master("example.com")
+        self.assertEqual(count(), before + 2)
@@ -0,0 +1,130 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core import management
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+
+from desecapi import outbox, pdns, serials
+from desecapi.exceptions import PDNSException
+from desecapi.models import PDNSOutboxEntry
+from desecapi.tests.base import AuthenticatedRRSetBaseTestCase
+
+
+@override_settings(PDNS_PROPAGATION_ASYNC=True)
+class OutboxTestCase(AuthenticatedRRSetBaseTestCase):
+    def _post_rr_sets(self, subnames):
+        with mock.patch.object(
+            outbox.task, "delay"
+        ) as delay, self.assertNoRequestsBut(), self.captureOnCommitCallbacks(
+            execute=True
+        ):
+            for subname in subnames:
+                response = self.client.post_rr_set(
+                    self.my_empty_domain.name,
+                    subname=subname,
+                    type="A",
+                    records=["1.2.3.4"],
+                    ttl=3600,
+                )
+                self.assertStatus(response, status.HTTP_201_CREATED)
+        self.assertEqual(delay.call_count, len(subnames))
+
+    def test_replay_coalesces(self):
+        self._post_rr_sets(["a", "b"])
+        with mock.patch.object(outbox.task, "delay"), self.assertNoRequestsBut():
+            response = self.client.delete_rr_set(
+                self.my_empty_domain.name, subname="b", type_="A"
+            )
+            self.assertStatus(response, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            PDNSOutboxEntry.objects.filter(domain=self.my_empty_domain).count(), 3
+        )
+
+        name = self.my_empty_domain.name
+        with mock.patch.object(
+            pdns, "update_zone", wraps=pdns.update_zone
+        ) as update_zone, self.assertRequests(self.requests_desec_rr_sets_update(name)):
+            outbox.replay(name)
+        update_zone.assert_called_once()
+        self.assertEqual(
+            sorted(
+                (rrset["name"], rrset["records"])
+                for rrset in update_zone.call_args.args[1]["rrsets"]
+            ),
+            [
+                (f"a.{name}.", [{"content": "1.2.3.4", "disabled": False}]),
+                (f"b.{name}.", []),
+            ],
+        )
+        self.assertFalse(PDNSOutboxEntry.objects.exists())
+
+        with self.assertNoRequestsBut():
+            outbox.replay(self.my_empty_domain.name)
+
+    def test_replay_failure(self):
+        self._post_rr_sets(["a"])
+        with self.assertRaises(PDNSException), self.assertRequests(
+            {**self.request_pdns_zone_update(self.my_empty_domain.name), "status": 500}
+        ):
+            outbox.replay(self.my_empty_domain.name)
+        entry = PDNSOutboxEntry.objects.get()
+        self.assertEqual(entry.attempts, 1)
+
+    def test_dispatch_after_commit(self):
+        with self.assertNoRequestsBut(), self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post_rr_set(
+                self.my_empty_domain.name,
+                subname="a",
+                type="A",
+                records=["1.2.3.4"],
+                ttl=3600,
+            )
+            self.assertStatus(response, status.HTTP_201_CREATED)
+        self.assertTrue(PDNSOutboxEntry.objects.exists())
+
+        # the test settings execute tasks eagerly
+        with self.assertRequests(
+            self.requests_desec_rr_sets_update(self.my_empty_domain.name)
+        ):
+            for callback in callbacks:
+                callback()
+        self.assertFalse(PDNSOutboxEntry.objects.exists())
+
+    def test_prefer_wait(self):
+        with mock.patch.object(outbox.task, "delay") as delay, self.assertRequests(
+            self.requests_desec_rr_sets_update(self.my_empty_domain.name)
+        ):
+            response = self.client.post(
+                self.reverse("v1:rrsets", name=self.my_empty_domain.name),
+                data={"subname": "a", "type": "A", "ttl": 3600, "records": ["1.2.3.4"]},
+                HTTP_PREFER="wait=10",
+            )
+            self.assertStatus(response, status.HTTP_201_CREATED)
+        delay.assert_not_called()
+        self.assertFalse(PDNSOutboxEntry.objects.exists())
+
+    def test_domain_deletion_drops_entries(self):
+        self._post_rr_sets(["a"])
+        with self.assertRequests(
+            self.requests_desec_domain_deletion(self.my_empty_domain)
+        ):
+            response = self.client.delete(
+                self.reverse("v1:domain-detail", name=self.my_empty_domain.name)
+            )
+            self.assertStatus(response, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(PDNSOutboxEntry.objects.exists())
+
+    def test_chores_replay_stale(self):
+        self._post_rr_sets(["a", "b", "c"])
+        # Two stale entries of the same zone, replayed at once
+        for subname, age in [("a", 1), ("b", 2)]:
+            PDNSOutboxEntry.objects.filter(rrsets=[["A", subname]]).update(
+                created=timezone.now() - timedelta(hours=age)
+            )
+        with mock.patch.object(outbox.task, "delay") as delay, mock.patch.object(
+            serials, "reconcile"
+        ):
+            management.call_command("chores")
+        delay.assert_called_once_with(self.my_empty_domain.name)
@@ -1,5 +1,10 @@
+import threading
+from unittest import mock
+
+from django.test import override_settings
 from django.utils import timezone
 
+from desecapi import pdns
 from desecapi.models import RRset, RR, Domain
 from desecapi.pdns_change_tracker import PDNSChangeTracker
 from desecapi.tests.base import DesecTestCase
@@ -27,7 +32,7 @@ class PdnsChangeTrackerTestCase(DesecTestCase):
         return self.assertRequests(
             [
                 self.request_pdns_zone_update_assert_body(name, rr_sets),
-                self.request_pdns_zone_axfr(name),
+                self.requests_pdns_zone_publish(name),
             ],
         )
 
@@ -446,6 +451,72 @@ class RRSetTestCase(PdnsChangeTrackerTestCase):
             for type_, subname, _ in data.keys():
                 self.full_domain.rrset_set.get(subname=subname, type=type_).delete()
 
+    def test_payload_query_count(self):
+        for n in [1, 10, 100]:
+            data = {("A", f"n{n}-{i}", 3600): ["1.2.3.4", "5.6.7.8"] for i in range(n)}
+            self._create_rr_sets(data, self.empty_domain)
+            keys = {(type_, subname) for type_, subname, _ in data.keys()}
+            change = PDNSChangeTracker.CreateUpdateDeleteRRSets(
+                self.empty_domain.name, keys, set(), set()
+            )
+            with self.assertRequests(
+                self.request_pdns_zone_update_assert_body(self.empty_domain.name, data)
+            ), self.assertNumQueries(1):
+                change.pdns_do()
+
+    def test_empty_additions_query_count(self):
+        for n in [1, 10, 100]:
+            tracker = PDNSChangeTracker()
+            tracker.__enter__()
+            try:
+                for domain in [self.empty_domain, self.full_domain]:
+                    self._create_rr_sets(
+                        {("A", f"empty-{i}", 3600): [] for i in range(n)}, domain
+                    )
+                    self._create_rr_sets(
+                        {("A", f"meaty-{i}", 3600): ["1.2.3.4"] for i in range(n)},
+                        domain,
+                    )
+                with self.assertNumQueries(1):
+                    changes = tracker._compute_changes()
+                self.assertEqual(len(changes), 2)
+                for change in changes:
+                    self.assertEqual(
+                        change._additions, {("A", f"meaty-{i}") for i in range(n)}
+                    )
+            finally:
+                # roll back
+                tracker.__exit__(RuntimeError, RuntimeError(), None)
+
+    def test_nonempty_additions_chunked(self):
+        tracker = PDNSChangeTracker()
+        tracker.__enter__()
+        try:
+            self._create_rr_sets(
+                {("A", "x", 3600): ["1.2.3.4"], ("AAAA", "y", 3600): []},
+                self.empty_domain,
+            )
+            self._create_rr_sets(
+                {("AAAA", "x", 3600): ["::1"], ("A", "y", 3600): ["1.2.3.4"]},
+                self.full_domain,
+            )
+            self._create_rr_sets({("TXT", "z", 3600): []}, self.full_domain)
+            with mock.patch.object(
+                PDNSChangeTracker, "ADDITIONS_QUERY_CHUNK_SIZE", 2
+            ), self.assertNumQueries(3):
+                nonempty = tracker._nonempty_rr_set_additions()
+            self.assertEqual(
+                nonempty,
+                {
+                    (self.empty_domain.name, "A", "x"),
+                    (self.full_domain.name, "AAAA", "x"),
+                    (self.full_domain.name, "A", "y"),
+                },
+            )
+        finally:
+            # roll back
+            tracker.__exit__(RuntimeError, RuntimeError(), None)
+
 
 class CommonRRSetTestCase(RRSetTestCase):
     def test_mixed_operations(self):
@@ -607,8 +678,15 @@ class DomainTestCase(PdnsChangeTrackerTestCase):
     def test_delete_multiple(self):
         with self.assertRequests(
             [
-                self.requests_desec_domain_deletion(domain)
+                [
+                    self.request_pdns_zone_delete(name=domain.name, ns="LORD"),
+                    self.request_pdns_zone_delete(name=domain.name, ns="MASTER"),
+                ]
                 for domain in reversed(self.domains)
+            ]
+            + [
+                self.request_pdns_update_catalog(),
+                self.request_pch_zone_delete(name=[d.name for d in self.domains]),
             ],
             expect_order=False,
         ), PDNSChangeTracker():
@@ -631,3 +709,122 @@ class DomainTestCase(PdnsChangeTrackerTestCase):
         with self.assertPdnsZoneUpdate(name, []), PDNSChangeTracker():
             self.full_domain.delete()
             self.full_domain = Domain.objects.create(name=name, owner=self.user)
+
+    def stub_backends(self, lord_barrier=None):
+        """
+        Replaces the pdns and PCH APIs with stubs. (httpretty does not reliably record concurrent requests.) Returns
+        the list of requests made, as (server, method, path) tuples.
+
+        If `lord_barrier` is given, zone creation requests to nslord wait for it, so that they only succeed if enough of
+        them are in flight at the same time.
+        """
+        requests = []
+
+        def stub(server):
+            def request(method, *, path, **kwargs):
+                requests.append((server or kwargs["server"], method, path))
+                if lord_barrier and (kwargs.get("server"), method, path) == (
+                    pdns.NSLORD,
+                    "post",
+                    "/zones?rrsets=false",
+                ):
+                    lord_barrier.wait()
+                return mock.Mock(**{"json.return_value": {"edited_serial": 1}})
+
+            return request
+
+        for patcher in [
+            mock.patch("desecapi.pdns._pdns_request", stub(None)),
+            mock.patch("desecapi.pch._pch_request", stub("pch")),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return requests
+
+    def expected_creation_requests(self, names):
+        return [
+            (server, method, path)
+            for name in names
+            for server, method, path in [
+                (pdns.NSLORD, "post", "/zones?rrsets=false"),
+                (pdns.NSMASTER, "post", "/zones?rrsets=false"),
+                (pdns.NSLORD, "get", f"/zones/{name}.?rrsets=false"),
+                (pdns.NSMASTER, "put", f"/zones/{name}./axfr-retrieve"),
+            ]
+        ] + [
+            (pdns.NSMASTER, "patch", "/zones/catalog.internal."),
+            ("pch", "post", "/zones"),
+        ]
+
+    @override_settings(BACKEND_API_CONCURRENCY=4)
+    def test_create_multiple_concurrently(self):
+        requests = self.stub_backends()
+        names = [self.random_domain_name() for _ in range(3)]
+        with PDNSChangeTracker():
+            for name in names:
+                Domain.objects.create(name=name, owner=self.user)
+        self.assertCountEqual(
+            requests,
+            self.expected_creation_requests(names),
+        )
+
+    def test_create_compensation(self):
+        name = self.random_domain_name()
+        with self.assertRequests(
+            self.request_pdns_zone_create(ns="LORD"),
+            {**self.request_pdns_zone_create(ns="MASTER"), "status": 500},
+            # catalog and PCH are updated concurrently with nsmaster, and are rolled back as well
+            self.request_pdns_update_catalog(),
+            self.request_pch_zone_create(name),
+            self.request_pdns_zone_delete(name, ns="LORD"),
+            self.request_pdns_update_catalog(),
+            self.request_pch_zone_delete(name),
+        ), self.assertRaises(ValueError), PDNSChangeTracker():
+            Domain.objects.create(name=name, owner=self.user)
+        self.assertFalse(Domain.objects.filter(name=name).exists())
+
+    def test_create_compensation_pch(self):
+        name = self.random_domain_name()
+        with self.assertRequests(
+            self.request_pdns_zone_create(ns="LORD"),
+            self.request_pdns_zone_create(ns="MASTER"),
+            self.request_pdns_update_catalog(),
+            {**self.request_pch_zone_create(name), "status": 500, "body": ""},
+            self.request_pdns_zone_delete(name, ns="LORD"),
+            self.request_pdns_zone_delete(name, ns="MASTER"),
+            self.request_pdns_update_catalog(),
+        ), self.assertRaises(ValueError), PDNSChangeTracker():
+            Domain.objects.create(name=name, owner=self.user)
+        self.assertFalse(Domain.objects.filter(name=name).exists())
+
+    @override_settings(BACKEND_API_CONCURRENCY=8)
+    def test_create_overlapping(self):
+        # The barrier only opens once all zone creation requests to nslord are in flight; the timeout guards against
+        # hanging if they are sent one after the other.
+        names = [self.random_domain_name() for _ in range(3)]
+        requests = self.stub_backends(
+            lord_barrier=threading.Barrier(len(names), timeout=10)
+        )
+        with PDNSChangeTracker():
+            for name in names:
+                Domain.objects.create(name=name, owner=self.user)
+        self.assertCountEqual(
+            requests,
+            self.expected_creation_requests(names),
+        )
+
+    @override_settings(PDNS_CATALOG_CHUNK_SIZE=2, PCH_API_CHUNK_SIZE=2)
+    def test_create_multiple_chunked(self):
+        requests = self.stub_backends()
+        names = [self.random_domain_name() for _ in range(3)]
+        with PDNSChangeTracker():
+            for name in names:
+                Domain.objects.create(name=name, owner=self.user)
+        self.assertCountEqual(
+            requests,
+            self.expected_creation_requests(names)
+            + [
+                (pdns.NSMASTER, "patch", "/zones/catalog.internal."),
+                ("pch", "post", "/zones"),
+            ],
+        )
@@ -0,0 +1,164 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command, CommandError
+from django.test import override_settings
+from dns.exception import Timeout
+
+from desecapi import metrics, psl
+from desecapi.tests.base import DesecTestCase
+
+SNAPSHOT = """
+// ===BEGIN ICANN DOMAINS===
+com
+uk
+co.uk
+*.ck
+!www.ck
+公司.cn
+cn
+
+// ===BEGIN PRIVATE DOMAINS===
+s3.amazonaws.com
+*.compute.example.com  // trailing text is ignored
+"""
+
+
+class PublicSuffixTrieTestCase(DesecTestCase):
+    def test_get_public_suffix(self):
+        trie = psl.PublicSuffixTrie(psl.parse(SNAPSHOT))
+        for name, public_suffix in {
+            "com": "com",
+            "example.com": "com",
+            "www.example.com": "com",
+            "Example.COM": "com",
+            "co.uk": "co.uk",
+            "foo.co.uk": "co.uk",
+            "bar.foo.co.uk": "co.uk",
+            "uk": "uk",
+            "ck": "ck",
+            "foo.ck": "foo.ck",
+            "bar.foo.ck": "foo.ck",
+            "www.ck": "ck",
+            "foo.www.ck": "ck",
+            "xn--55qx5d.cn": "xn--55qx5d.cn",
+            "foo.xn--55qx5d.cn": "xn--55qx5d.cn",
+            "bucket.s3.amazonaws.com": "s3.amazonaws.com",
+            "foo.compute.example.com": "foo.compute.example.com",
+            "compute.example.com": "com",
+            "unlisted": "unlisted",
+            "example.unlisted": "unlisted",
+        }.items():
+            self.assertEqual(trie.get_public_suffix(name), public_suffix, name)
+        self.assertTrue(trie.is_public_suffix("co.uk"))
+        self.assertFalse(trie.is_public_suffix("foo.co.uk"))
+
+
+class PublicSuffixListTestCase(DesecTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.snapshot = os.path.join(directory.name, "public_suffix_list.dat")
+        self.write_snapshot(SNAPSHOT)
+        settings = override_settings(
+            PSL_SNAPSHOT=self.snapshot,
+            LOCAL_PUBLIC_SUFFIXES={"dedyn.example.com"},
+            PSL_VERIFY=False,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.psl = psl.PublicSuffixList()
+        self.psl.dns = mock.Mock()
+
+    def write_snapshot(self, text, mtime=1000000000):
+        with open(self.snapshot, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.utime(self.snapshot, (mtime, mtime))
+
+    def test_lookup_local(self):
+        self.assertEqual(self.psl.get_public_suffix("foo.co.uk"), "co.uk")
+        self.assertEqual(
+            self.psl.get_public_suffix("foo.dedyn.example.com"), "dedyn.example.com"
+        )
+        self.assertTrue(self.psl.is_public_suffix("dedyn.example.com"))
+        self.assertFalse(self.psl.is_public_suffix("example.com"))
+        self.assertEqual(self.psl.dns.mock_calls, [])
+
+        with override_settings(LOCAL_PUBLIC_SUFFIXES=set()):
+            self.assertEqual(self.psl.get_public_suffix("foo.dedyn.example.com"), "com")
+
+    def test_refresh(self):
+        counter = metrics.get("desecapi_psl_compiled")
+        before = counter._value.get()
+        self.assertEqual(self.psl.get_public_suffix("foo.bar.uk"), "uk")
+        self.write_snapshot(SNAPSHOT + "\nbar.uk\n", mtime=1000000001)
+
+        # Snapshot is not checked before the refresh interval has passed
+        with override_settings(PSL_REFRESH_INTERVAL=3600):
+            self.assertEqual(self.psl.get_public_suffix("foo.bar.uk"), "uk")
+
+        with override_settings(PSL_REFRESH_INTERVAL=0):
+            trie = self.psl.get_trie()
+            with self.psl._lock:  # wait for background refresh
+                pass
+            self.assertIsNot(self.psl.get_trie(), trie)
+            self.assertEqual(self.psl.get_public_suffix("foo.bar.uk"), "bar.uk")
+
+            # Unchanged or vanished snapshots do not trigger a refresh
+            trie = self.psl.get_trie()
+            os.remove(self.snapshot)
+            self.assertIs(self.psl.get_trie(), trie)
+        self.assertEqual(counter._value.get(), before + 2)
+
+    def test_fallback_dns(self):
+        os.remove(self.snapshot)
+        self.psl.dns.get_public_suffix.return_value = "com"
+        self.psl.dns.is_public_suffix.return_value = False
+        self.assertEqual(
+            self.psl.get_public_suffix("foo.dedyn.example.com"), "dedyn.example.com"
+        )
+        self.psl.dns.get_public_suffix.side_effect = Timeout
+        self.assertEqual(self.psl.get_public_suffix("foo.co.uk"), "uk")
+
+    def test_verify(self):
+        counter = metrics.get("desecapi_psl_mismatch")
+        before = counter._value.get()
+        with override_settings(PSL_VERIFY=True):
+            self.psl.dns.get_public_suffix.return_value = "co.uk"
+            self.assertEqual(self.psl.get_public_suffix("foo.co.uk"), "co.uk")
+            self.psl.dns.get_public_suffix.return_value = "com"
+            self.assertEqual(
+                self.psl.get_public_suffix("foo.dedyn.example.com"),
+                "dedyn.example.com",
+            )
+            self.assertEqual(counter._value.get(), before)
+
+            self.psl.dns.get_public_suffix.return_value = "uk"
+            self.assertEqual(self.psl.get_public_suffix("foo.co.uk"), "co.uk")
+            self.assertEqual(counter._value.get(), before + 1)
+
+            self.psl.dns.get_public_suffix.side_effect = Timeout
+            self.assertEqual(self.psl.get_public_suffix("foo.co.uk"), "co.uk")
+            self.assertEqual(counter._value.get(), before + 1)
+
+    def test_update_command(self):
+        source = os.path.join(os.path.dirname(self.snapshot), "source.dat")
+        with open(source, "w", encoding="utf-8") as f:
+            f.write("com\n")
+        with self.assertRaises(CommandError):
+            call_command("update-psl", source=source, stdout=StringIO())
+        with open(self.snapshot, encoding="utf-8") as f:
+            self.assertEqual(f.read(), SNAPSHOT)
+
+        with open(source, "w", encoding="utf-8") as f:
+            f.write(SNAPSHOT + "bar.uk\n")
+        call_command("update-psl", source=source, stdout=StringIO())
+        with open(self.snapshot, encoding="utf-8") as f:
+            self.assertEqual(f.read(), SNAPSHOT + "bar.uk\n")
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(self.snapshot))),
+            ["public_suffix_list.dat", "source.dat"],
+        )
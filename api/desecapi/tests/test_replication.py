@@ -1,36 +1,219 @@
 import json
+from datetime import timedelta
+from unittest import mock
 
+from django.test import override_settings
+from django.utils import timezone
 from rest_framework import status
 
+from desecapi import serials
+from desecapi.models import ZoneSerial
+from desecapi.pdns_change_tracker import PDNSChangeTracker
 from desecapi.tests.base import DesecTestCase
 
 
 class ReplicationTest(DesecTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = self.reverse("v1:serial")
+        serials.update({"test.example.": 12345, "example.org": 54321})
+
+    def request_catalog_serial(self, serial=7):
+        return self.request_pdns_zone_retrieve_edited_serial(
+            name="catalog.internal.", serial=serial, ns="MASTER"
+        )
+
     def test_serials(self):
-        url = self.reverse("v1:serial")
+        expected = {
+            "test.example.": 12345,
+            "example.org.": 54321,
+            "catalog.internal.": 7,
+        }
+
+        response = self.client.get(path=self.url, REMOTE_ADDR="123.8.0.2")
+        self.assertStatus(response, status.HTTP_401_UNAUTHORIZED)
+
+        with self.assertRequests(self.request_catalog_serial()):
+            response = self.client.get(path=self.url, REMOTE_ADDR="10.8.0.2")
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertEqual(response.data, expected)
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        # Catalog serial is cached
+        with self.assertRequests():
+            response = self.client.get(path=self.url, REMOTE_ADDR="10.8.0.2")
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertEqual(response.data, expected)
+
+    def test_serials_text(self):
+        with self.assertRequests(self.request_catalog_serial()):
+            response = self.client.get(
+                path=self.url, REMOTE_ADDR="10.8.0.2", HTTP_ACCEPT="text/plain"
+            )
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(response.content.decode().splitlines()),
+            ["catalog.internal. 7", "example.org. 54321", "test.example. 12345"],
+        )
+
+    def test_serials_not_modified(self):
+        with self.assertRequests(self.request_catalog_serial()):
+            response = self.client.get(path=self.url, REMOTE_ADDR="10.8.0.2")
+        etag = response["ETag"]
+
+        response = self.client.get(
+            path=self.url, REMOTE_ADDR="10.8.0.2", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertStatus(response, status.HTTP_304_NOT_MODIFIED)
+
+        # Delta queries have their own ETag
+        response = self.client.get(
+            path=self.url,
+            data={"since": timezone.now().timestamp()},
+            REMOTE_ADDR="10.8.0.2",
+            HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+        serials.update({"test.example.": 12346})
+        response = self.client.get(
+            path=self.url, REMOTE_ADDR="10.8.0.2", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["test.example."], 12346)
+
+    def test_version(self):
+        # The stamp comes from the cache, and the time of the latest change from the index on `changed`
+        with self.assertNumQueries(1):
+            stamp, changed = serials.version()
+        self.assertEqual(changed, ZoneSerial.objects.get(name="test.example.").changed)
+
+        serials.update({"test.example.": 12345})  # no change
+        self.assertEqual(serials.version()[0], stamp)
+        serials.update({"test.example.": 12346})
+        self.assertNotEqual(serials.version()[0], stamp)
+
+    def test_serials_seed(self):
+        ZoneSerial.objects.all().delete()
         zones = [
-            {"name": "test.example.", "edited_serial": 12345},
-            {"name": "example.org.", "edited_serial": 54321},
+            {"name": "test.example.", "edited_serial": 12347},
+            {"name": "catalog.internal.", "edited_serial": 7},
         ]
-        serials = {zone["name"]: zone["edited_serial"] for zone in zones}
-        pdns_requests = [
+        with self.assertRequests(
+            self.request_catalog_serial(),
             {
                 "method": "GET",
                 "uri": self.get_full_pdns_url(r"/zones", ns="MASTER"),
                 "status": 200,
                 "body": json.dumps(zones),
-            }
-        ]
+            },
+        ):
+            response = self.client.get(path=self.url, REMOTE_ADDR="10.8.0.2")
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data, {"test.example.": 12347, "catalog.internal.": 7}
+        )
 
-        # Run twice to make sure cache output varies on remote address
-        for i in range(2):
-            response = self.client.get(path=url, REMOTE_ADDR="123.8.0.2")
-            self.assertStatus(response, status.HTTP_401_UNAUTHORIZED)
+        # Once seeded, the index is not seeded again
+        with self.assertRequests():
+            response = self.client.get(path=self.url, REMOTE_ADDR="10.8.0.2")
+        self.assertEqual(
+            response.data, {"test.example.": 12347, "catalog.internal.": 7}
+        )
 
-            with self.assertRequests(pdns_requests):
-                response = self.client.get(path=url, REMOTE_ADDR="10.8.0.2")
-            self.assertStatus(response, status.HTTP_200_OK)
-            self.assertEqual(response.data, serials)
+    @override_settings(SERIAL_INDEX_DELTA_OVERLAP=timedelta(0))
+    def test_serials_since(self):
+        since = timezone.now()
+        serials.update(
+            {"test.example.": 12346, "example.org.": None, "new.example.": 1}
+        )
+        serials.update({"test.example.": 12346})  # no change, no new entry time
+        ZoneSerial.objects.filter(name="test.example.").update(
+            changed=since - timedelta(seconds=1)
+        )
+
+        with self.assertRequests(self.request_catalog_serial()):
+            response = self.client.get(
+                path=self.url,
+                data={"since": since.timestamp()},
+                REMOTE_ADDR="10.8.0.2",
+            )
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            {"example.org.": None, "new.example.": 1, "catalog.internal.": 7},
+        )
+
+        # Deleted zones are not part of the full listing
+        response = self.client.get(path=self.url, REMOTE_ADDR="10.8.0.2")
+        self.assertEqual(
+            response.data,
+            {"test.example.": 12346, "new.example.": 1, "catalog.internal.": 7},
+        )
+
+    def test_serials_since_invalid(self):
+        for since in ["foo", "1e400"]:
+            response = self.client.get(
+                path=self.url, data={"since": since}, REMOTE_ADDR="10.8.0.2"
+            )
+            self.assertStatus(response, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("since", response.data)
+
+        # Deletions this old may have been forgotten
+        since = timezone.now() - timedelta(days=30)
+        with self.assertRequests(self.request_catalog_serial()):
+            response = self.client.get(
+                path=self.url, data={"since": since.timestamp()}, REMOTE_ADDR="10.8.0.2"
+            )
+        self.assertStatus(response, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("since", response.data)
+
+    def test_domain_deletion(self):
+        domain = self.create_domain()
+        serials.update({domain.name: 1})
+        with self.captureOnCommitCallbacks() as callbacks, self.assertRequests(
+            self.requests_desec_domain_deletion(domain)
+        ), PDNSChangeTracker():
+            domain.delete()
+
+        # The deletion only shows up in the index once the outer transaction has committed
+        self.assertEqual(ZoneSerial.objects.get(name=f"{domain.name}.").serial, 1)
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(ZoneSerial.objects.get(name=f"{domain.name}.").serial)
+
+    def test_reconcile(self):
+        ZoneSerial.objects.update(changed=timezone.now() - timedelta(minutes=5))
+        ZoneSerial.objects.create(
+            name="gone.example.",
+            serial=None,
+            changed=timezone.now() - timedelta(days=30),
+        )
+        zones = [
+            {"name": "test.example.", "edited_serial": 12347},
+            {"name": "other.example.", "edited_serial": 3},
+            {"name": "catalog.internal.", "edited_serial": 7},
+        ]
+        with self.assertRequests(
+            {
+                "method": "GET",
+                "uri": self.get_full_pdns_url(r"/zones", ns="MASTER"),
+                "status": 200,
+                "body": json.dumps(zones),
+            }
+        ):
+            serials.reconcile()
+        self.assertEqual(
+            dict(ZoneSerial.objects.values_list("name", "serial")),
+            {"test.example.": 12347, "example.org.": None, "other.example.": 3},
+        )
 
-            # Do not expect pdns request in next iteration (result will be cached)
-            pdns_requests = []
+    def test_reconcile_grace_period(self):
+        with mock.patch.object(serials.pdns, "get_serials", return_value={}):
+            serials.reconcile()
+        self.assertEqual(
+            dict(ZoneSerial.objects.values_list("name", "serial")),
+            {"test.example.": 12345, "example.org.": 54321},
+        )
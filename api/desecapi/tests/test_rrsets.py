@@ -1,16 +1,35 @@
 from contextlib import nullcontext
+from datetime import timedelta
+from io import StringIO
 from ipaddress import IPv4Network
+import json
 import re
 from itertools import product
 from math import ceil, floor
+import random
+import string
+from unittest import mock
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
 from rest_framework import status
 
+from desecapi import metrics, serials
+from desecapi.dns import FAST_CANONICALIZERS
 from desecapi.models import BlockedSubnet, Domain, RR, RRset
-from desecapi.models.records import RR_SET_TYPES_AUTOMATIC, RR_SET_TYPES_UNSUPPORTED
+from desecapi.models.records import (
+    RR_SET_TYPES_AUTOMATIC,
+    RR_SET_TYPES_MANAGEABLE,
+    RR_SET_TYPES_UNSUPPORTED,
+    _canonical_format_cache,
+)
+from desecapi.serializers import RRsetSerializer
 from desecapi.tests.base import DesecTestCase, AuthenticatedRRSetBaseTestCase
 
 
@@ -52,6 +71,84 @@ class AuthenticatedRRSetTestCase(AuthenticatedRRSetBaseTestCase):
             self.assertStatus(response, status.HTTP_200_OK)
             self.assertEqual(len(response.data), 1, response.data)
 
+    def test_retrieve_my_rr_sets_constant_queries(self):
+        domain = self.my_empty_domain
+
+        def get_rr_sets(n):
+            RRset.objects.bulk_write(
+                created=[
+                    (
+                        RRset(domain=domain, subname=f"{i}.{n}", type="A", ttl=3600),
+                        ["1.2.3.4", "5.6.7.8"],
+                    )
+                    for i in range(n)
+                ]
+            )
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get_rr_sets(domain.name, query="?cursor=")
+            self.assertStatus(response, status.HTTP_200_OK)
+            self.assertEqual(
+                len(response.data),
+                min(domain.rrset_set.count(), settings.REST_FRAMEWORK["PAGE_SIZE"]),
+            )
+            for rrset in response.data:
+                self.assertEqual(rrset["domain"], domain.name)
+                self.assertEqual(rrset["name"], f"{rrset['subname']}.{domain.name}.")
+                self.assertEqual(sorted(rrset["records"]), ["1.2.3.4", "5.6.7.8"])
+            return len(context.captured_queries)
+
+        self.assertEqual(get_rr_sets(2), get_rr_sets(40))
+
+    def test_retrieve_my_rr_sets_conditional(self):
+        domain = self.my_rr_set_domain
+
+        def get_rr_sets(query="", **headers):
+            url = self.reverse("v1:rrsets", name=domain.name) + "?cursor=" + query
+            return self.client.get(url, **headers)
+
+        hour_ago = timezone.now() - timedelta(hours=1)
+        Domain.objects.filter(pk=domain.pk).update(published=hour_ago)
+        domain.rrset_set.update(touched=hour_ago)
+
+        response = get_rr_sets()
+        self.assertStatus(response, status.HTTP_200_OK)
+        etag = response["ETag"]
+        last_modified = response["Last-Modified"]
+        self.assertEqual(last_modified, http_date(hour_ago.timestamp()))
+
+        for headers in [
+            dict(HTTP_IF_NONE_MATCH=etag),
+            dict(HTTP_IF_MODIFIED_SINCE=last_modified),
+        ]:
+            with mock.patch.object(RRsetSerializer, "to_representation") as m:
+                response = get_rr_sets(**headers)
+            self.assertStatus(response, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response["ETag"], etag)
+            m.assert_not_called()
+
+        # Filtered listings have their own validators
+        response = get_rr_sets("&type=A", HTTP_IF_NONE_MATCH=etag)
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+        # Deletion, and (once published) the time of the deletion
+        domain.rrset_set.filter(type="A").delete()
+        response = get_rr_sets(HTTP_IF_NONE_MATCH=etag)
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        Domain.objects.filter(pk=domain.pk).update(
+            published=hour_ago + timedelta(minutes=1)
+        )
+        response = get_rr_sets(HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertStatus(response, status.HTTP_200_OK)
+        etag = response["ETag"]
+
+        # Modification
+        domain.rrset_set.filter(type="TXT").update(touched=timezone.now())
+        response = get_rr_sets(HTTP_IF_NONE_MATCH=etag)
+        self.assertStatus(response, status.HTTP_200_OK)
+        self.assertFalse(response.has_header("Last-Modified"))  # too recent
+
     def test_retrieve_my_rr_sets_pagination(self):
         def convert_links(links):
             mapping = {}
@@ -1483,6 +1580,113 @@ class AuthenticatedRRSetTestCase(AuthenticatedRRSetBaseTestCase):
                 [dict(subname="", records=settings.DEFAULT_NS, type="NS")],
             )
 
+    def _request_pdns_zone_retrieve_rr_sets(self, domain, rr_sets):
+        return {
+            **self.request_pdns_zone_retrieve(name=domain.name),
+            "body": json.dumps(
+                {
+                    "rrsets": [
+                        {
+                            "name": RRset.construct_name(subname, domain.name),
+                            "type": type_,
+                            "ttl": ttl,
+                            "records": [{"content": content} for content in records],
+                        }
+                        for subname, type_, records, ttl in rr_sets
+                    ]
+                }
+            ),
+        }
+
+    def _pdns_rr_sets_with_drift(self, domain):
+        rr_sets = [
+            (
+                rr_set.subname,
+                rr_set.type,
+                rr_set.records.values_list("content", flat=True),
+                rr_set.ttl,
+            )
+            for rr_set in domain.rrset_set.exclude(subname="test", type="A")
+        ]
+        subname, type_, records, ttl = rr_sets.pop()
+        rr_sets.append((subname, type_, records, ttl + 1))
+        rr_sets.append(("stale", "A", ["4.3.2.1"], 3600))
+        rr_sets.append(
+            ("", "SOA", ["get.desec.io. get.desec.io. 1 86400 3600 2419200 3600"], 300)
+        )
+        return rr_sets, (subname, type_, list(records), ttl)
+
+    def test_sync_to_pdns_in_sync(self):
+        domain = self.my_rr_set_domain
+        rr_sets = [
+            (
+                rr_set.subname,
+                rr_set.type,
+                rr_set.records.values_list("content", flat=True),
+                rr_set.ttl,
+            )
+            for rr_set in domain.rrset_set.all()
+        ]
+        # RRsets without records do not exist on pdns
+        domain.rrset_set.create(subname="empty", type="A", ttl=3600)
+        out = StringIO()
+        with self.assertRequests(
+            self._request_pdns_zone_retrieve_rr_sets(domain, rr_sets)
+        ):
+            call_command("sync-to-pdns", domain.name, stdout=out)
+        self.assertEqual(out.getvalue(), f"{domain.name} ... in sync\n")
+
+    def test_sync_to_pdns(self):
+        domain = self.my_rr_set_domain
+        rr_sets, (subname, type_, records, ttl) = self._pdns_rr_sets_with_drift(domain)
+        out = StringIO()
+        with self.assertRequests(
+            self._request_pdns_zone_retrieve_rr_sets(domain, rr_sets),
+            self.request_pdns_zone_update_assert_body(
+                domain.name,
+                {
+                    ("A", "test", 3620): ["2.2.3.4"],
+                    (type_, subname, ttl): records,
+                    ("A", "stale", 1): [],
+                },
+            ),
+            self.requests_pdns_zone_publish(domain.name, serial=7),
+        ):
+            call_command("sync-to-pdns", domain.name, workers=2, stdout=out)
+        self.assertIn("synced: 1 added, 1 modified, 1 deleted RRset(s)", out.getvalue())
+        self.assertEqual(serials.get()[f"{domain.name}."], 7)
+
+    def test_sync_to_pdns_dry_run(self):
+        domain = self.my_rr_set_domain
+        rr_sets, (subname, type_, _, _) = self._pdns_rr_sets_with_drift(domain)
+        out = StringIO()
+        with self.assertRequests(
+            self._request_pdns_zone_retrieve_rr_sets(domain, rr_sets),
+            {
+                **self.request_pdns_zone_retrieve(name=self.my_domain.name),
+                "status": 404,
+            },
+            expect_order=False,
+        ):
+            call_command(
+                "sync-to-pdns",
+                domain.name,
+                self.my_domain.name,
+                dry_run=True,
+                stdout=out,
+            )
+        self.assertIn(
+            f"{domain.name} ... would have 1 added, 1 modified, 1 deleted RRset(s)\n"
+            f"  + test A\n"
+            f"  ~ {subname or '@'} {type_}\n"
+            f"  - stale A\n",
+            out.getvalue(),
+        )
+        self.assertIn(
+            f"{self.my_domain.name} ... missing on pdns ... would have 1 added, 0 modified, 0 deleted RRset(s)\n",
+            out.getvalue(),
+        )
+
     def test_extra_dnskeys(self):
         name = "ietf.org"
         dnskeys = [
@@ -1632,3 +1836,189 @@ class AuthenticatedRRSetLPSTestCase(AuthenticatedRRSetBaseTestCase):
         )
         self.assertStatus(response, status.HTTP_400_BAD_REQUEST)
         self.assertIn("IP address 3.2.2.5 not allowed.", str(response.data))
+
+
+class CanonicalPresentationFormatCacheTestCase(DesecTestCase):
+    def setUp(self):
+        super().setUp()
+        _canonical_format_cache.clear()
+        self.compute = mock.patch.object(
+            RR,
+            "_canonical_presentation_format",
+            wraps=RR._canonical_presentation_format,
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    @staticmethod
+    def _count(name, *labels):
+        metric = metrics.get(name)
+        return (metric.labels(*labels) if labels else metric)._value.get()
+
+    def test_memoized(self):
+        hits = self._count("desecapi_rr_canonical_cache_hit", "local")
+        misses = self._count("desecapi_rr_canonical_cache_miss")
+        for _ in range(3):
+            self.assertEqual(RR.canonical_presentation_format("1:0::1", "AAAA"), "1::1")
+        self.assertEqual(RR.canonical_presentation_format("1::1", "AAAA"), "1::1")
+        self.assertEqual(self.compute.call_count, 2)
+        self.assertEqual(
+            self._count("desecapi_rr_canonical_cache_hit", "local"), hits + 2
+        )
+        self.assertEqual(self._count("desecapi_rr_canonical_cache_miss"), misses + 2)
+
+    def test_memoized_errors(self):
+        exceptions = []
+        for _ in range(2):
+            with self.assertRaises(ValueError) as cm:
+                RR.canonical_presentation_format("127.0.0.999", "A")
+            exceptions.append(cm.exception)
+        self.compute.assert_called_once()
+        self.assertIsNot(exceptions[0], exceptions[1])
+        self.assertEqual(str(exceptions[0]), str(exceptions[1]))
+
+        for _ in range(2):
+            with self.assertRaises(ValidationError) as cm:
+                RR.canonical_presentation_format(f'"{"x" * 250}" ' * 300, "TXT")
+            self.assertIn("no more than 64000 byte", str(cm.exception))
+        self.assertEqual(self.compute.call_count, 3)  # too long for the cache
+
+    @override_settings(RR_CANONICAL_CACHE_SIZE=2)
+    def test_lru(self):
+        for content in [
+            "1.1.1.1",
+            "2.2.2.2",
+            "1.1.1.1",
+            "3.3.3.3",
+            "1.1.1.1",
+            "2.2.2.2",
+        ]:
+            RR.canonical_presentation_format(content, "A")
+        self.assertEqual(
+            [call.args[0] for call in self.compute.call_args_list],
+            ["1.1.1.1", "2.2.2.2", "3.3.3.3", "2.2.2.2"],
+        )
+
+    def test_keyed_by_type(self):
+        self.assertEqual(
+            RR.canonical_presentation_format("ns1.example.", "NS"), "ns1.example."
+        )
+        with self.assertRaises(ValueError):
+            RR.canonical_presentation_format("ns1.example.", "A")
+
+    @override_settings(RR_CANONICAL_CACHE_TIMEOUT=60)
+    def test_shared(self):
+        hits = self._count("desecapi_rr_canonical_cache_hit", "shared")
+        RR.canonical_presentation_format("1:0::1", "AAAA")
+        with self.assertRaises(ValueError):
+            RR.canonical_presentation_format("1::0::1", "AAAA")
+        _canonical_format_cache.clear()  # as if in another process
+        self.assertEqual(RR.canonical_presentation_format("1:0::1", "AAAA"), "1::1")
+        with self.assertRaises(ValueError):
+            RR.canonical_presentation_format("1::0::1", "AAAA")
+        self.assertEqual(self.compute.call_count, 2)
+        self.assertEqual(
+            self._count("desecapi_rr_canonical_cache_hit", "shared"), hits + 2
+        )
+
+
+class CanonicalPresentationFormatFastPathTestCase(DesecTestCase):
+    """
+    Checks that the fast paths for common types give the same results (or errors) as the generic dnspython path, using
+    randomly generated contents (with a fixed seed, so that failures are reproducible).
+    """
+
+    ITERATIONS = 5000
+
+    @staticmethod
+    def _canonicalize(func, content, type_):
+        try:
+            return func(content, type_)
+        except Exception as e:
+            return type(e), str(e)
+
+    @staticmethod
+    def _random_name(rng):
+        alphabet = rng.choice(
+            [
+                string.ascii_lowercase,
+                string.ascii_letters + string.digits + "-",
+                string.ascii_letters + "_*-",
+                string.printable,
+            ]
+        )
+        labels = [
+            "".join(rng.choice(alphabet) for _ in range(rng.choice([1, 2, 8, 63, 64])))
+            for _ in range(rng.randint(1, 5))
+        ]
+        return ".".join(labels) + rng.choice([".", ".", ".", ""])
+
+    @classmethod
+    def _random_content(cls, rng, type_):
+        if type_ == "A":
+            octets = [0, 1, 9, 10, 99, 100, 199, 200, 249, 250, 255, 256, "01", "", "a"]
+            return ".".join(
+                str(rng.choice(octets + [rng.randint(0, 255)]))
+                for _ in range(rng.choice([3, 4, 4, 4, 5]))
+            )
+        if type_ == "AAAA":
+            groups = [
+                rng.choice(["0", "00000", "g", format(rng.randint(0, 0xFFFF), "x")])
+                for _ in range(rng.choice([7, 8, 8, 9]))
+            ]
+            if rng.random() < 0.5:
+                i = rng.randint(0, len(groups))
+                j = rng.randint(i, len(groups))
+                return ":".join(groups[:i]) + "::" + ":".join(groups[j:])
+            return ":".join(groups)
+        if type_ == "MX":
+            preference = rng.choice(["0", "10", "010", "65535", "65536", "x", ""])
+            return (
+                preference
+                + rng.choice([" ", "  ", "\t"])
+                + rng.choice([cls._random_name(rng), "."])
+            )
+        if type_ == "TXT":
+            alphabet = string.printable[:95] + '\\\\"\t\u00e4'
+            strings = [
+                "".join(
+                    rng.choice(alphabet)
+                    for _ in range(rng.choice([0, 5, 255, 256, 600]))
+                )
+                for _ in range(rng.randint(1, 3))
+            ]
+            if rng.random() < 0.5:
+                strings = [s.replace("\\", "").replace('"', "") for s in strings]
+            quote = '"' if rng.random() < 0.9 else ""
+            return rng.choice([" ", "  ", ""]).join(
+                f"{quote}{s}{quote}" for s in strings
+            )
+        return cls._random_name(rng)  # CNAME, NS
+
+    def test_fast_path_used(self):
+        for type_, content in [
+            ("A", "1.2.3.4"),
+            ("AAAA", "2001:db8::1"),
+            ("CNAME", "_foo.example.com."),
+            ("MX", "10 mx.example.com."),
+            ("NS", "ns1.example.com."),
+            ("TXT", '"v=spf1 -all"'),
+        ]:
+            self.assertIsNotNone(FAST_CANONICALIZERS[type_](content))
+
+    def test_equivalence(self):
+        rng = random.Random(4711)
+        fast_types = sorted(FAST_CANONICALIZERS)
+        other_types = sorted(RR_SET_TYPES_MANAGEABLE)
+        for _ in range(self.ITERATIONS):
+            content = self._random_content(rng, rng.choice(fast_types))
+            # Also try contents with types other than the one they were generated for
+            for type_ in {rng.choice(fast_types), rng.choice(other_types)}:
+                self.assertEqual(
+                    self._canonicalize(
+                        RR._canonical_presentation_format, content, type_
+                    ),
+                    self._canonicalize(
+                        RR._canonical_presentation_format_generic, content, type_
+                    ),
+                    f"{type_} {content!r}",
+                )
@@ -1,9 +1,16 @@
 from contextlib import nullcontext
 import copy
+from unittest import mock
 
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 
+from desecapi.models import RRset
+from desecapi.pdns_change_tracker import PDNSChangeTracker
+from desecapi.permissions import TokenHasRRsetPermission
+from desecapi.serializers import RRsetSerializer
 from desecapi.tests.base import AuthenticatedRRSetBaseTestCase
 
 
@@ -811,3 +818,160 @@ class AuthenticatedRRSetBulkTestCase(AuthenticatedRRSetBaseTestCase):
 
         qs.create(domain=domain, subname="www", type="A", perm_write=False)
         assertRequests(allowed=False)
+
+    def test_bulk_write_constant_queries(self):
+        domain = self.my_empty_domain
+
+        def bulk_write(n):
+            subnames = [f"{i}.{n}" for i in range(n)]
+            rrsets = [
+                RRset(domain=domain, subname=subname, type="A", ttl=3600)
+                for subname in subnames
+            ]
+            RRset.objects.bulk_write(created=[(rrset, ["1.2.3.4"]) for rrset in rrsets])
+
+            tracker = PDNSChangeTracker()
+            with self.assertRequests(
+                self.requests_desec_rr_sets_update(domain.name)
+            ), tracker:
+                with CaptureQueriesContext(connection) as context:
+                    RRset.objects.bulk_write(
+                        created=[
+                            (
+                                RRset(
+                                    domain=domain,
+                                    subname=f"new.{n}",
+                                    type="A",
+                                    ttl=3600,
+                                ),
+                                ["4.3.2.1"],
+                            )
+                        ],
+                        updated=[
+                            (rrset, None, ["1.2.3.4", "5.6.7.8"])
+                            for rrset in rrsets[0::4]
+                        ]
+                        + [(rrset, 60, None) for rrset in rrsets[1::4]]
+                        + [
+                            (rrset, 3600, ["1.2.3.4"]) for rrset in rrsets[2::4]
+                        ],  # no-op
+                        deleted=rrsets[3::4],
+                    )
+                self.assertEqual(
+                    tracker._rr_set_additions[domain.name], {("A", f"new.{n}")}
+                )
+                self.assertEqual(
+                    tracker._rr_set_modifications[domain.name],
+                    {("A", subname) for subname in subnames[0::4] + subnames[1::4]},
+                )
+                self.assertEqual(
+                    tracker._rr_set_deletions[domain.name],
+                    {("A", subname) for subname in subnames[3::4]},
+                )
+
+            self.assertEqual(
+                {
+                    (
+                        rrset.subname,
+                        rrset.ttl,
+                        frozenset(rrset.records.values_list("content", flat=True)),
+                    )
+                    for rrset in domain.rrset_set.filter(subname__endswith=f".{n}")
+                },
+                {
+                    (subname, 3600, frozenset({"1.2.3.4", "5.6.7.8"}))
+                    for subname in subnames[0::4]
+                }
+                | {(subname, 60, frozenset({"1.2.3.4"})) for subname in subnames[1::4]}
+                | {
+                    (subname, 3600, frozenset({"1.2.3.4"}))
+                    for subname in subnames[2::4]
+                }
+                | {(f"new.{n}", 3600, frozenset({"4.3.2.1"}))},
+            )
+            return len(context.captured_queries)
+
+        self.assertEqual(bulk_write(4), bulk_write(40))
+
+    def test_bulk_validation_constant_queries(self):
+        domain = self.my_empty_domain
+        request = mock.Mock(method="PATCH", auth=self.token)
+
+        def validate(n):
+            subnames = [f"{i}.{n}" for i in range(n)]
+            RRset.objects.bulk_write(
+                created=[
+                    (
+                        RRset(domain=domain, subname=subname, type="A", ttl=3600),
+                        ["1.2.3.4"],
+                    )
+                    for subname in subnames
+                ]
+            )
+            data = [
+                {"subname": subname, "type": "A", "ttl": 3600, "records": ["4.3.2.1"]}
+                for subname in subnames
+            ] + [
+                {"subname": subname, "type": "TXT", "ttl": 3600, "records": ['"x"']}
+                for subname in subnames
+            ]
+            serializer = RRsetSerializer(
+                instance=domain.rrset_set.filter(subname__in=subnames[::2]),
+                data=data,
+                many=True,
+                partial=True,
+                context={"domain": domain, "request": request},
+            )
+            # Permissions are checked separately for each RRset
+            with mock.patch.object(
+                TokenHasRRsetPermission, "has_object_permission", return_value=True
+            ), CaptureQueriesContext(connection) as context:
+                self.assertFalse(serializer.is_valid())
+
+            # Known RRsets (passed as instance) are valid, others collide with the database
+            errors = serializer.errors[:n]
+            self.assertEqual(errors[0::2], [{}] * len(errors[0::2]))
+            for error in errors[1::2]:
+                self.assertEqual(error["non_field_errors"][0].code, "unique")
+            self.assertEqual(serializer.errors[n:], [{}] * n)
+            return len(context.captured_queries)
+
+        self.assertEqual(validate(4), validate(40))
+
+    def test_bulk_validation_conflicts(self):
+        """
+        Checks conflict detection in the list serializer (with the validation of individual RRsets stubbed out). For
+        its scaling with payload size, see benchmarks/rrsets_bulk.py.
+        """
+        types = ["A", "AAAA", "CNAME", "MX", "NS", "TXT", "CAA", "SRV"]
+        n = 3 * len(types)
+        data = [
+            {
+                "subname": str(i // len(types)),
+                "type": types[i % len(types)],
+                "ttl": 3600,
+                "records": [] if types[i % len(types)] == "SRV" else ["x"],
+            }
+            for i in range(n)
+        ]
+        serializer = RRsetSerializer(
+            instance=self.my_rr_set_domain.rrset_set.all(),
+            data=data,
+            many=True,
+            partial=True,
+            context={"domain": self.my_rr_set_domain},
+        )
+        with mock.patch.object(
+            RRsetSerializer, "run_validation", side_effect=lambda data: data
+        ):
+            self.assertFalse(serializer.is_valid())
+
+        # Each RRset with records (i.e. except SRV) conflicts with CNAME or non-CNAME RRsets at the same subname
+        self.assertEqual(
+            sum(bool(error) for error in serializer.errors), n - n // len(types)
+        )
+        self.assertEqual(
+            serializer.errors[1]["non_field_errors"][0],
+            "RRset with conflicting type present: 2 (CNAME)."
+            " (No other RRsets are allowed alongside CNAME.)",
+        )
@@ -1,9 +1,11 @@
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.utils import IntegrityError
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from desecapi import models
+from desecapi.models.tokens import TokenPolicyMatcher
 from desecapi.tests.base import DomainOwnerTestCase
 
 
@@ -57,9 +59,12 @@ class TokenDomainPolicyTestCase(DomainOwnerTestCase):
 
     def test_get_policy(self):
         def get_policy(domain, subname, type):
-            return self.token.get_policy(
-                models.RRset(domain=domain, subname=subname, type=type)
-            )
+            rrset = models.RRset(domain=domain, subname=subname, type=type)
+            policy = self.token.get_policy(rrset)
+            # The in-memory matcher agrees with the database query
+            matcher = TokenPolicyMatcher(self.token.tokendomainpolicy_set.all())
+            self.assertEqual(matcher.get_policy(rrset), policy)
+            return policy
 
         def assertPolicy(policy, domain, subname, type):
             self.assertEqual(policy.domain, domain)
@@ -639,3 +644,33 @@ class TokenDomainPolicyTestCase(DomainOwnerTestCase):
 
         self.token.user.delete()
         self.assertFalse(models.TokenDomainPolicy.objects.filter(pk=policy_pk).exists())
+
+    def test_bulk_rrset_permission_queries(self):
+        qs = self.token.tokendomainpolicy_set
+        qs.create(domain=None, subname=None, type=None, perm_write=True)
+        qs.create(domain=self.my_domains[0], subname="forbidden", type=None)
+        url = self.reverse("v1:rrsets", name=self.my_domains[0].name)
+        kwargs = dict(HTTP_AUTHORIZATION=f"Token {self.token.plain}")
+
+        def policy_queries(subnames):
+            # Empty unknown RRsets are a no-op, but still go through validation
+            data = [
+                {"subname": subname, "type": "A", "ttl": 3600, "records": []}
+                for subname in subnames
+            ]
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.patch(url, data, format="json", **kwargs)
+            return response, [
+                query
+                for query in context.captured_queries
+                if "desecapi_tokendomainpolicy" in query["sql"]
+            ]
+
+        for n in [1, 20]:
+            response, queries = policy_queries([f"{i}" for i in range(n)])
+            self.assertStatus(response, status.HTTP_200_OK)
+            self.assertEqual(len(queries), 1)
+
+        response, queries = policy_queries(["a", "b", "forbidden"])
+        self.assertStatus(response, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(len(queries), 1)
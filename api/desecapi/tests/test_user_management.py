@@ -1341,6 +1341,43 @@ class RenewTestCase(UserManagementTestCase, DomainOwnerTestCase):
                     Domain.RenewalState.NOTIFIED,
                 )
 
+    def test_renew_domains_warned_deleted_together(self):
+        domains = self.my_domains[:2]
+        for domain in domains:
+            domain.published = timezone.now() - timedelta(days=183 + 28)
+            domain.renewal_state = Domain.RenewalState.WARNED
+            domain.renewal_changed = timezone.now() - timedelta(days=7)
+            domain.save()
+            domain.rrset_set.update(touched=domain.published)
+
+        # The catalog zone and PCH are updated once for all domains
+        requests = [
+            self.request_pdns_zone_delete(name=domain.name, ns=ns)
+            for domain in domains
+            for ns in ["LORD", "MASTER"]
+        ] + [
+            self.request_pdns_update_catalog(),
+            self.request_pch_zone_delete(name=[domain.name for domain in domains]),
+        ]
+        for delegate_at in {
+            self._find_auto_delegation_zone(domain.name)
+            for domain in domains
+            if domain.is_locally_registrable
+        }:
+            requests += [
+                self.request_pdns_zone_update(name=delegate_at),
+                self.requests_pdns_zone_publish(name=delegate_at),
+            ]
+        with self.assertRequests(requests, expect_order=False):
+            call_command("scavenge-unused")
+        self.assertFalse(
+            Domain.objects.filter(pk__in=[domain.pk for domain in domains]).exists()
+        )
+        # User gets deleted when their last domain is purged
+        self.assertEqual(
+            User.objects.filter(pk=self.owner.pk).exists(), len(self.my_domains) > 2
+        )
+
     def test_renew_domain_inactive_user(self):
         domain = self.my_domains[0]
         for is_active in (False, None):
@@ -61,6 +61,34 @@ class ExclusionConstraintValidator(UniqueTogetherValidator):
             raise ValidationError(message, code="exclusive")
 
 
+class UniqueRRsetValidator(UniqueTogetherValidator):
+    """
+    Validator that ensures uniqueness of RRsets with respect to (subname, type).
+    If the parent serializer is a list serializer (many=True), existing RRsets are looked up in its preloaded
+    `rrset_index` instead of querying the database once per item.
+    """
+
+    def __call__(self, attrs, serializer):
+        index = getattr(serializer.parent, "rrset_index", None)
+        if index is None:
+            return super().__call__(attrs, serializer)
+
+        self.enforce_required_fields(attrs, serializer)
+        instance = serializer.instance
+        subname = attrs.get("subname", getattr(instance, "subname", None))
+        type_ = attrs.get("type", getattr(instance, "type", None))
+
+        # Ignore validation if any field is None, or if the existing RRset is the current instance
+        if None in (subname, type_) or type_ not in index.get(subname, ()):
+            return
+        if instance is not None and (instance.subname, instance.type) == (
+            subname,
+            type_,
+        ):
+            return
+        raise ValidationError(self.message, code="unique")
+
+
 class PermissionValidator:
     """
     Validator that checks write permission for an RRset.
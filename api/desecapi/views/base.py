@@ -1,4 +1,9 @@
+import hashlib
+import time
+
 from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
@@ -15,6 +20,41 @@ class IdempotentDestroyMixin:
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class ConditionalListMixin:
+    """
+    Answers list requests with 304 Not Modified if the client's copy is current (If-None-Match, If-Modified-Since),
+    without serializing anything. Views implement `get_list_state()`, which returns a tuple of values that changes
+    whenever the listing changes, and the time of the latest change (or None).
+    """
+
+    def get_list_state(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        state, last_modified = self.get_list_state()
+        state = repr((state, request.accepted_renderer.format)).encode()
+        etag = f'"{hashlib.sha256(state).hexdigest()[:32]}"'
+        # Last-Modified has a resolution of one second. It is only given once later changes cannot fall into the same
+        # second anymore, so that If-Modified-Since does not hide them.
+        if last_modified is not None and time.time() - last_modified.timestamp() < 1:
+            last_modified = None
+        if last_modified is not None:
+            last_modified = int(last_modified.timestamp())
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            # noinspection PyUnresolvedReferences
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+
 class Root(APIView):
     def get(self, request, *args, **kwargs):
         if self.request.user.is_authenticated:
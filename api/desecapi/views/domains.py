@@ -1,26 +1,31 @@
 from datetime import timezone, datetime
 
 from django.conf import settings
-from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import mixins, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
-from desecapi import permissions
+from desecapi import permissions, serials
 from desecapi.models import Domain
-from desecapi.pdns import get_serials
 from desecapi.pdns_change_tracker import PDNSChangeTracker
-from desecapi.renderers import PlainTextRenderer
+from desecapi.renderers import PlainTextRenderer, SerialListTextRenderer
 from desecapi.serializers import DomainSerializer
 
-from .base import IdempotentDestroyMixin
+from .base import ConditionalListMixin, IdempotentDestroyMixin
 
 
 class DomainViewSet(
     IdempotentDestroyMixin,
+    ConditionalListMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
     mixins.DestroyModelMixin,
@@ -78,6 +83,22 @@ class DomainViewSet(
 
         return qs
 
+    def get_list_state(self):
+        # Domains are created, published, or deleted (changing the count); also, their RRsets are touched. As a
+        # safeguard, administrative changes of the minimum TTL are covered as well.
+        user = self.request.user
+        state = user.domains.aggregate(
+            count=Count("pk"),
+            created=Max("created"),
+            published=Max("published"),
+            last_active=Max("last_active"),
+            minimum_ttl=Sum("minimum_ttl"),
+        )
+        last_modified = max(
+            filter(None, [state["created"], state["last_active"]]), default=None
+        )
+        return (user.pk, *state.values()), last_modified
+
     def get_serializer(self, *args, **kwargs):
         include_keys = self.action in ["create", "retrieve"]
         return super().get_serializer(*args, include_keys=include_keys, **kwargs)
@@ -85,6 +106,7 @@ class DomainViewSet(
     def perform_create(self, serializer):
         with PDNSChangeTracker():
             domain = serializer.save(owner=self.request.user)
+        domain.refresh_from_db(fields=["last_active"])  # maintained by the database
 
         # TODO this line raises if the local public suffix is not in our database!
         PDNSChangeTracker.track(lambda: self.auto_delegate(domain))
@@ -107,19 +129,52 @@ class DomainViewSet(
     def zonefile(self, request, name=None):
         instance = self.get_object()
         prefix = f"; Zonefile for {instance.name} exported from desec.{settings.DESECSTACK_DOMAIN} at {datetime.now(timezone.utc)}\n".encode()
-        return Response(prefix + instance.zonefile, content_type="text/dns")
+        zonefile = instance.iter_zonefile()  # raises before streaming if nslord fails
+
+        def content():
+            yield prefix
+            yield from zonefile
+
+        return StreamingHttpResponse(content(), content_type="text/dns")
 
 
 class SerialListView(APIView):
+    """
+    Lists zone serials. With `?since=<UNIX timestamp>`, only zones that changed since then are listed, including
+    deleted zones (serial: null). Clients can use the Last-Modified header for their next query, and revalidate using
+    the ETag header. With `Accept: text/plain`, the list is given as lines of zone name and serial.
+    """
+
     permission_classes = (permissions.IsVPNClient,)
     throttle_classes = (
         []
-    )  # don't break slaves when they ask too often (our cached responses are cheap)
+    )  # don't break slaves when they ask too often (our responses are cheap)
+    renderer_classes = (JSONRenderer, SerialListTextRenderer)
 
     def get(self, request, *args, **kwargs):
-        key = "desecapi.views.serials"
-        serials = cache.get(key)
-        if serials is None:
-            serials = get_serials()
-            cache.get_or_set(key, serials, timeout=15)
-        return Response(serials)
+        since = request.query_params.get("since")
+        if since is not None:
+            try:
+                since = datetime.fromtimestamp(float(since), timezone.utc)
+            except (ValueError, OverflowError):
+                raise ValidationError({"since": ["Must be a UNIX timestamp."]})
+
+        stamp, changed = serials.version()
+        catalog_serial = serials.get_catalog_serial()
+        etag = (
+            f'"{stamp}-{catalog_serial}'
+            f'-{since.timestamp() if since else ""}-{request.accepted_renderer.format}"'
+        )
+        # Last-Modified has a resolution of one second, so we only use the ETag for conditional requests
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            try:
+                data = serials.get(since)
+            except ValueError as e:
+                raise ValidationError({"since": [str(e)]})
+            data[f"{settings.CATALOG_ZONE}."] = catalog_serial
+            response = Response(data)
+        response["ETag"] = etag
+        if changed:
+            response["Last-Modified"] = http_date(changed.timestamp())
+        return response
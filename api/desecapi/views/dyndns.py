@@ -119,12 +119,13 @@ class DynDNS12UpdateView(generics.GenericAPIView):
     @cached_property
     def domain(self):
         try:
-            return Domain.objects.filter_qname(
-                self.qname, owner=self.request.user
-            ).order_by("-name_length")[0]
-        except (IndexError, ValueError, Domain.DoesNotExist):
+            domain = self.request.user.get_domain_by_qname(self.qname)
+        except ValueError:
+            domain = None
+        if domain is None:
             metrics.get("desecapi_dynDNS12_domain_not_found").inc()
             raise NotFound("nohost")
+        return domain
 
     @property
     def subname(self):
@@ -1,3 +1,4 @@
+from django.db.models import Count, Max
 from django.http import Http404
 from rest_framework import generics
 from rest_framework.exceptions import PermissionDenied
@@ -7,7 +8,7 @@ from desecapi import models, permissions
 from desecapi.pdns_change_tracker import PDNSChangeTracker
 from desecapi.serializers import RRsetSerializer
 
-from .base import IdempotentDestroyMixin
+from .base import ConditionalListMixin, IdempotentDestroyMixin
 
 
 class EmptyPayloadMixin:
@@ -64,8 +65,15 @@ class RRsetView(DomainViewMixin):
         # noinspection PyUnresolvedReferences
         return {**super().get_serializer_context(), "domain": self.domain}
 
+    def change_tracker(self):
+        # Clients that need to read their writes from DNS can ask to wait for propagation to nslord (RFC 7240)
+        # noinspection PyUnresolvedReferences
+        preferences = self.request.headers.get("Prefer", "").split(",")
+        wait = any(p.split("=")[0].strip().lower() == "wait" for p in preferences)
+        return PDNSChangeTracker(synchronous=True if wait else None)
+
     def perform_update(self, serializer):
-        with PDNSChangeTracker():
+        with self.change_tracker():
             # noinspection PyUnresolvedReferences
             super().perform_update(serializer)
 
@@ -99,12 +107,16 @@ class RRsetDetail(
         return response
 
     def perform_destroy(self, instance):
-        with PDNSChangeTracker():
+        with self.change_tracker():
             super().perform_destroy(instance)
 
 
 class RRsetList(
-    RRsetView, EmptyPayloadMixin, generics.ListCreateAPIView, generics.UpdateAPIView
+    RRsetView,
+    EmptyPayloadMixin,
+    ConditionalListMixin,
+    generics.ListCreateAPIView,
+    generics.UpdateAPIView,
 ):
     def get_queryset(self):
         rrsets = super().get_queryset()
@@ -124,6 +136,10 @@ class RRsetList(
 
                 rrsets = rrsets.filter(**{filter_field: value})
 
+        # For listing, fetch records of all RRsets on the page at once. (Their domain is known from the manager.)
+        if self.request.method in SAFE_METHODS:
+            rrsets = rrsets.prefetch_related("records")
+
         # Without .all(), cache is sometimes inconsistent with actual state in bulk tests. (Why?)
         return rrsets.all()
 
@@ -134,6 +150,18 @@ class RRsetList(
         # The user can read all their RRsets anyway.
         return self.filter_queryset(self.get_queryset())
 
+    def get_list_state(self):
+        # RRsets are touched when written, and deletions change the count. Deletions are also reflected in the domain's
+        # publication time (once published), which thus enters the time of the latest change.
+        domain = self.domain
+        state = self.filter_queryset(self.get_queryset()).aggregate(
+            count=Count("pk"), touched=Max("touched")
+        )
+        last_modified = max(
+            filter(None, [state["touched"], domain.published]), default=None
+        )
+        return (domain.pk, domain.published, *state.values()), last_modified
+
     def get_serializer(self, *args, **kwargs):
         kwargs = kwargs.copy()
 
@@ -146,5 +174,5 @@ class RRsetList(
         return super().get_serializer(*args, **kwargs)
 
     def perform_create(self, serializer):
-        with PDNSChangeTracker():
+        with self.change_tracker():
             super().perform_create(serializer)
@@ -17,6 +17,9 @@ chmod 1777 /var/local/django_metrics
 # migrate database
 python manage.py migrate || exit 1
 
+# Refresh Public Suffix List snapshot (the one from the image is used if this fails)
+python manage.py update-psl || echo "Public Suffix List update failed"
+
 # Prepare catalog zone
 python manage.py align-catalog-zone
 